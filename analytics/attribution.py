@@ -0,0 +1,189 @@
+"""Lead and booking attribution to campaigns, sources and landing pages.
+
+The contact, subscribe and booking forms carry the tracker's visitor and
+session ids into ``leads`` and ``consultations``. When one of those rows is
+created the app queues a ``conversion`` event; :func:`write_events` looks up
+the session it came from (or, failing that, the visitor's latest session)
+and adds one lead or booking to the matching ``analytics_attribution`` row.
+Sessions are counted into the same rows by :mod:`analytics.storage`, so the
+campaign report is a ``SUM`` over one small row per day and combination,
+never a join across the events table.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from .storage import (
+    ATTRIBUTION_DIMENSIONS,
+    ATTRIBUTION_KEY,
+    SECONDS_PER_DAY,
+    DimensionInterner,
+    epoch_seconds,
+    rebuild_attribution_sessions,
+)
+
+CONVERSION_KINDS: tuple[str, ...] = ("lead", "booking")
+
+GROUPINGS: dict[str, str] = {
+    "campaign": "Campaign",
+    "source": "Source",
+    "landing": "Landing page",
+}
+
+_SESSION_COLUMNS = ", ".join(
+    [*(f"COALESCE({dimension}_id, 0)" for dimension in ATTRIBUTION_DIMENSIONS), "COALESCE(landing_slug_id, 0)"]
+)
+_UNATTRIBUTED = (0,) * (len(ATTRIBUTION_KEY) - 1)
+
+_UPSERT_SQL = (
+    f"INSERT INTO analytics_attribution ({', '.join(ATTRIBUTION_KEY)}, leads, bookings) "
+    f"VALUES ({', '.join('?' for _ in ATTRIBUTION_KEY)}, ?, ?) "
+    f"ON CONFLICT ({', '.join(ATTRIBUTION_KEY)}) "
+    "DO UPDATE SET leads = leads + excluded.leads, bookings = bookings + excluded.bookings"
+)
+
+
+def _session_key(
+    conn: sqlite3.Connection,
+    session_id: str | None,
+    visitor_id: str | None,
+    created_ts: int,
+) -> tuple[int, ...]:
+    if session_id:
+        row = conn.execute(
+            f"SELECT {_SESSION_COLUMNS} FROM analytics_sessions WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is not None:
+            return tuple(row)
+    if visitor_id:
+        row = conn.execute(
+            f"""
+            SELECT {_SESSION_COLUMNS} FROM analytics_sessions
+            WHERE visitor_id = ? AND started_ts <= ?
+            ORDER BY started_ts DESC
+            LIMIT 1
+            """,
+            (visitor_id, created_ts),
+        ).fetchone()
+        if row is not None:
+            return tuple(row)
+    return _UNATTRIBUTED
+
+
+def _count(
+    conn: sqlite3.Connection,
+    conversions: Iterable[tuple[str, str | None, str | None, int]],
+) -> int:
+    counts: dict[tuple[int, ...], list[int]] = {}
+    for kind, session_id, visitor_id, created_ts in conversions:
+        if kind not in CONVERSION_KINDS:
+            continue
+        key = (created_ts // SECONDS_PER_DAY, *_session_key(conn, session_id, visitor_id, created_ts))
+        counts.setdefault(key, [0, 0])[CONVERSION_KINDS.index(kind)] += 1
+    conn.executemany(_UPSERT_SQL, [(*key, leads, bookings) for key, (leads, bookings) in counts.items()])
+    return sum(leads + bookings for leads, bookings in counts.values())
+
+
+def write_events(
+    conn: sqlite3.Connection,
+    events: Iterable[Mapping[str, Any]],
+    interner: DimensionInterner,
+) -> int:
+    """Count ``conversion`` events into ``analytics_attribution`` without committing."""
+
+    conversions = []
+    for event in events:
+        created_ts = event.get("created_ts")
+        if created_ts is None:
+            try:
+                created_ts = epoch_seconds(str(event.get("created_at")))
+            except ValueError:
+                continue
+        conversions.append(
+            (str(event.get("kind")), event.get("session_id"), event.get("visitor_id"), int(created_ts))
+        )
+    return _count(conn, conversions)
+
+
+def rebuild(conn: sqlite3.Connection) -> dict[str, int]:
+    """Recount sessions, leads and bookings; ``conn`` must have the CMS attached as ``cms``."""
+
+    sessions = rebuild_attribution_sessions(conn)
+    rows = conn.execute(
+        """
+        SELECT 'lead', session_id, visitor_id, created_at FROM cms.leads
+        UNION ALL
+        SELECT 'booking', session_id, visitor_id, created_at FROM cms.consultations
+        """
+    ).fetchall()
+    conversions = []
+    for kind, session_id, visitor_id, created_at in rows:
+        try:
+            conversions.append((kind, session_id, visitor_id, epoch_seconds(str(created_at))))
+        except ValueError:
+            continue
+    with conn:
+        conn.execute("UPDATE analytics_attribution SET leads = 0, bookings = 0")
+        counted = _count(conn, conversions)
+        conn.execute("DELETE FROM analytics_attribution WHERE sessions = 0 AND leads = 0 AND bookings = 0")
+    return {"session_rows": sessions, "conversions": counted}
+
+
+def _rate(part: int, whole: int) -> float:
+    return round(part / whole * 100, 1) if whole else 0.0
+
+
+def campaign_report(
+    conn: sqlite3.Connection,
+    start_day: int,
+    end_day: int,
+    *,
+    group_by: str = "campaign",
+    limit: int = 25,
+) -> list[dict[str, Any]]:
+    """Sessions, leads, bookings and conversion rates per group plus an ``All traffic`` row."""
+
+    if group_by not in GROUPINGS:
+        raise ValueError(f"Unknown attribution grouping: {group_by}")
+    if group_by == "campaign":
+        label = "campaign.value"
+    elif group_by == "source":
+        label = "COALESCE(source.value, channel.value)"
+    else:
+        label = "landing.value"
+    rows = conn.execute(
+        f"""
+        SELECT {label} AS label, SUM(a.sessions), SUM(a.leads), SUM(a.bookings)
+        FROM analytics_attribution AS a
+        LEFT JOIN analytics_dimension_values AS campaign ON campaign.id = a.utm_campaign_id
+        LEFT JOIN analytics_dimension_values AS source ON source.id = a.utm_source_id
+        LEFT JOIN analytics_dimension_values AS channel ON channel.id = a.traffic_source_id
+        LEFT JOIN analytics_dimension_values AS landing ON landing.id = a.landing_slug_id
+        WHERE a.day BETWEEN ? AND ?
+        GROUP BY label
+        """,
+        (start_day, end_day),
+    ).fetchall()
+    if not rows:
+        return []
+
+    def entry(value: str | None, sessions: int, leads: int, bookings: int) -> dict[str, Any]:
+        return {
+            "value": value,
+            "label": value or "(none)",
+            "sessions": sessions,
+            "leads": leads,
+            "bookings": bookings,
+            "lead_rate": _rate(leads, sessions),
+            "booking_rate": _rate(bookings, sessions),
+        }
+
+    totals = [sum(row[index] for row in rows) for index in (1, 2, 3)]
+    ranked = sorted(rows, key=lambda row: (row[2] + row[3], row[1]), reverse=True)[:limit]
+    report = [{**entry(None, *totals), "label": "All traffic"}]
+    report.extend(entry(*row) for row in ranked)
+    return report
@@ -0,0 +1,230 @@
+"""In-process write buffer for analytics beacons.
+
+Every page view used to open a connection, insert one row and commit, so each
+beacon paid for an fsync and competed with lead and consultation submissions
+for the SQLite write lock. :class:`EventBuffer` collects parsed events in
+memory and hands them to a writer in batches once either the size or the age
+threshold is reached, and once more when the worker shuts down.
+
+A batch the database cannot take right now (``retryable``, by default
+SQLite's locked/busy/I/O errors, see :func:`transient_error`) is queued
+again whole. Any other failure
+means something in the batch cannot be written, so its events are written
+one at a time and only those that still fail are dropped.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Sequence
+from typing import Any
+
+Event = dict[str, Any]
+BatchWriter = Callable[[Sequence[Event]], Any]
+
+_TRANSIENT_CODES = (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED, sqlite3.SQLITE_IOERR)
+
+
+def transient_error(error: Exception) -> bool:
+    """Whether ``error`` means the database is busy, locked or failed an I/O call.
+
+    Other ``OperationalError``s, such as a missing table or column, will not
+    go away by retrying.
+    """
+
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in _TRANSIENT_CODES
+    message = str(error).lower()
+    return "database is locked" in message or "busy" in message or "disk i/o error" in message
+
+
+class EventBuffer:
+    """Thread-safe queue that flushes events to ``writer`` in batches.
+
+    ``max_size`` and ``max_age`` (seconds) control when a batch is written.
+    ``max_pending`` caps memory use: when the database is unavailable for a
+    long time, new events are dropped (and counted) rather than queued forever.
+    Flushing happens on a daemon thread so beacon requests never wait for
+    SQLite; :meth:`close` performs a final synchronous flush at exit.
+    """
+
+    def __init__(
+        self,
+        writer: BatchWriter,
+        *,
+        max_size: int = 100,
+        max_age: float = 2.0,
+        max_pending: int = 10_000,
+        retryable: Callable[[Exception], bool] = transient_error,
+    ) -> None:
+        self.writer = writer
+        self.retryable = retryable
+        self.max_size = max(1, int(max_size))
+        self.max_age = max(0.05, float(max_age))
+        self.max_pending = max(self.max_size, int(max_pending))
+
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.last_flush_at: float | None = None
+        self.last_error: str | None = None
+
+        self._reset_worker_state()
+        atexit.register(self.close)
+
+    def _reset_worker_state(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._pending: list[Event] = []
+        self._oldest: float | None = None
+        self._thread: threading.Thread | None = None
+
+    def _ensure_worker(self) -> None:
+        if self._pid != os.getpid():
+            # Forked after creation (e.g. gunicorn --preload): the parent's
+            # pending events and thread belong to the parent process.
+            self._reset_worker_state()
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run,
+                        name="analytics-buffer",
+                        daemon=True,
+                    )
+                    self._thread.start()
+
+    def add(self, event: Event) -> bool:
+        """Queue ``event`` for writing. Returns ``False`` when it was dropped."""
+
+        return self.extend([event]) == 1
+
+    def extend(self, events: Sequence[Event]) -> int:
+        """Queue several events together; returns how many were accepted.
+
+        Events from one beacon are appended under a single lock acquisition so
+        they always land in the same batch write.
+        """
+
+        if not events:
+            return 0
+        self._ensure_worker()
+        with self._lock:
+            room = max(self.max_pending - len(self._pending), 0)
+            accepted = list(events[:room])
+            self.dropped += len(events) - len(accepted)
+            if accepted:
+                self._pending.extend(accepted)
+                self.queued += len(accepted)
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+            due = len(self._pending) >= self.max_size
+        if due:
+            self._wake.set()
+        return len(accepted)
+
+    def _due(self) -> bool:
+        with self._lock:
+            if not self._pending:
+                return False
+            if len(self._pending) >= self.max_size:
+                return True
+            return self._oldest is not None and time.monotonic() - self._oldest >= self.max_age
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self.max_age)
+            self._wake.clear()
+            if self._due():
+                self.flush()
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns the number of events stored."""
+
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+                self._oldest = None
+            if not batch:
+                return 0
+
+            try:
+                self.writer(batch)
+            except Exception as error:
+                self.failed_batches += 1
+                self.last_error = str(error)
+                if self.retryable(error):  # keep the events and retry on the next cycle
+                    self._requeue(batch)
+                    return 0
+                return self._write_each(batch)
+
+            self._written(len(batch))
+            return len(batch)
+
+    def _write_each(self, batch: list[Event]) -> int:
+        """Write ``batch`` event by event, dropping the events that fail on their own."""
+
+        stored = 0
+        for index, event in enumerate(batch):
+            try:
+                self.writer([event])
+            except Exception as error:
+                if self.retryable(error):
+                    self.last_error = str(error)
+                    self._requeue(batch[index:])
+                    break
+                self.last_error = f"dropped an event that cannot be written: {error}"
+                with self._lock:
+                    self.dropped += 1
+            else:
+                stored += 1
+        if stored:
+            self._written(stored)
+        return stored
+
+    def _written(self, count: int) -> None:
+        self.flushed += count
+        self.batches += 1
+        self.last_flush_at = time.time()
+
+    def _requeue(self, batch: list[Event]) -> None:
+        with self._lock:
+            room = self.max_pending - len(self._pending)
+            kept = batch[:room] if room > 0 else []
+            self.dropped += len(batch) - len(kept)
+            self._pending = kept + self._pending
+            if self._pending and self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._pid == os.getpid():
+            self.flush()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "pending": pending,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "last_flush_at": self.last_flush_at,
+            "last_error": self.last_error,
+        }
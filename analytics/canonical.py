@@ -0,0 +1,145 @@
+"""Canonical paths, URLs, titles and page slugs for analytics events.
+
+Beacons report whatever the browser had in the address bar, so one page
+arrives as ``/Fees``, ``/fees/``, ``//fees`` and ``/fees?fbclid=...``; every
+variant used to become its own dimension value and its own row in the
+top-pages report. :class:`Canonicalizer` folds them at ingest:
+
+* paths lose their query string and fragment, repeated and trailing slashes,
+  and are lower-cased (every route on the site is lower-case);
+* URLs (and referrers) keep only non-tracking query parameters, sorted, and
+  drop the fragment. UTM fields are read from the raw URL before this runs;
+* page slugs come from the Flask routing table, so ``/courses/<slug>``,
+  ``/blog/<slug>`` and ``/pages/<slug>`` map to the record's slug, ``/`` to
+  ``home`` and static pages to their path, whatever the tracker sent;
+* titles have their whitespace collapsed.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, RequestRedirect
+
+TRACKING_PARAMS: frozenset[str] = frozenset(
+    {
+        "fbclid",
+        "gclid",
+        "gclsrc",
+        "dclid",
+        "gbraid",
+        "wbraid",
+        "msclkid",
+        "yclid",
+        "ttclid",
+        "twclid",
+        "li_fat_id",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "_ga",
+        "_gl",
+        "_hsenc",
+        "_hsmi",
+        "mkt_tok",
+        "srsltid",
+    }
+)
+TRACKING_PREFIXES: tuple[str, ...] = ("utm_", "hsa_", "pk_", "mtm_")
+
+MAX_TITLE_LENGTH = 200
+
+
+def is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonical_path(value: str | None) -> str | None:
+    if not value:
+        return None
+    path = value.split("#", 1)[0].split("?", 1)[0].strip().lower()
+    if not path.startswith("/"):
+        path = f"/{path}"
+    while "//" in path:
+        path = path.replace("//", "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    return path
+
+
+def canonical_url(value: str | None) -> str | None:
+    """Drop tracking parameters and the fragment; lower-case scheme and host."""
+
+    if not value:
+        return None
+    try:
+        parts = urlsplit(value.strip())
+    except ValueError:
+        return value
+    if not parts.scheme or not parts.netloc:
+        return value
+    query = sorted(
+        (name, item)
+        for name, item in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(name)
+    )
+    path = canonical_path(parts.path) or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+def canonical_title(value: Any) -> str | None:
+    if not value:
+        return None
+    title = " ".join(str(value).split())
+    return title[:MAX_TITLE_LENGTH] or None
+
+
+class Canonicalizer:
+    """Maps canonical paths to page slugs through a Werkzeug routing map.
+
+    Route matches are cached per path. ``slug_args`` names the view arguments
+    that identify a record; the first one present becomes the slug. A route
+    without arguments is its own slug (its rule text); paths that match no
+    GET route, or a parameterised route without a slug argument, have none.
+    """
+
+    def __init__(
+        self,
+        url_map: Map,
+        *,
+        home_slug: str = "home",
+        slug_args: tuple[str, ...] = ("slug",),
+        cache_size: int = 4096,
+    ) -> None:
+        self.url_map = url_map
+        self.home_slug = home_slug
+        self.slug_args = slug_args
+        self.slug = lru_cache(maxsize=cache_size)(self._slug)
+
+    def _slug(self, path: str | None) -> str | None:
+        if not path:
+            return None
+        if path == "/":
+            return self.home_slug
+        try:
+            rule, view_args = self.url_map.bind("localhost").match(path, method="GET", return_rule=True)
+        except (RequestRedirect, HTTPException):
+            return None
+        for name in self.slug_args:
+            value = view_args.get(name)
+            if value:
+                return str(value).lower()
+        if rule.rule == "/":
+            return self.home_slug
+        if rule.arguments:
+            # Converter syntax such as "<int:page_id>" is not a slug.
+            return None
+        return rule.rule.strip("/")
+
+    def stats(self) -> dict[str, Any]:
+        info = self.slug.cache_info()
+        return {"paths": info.currsize, "hits": info.hits, "misses": info.misses}
@@ -0,0 +1,376 @@
+"""Optional in-memory columnar engine for the admin analytics report.
+
+Each worker can keep the recent part of ``analytics_events`` (by default the
+retention window) as NumPy arrays: timestamp, day, the dimension ids the
+report groups on, the UTC hour, and 64-bit hashes of the visitor and session ids. New rows
+are appended by id watermark before every report, so after the first load a
+refresh reads only the events written since the last one. A report is then
+a handful of vectorised ``bincount`` and ``sort`` calls over the rows in range
+instead of one SQL ``GROUP BY`` per panel.
+
+NumPy is not a hard dependency. :func:`available` reports whether it can be
+imported; without it the app keeps answering from the SQL roll-ups in
+:mod:`analytics.report`, which return the same shape.
+
+Visitor and session hashes use Python's per-process string hash, so they are
+only comparable within one worker, which is all the engine needs.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections.abc import Sequence
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; see available().
+    np = None
+
+from .report import BREAKDOWN_LIMITS, TOP_LIMIT
+from .storage import SECONDS_PER_DAY
+
+# Dimension id columns loaded from analytics_events.
+DIMENSIONS: tuple[str, ...] = (
+    "page_slug",
+    "page_title",
+    "path",
+    "referrer_domain",
+    "traffic_source",
+    "device_type",
+    "device_os",
+    "browser",
+    "country",
+    "timezone",
+)
+
+_COLUMN_TYPES: dict[str, str] = {
+    "ts": "int64",
+    "day": "int32",
+    "hour": "int8",
+    **{dimension: "int32" for dimension in DIMENSIONS},
+    "visitor": "int64",
+    "session": "int64",
+    # Set on a session's first view of a page (slug, title and path), the
+    # same rule the page-sessions roll-up counts by.
+    "first_view": "bool",
+}
+
+# Odd 64-bit multipliers that spread the page columns before they are mixed
+# into the session hash.
+_PAGE_MIXERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+
+# Packed group keys up to this many values are counted with bincount, not a sort.
+_BINCOUNT_SPAN = 1 << 22
+
+_SELECT_SQL = f"""
+    SELECT id, created_ts, created_day,
+           {", ".join(f"COALESCE({dimension}_id, 0)" for dimension in DIMENSIONS)},
+           visitor_id, session_id
+    FROM analytics_events
+    WHERE id > ? AND created_day >= ?
+    ORDER BY id
+"""
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _hash(value: str | None) -> int:
+    return hash(value) if value else 0
+
+
+def _labels(conn: sqlite3.Connection, ids: Sequence[int]) -> dict[int, str]:
+    wanted = sorted({int(value) for value in ids if value})
+    labels: dict[int, str] = {}
+    for offset in range(0, len(wanted), 500):
+        chunk = wanted[offset : offset + 500]
+        labels.update(
+            conn.execute(
+                f"SELECT id, value FROM analytics_dimension_values WHERE id IN ({', '.join('?' for _ in chunk)})",
+                chunk,
+            ).fetchall()
+        )
+    return labels
+
+
+def _ranked(counts: Any, limit: int | None) -> Any:
+    """Indices of the non-zero entries of ``counts``, largest first."""
+
+    present = np.flatnonzero(counts)
+    order = present[np.argsort(counts[present], kind="stable")[::-1]]
+    return order[:limit] if limit else order
+
+
+class EventColumns:
+    """Recent events of one worker held as NumPy columns."""
+
+    def __init__(self, *, window_days: int = 400, chunk_size: int = 50_000) -> None:
+        if np is None:
+            raise RuntimeError("The columnar report engine needs NumPy (pip install numpy).")
+        self.window_days = window_days
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in _COLUMN_TYPES.items()}
+        self._size = 0
+        self._sorted = True
+        self.watermark = 0
+        self.refreshes = 0
+        self.last_refresh_ms = 0.0
+        self.last_report_ms = 0.0
+
+    def _reset(self) -> None:
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in _COLUMN_TYPES.items()}
+        self._size = 0
+        self._sorted = True
+        self.watermark = 0
+
+    def _append(self, rows: list[tuple[Any, ...]]) -> None:
+        needed = self._size + len(rows)
+        capacity = len(self._columns["ts"])
+        if needed > capacity:
+            capacity = max(needed, capacity * 2, self.chunk_size)
+            for name, array in self._columns.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[: self._size] = array[: self._size]
+                self._columns[name] = grown
+        values = list(zip(*rows))
+        end = self._size + len(rows)
+        days = values[2]
+        if (self._size and days[0] < self._columns["day"][self._size - 1]) or any(
+            later < earlier for earlier, later in zip(days, days[1:])
+        ):
+            self._sorted = False
+        self._columns["ts"][self._size : end] = values[1]
+        self._columns["day"][self._size : end] = values[2]
+        self._columns["hour"][self._size : end] = (self._columns["ts"][self._size : end] % SECONDS_PER_DAY) // 3600
+        for index, dimension in enumerate(DIMENSIONS, start=3):
+            self._columns[dimension][self._size : end] = values[index]
+        self._columns["visitor"][self._size : end] = [_hash(value) for value in values[-2]]
+        self._columns["session"][self._size : end] = [_hash(value) for value in values[-1]]
+        self._columns["first_view"][self._size : end] = False
+        self._size = end
+        self.watermark = rows[-1][0]
+
+    def _sort(self) -> None:
+        """Order rows by day so any date range is one contiguous slice."""
+
+        if self._sorted:
+            return
+        order = np.argsort(self._columns["day"][: self._size], kind="stable")
+        self._columns = {name: array[: self._size][order] for name, array in self._columns.items()}
+        self._sorted = True
+
+    def _trim(self, horizon: int) -> None:
+        self._sort()
+        start = int(np.searchsorted(self._columns["day"][: self._size], horizon))
+        if start:
+            self._columns = {name: array[start : self._size].copy() for name, array in self._columns.items()}
+            self._size -= start
+
+    def _mark_first_views(self, from_day: int) -> None:
+        """Recompute ``first_view`` for rows from ``from_day`` on.
+
+        Sessions end after half an hour of inactivity, so starting a day
+        before the earliest new row covers every session a new row can join.
+        """
+
+        start = int(np.searchsorted(self._columns["day"][: self._size], from_day))
+        window = {name: array[start : self._size] for name, array in self._columns.items()}
+        key = window["session"].view("uint64").copy()
+        for name, mixer in zip(("page_slug", "page_title", "path"), _PAGE_MIXERS):
+            key ^= window[name].astype("uint64") * np.uint64(mixer)
+        order = np.lexsort((window["ts"], key))
+        ordered = key[order]
+        first = np.ones(len(ordered), dtype=bool)
+        first[1:] = ordered[1:] != ordered[:-1]
+        flags = np.zeros(len(ordered), dtype=bool)
+        flags[order[first]] = True
+        flags &= window["session"] != 0
+        window["first_view"][:] = flags
+
+    def refresh(self, conn: sqlite3.Connection) -> int:
+        """Append events written since the last refresh; returns the rows added."""
+
+        with self._lock:
+            started = time.perf_counter()
+            horizon = int(time.time()) // SECONDS_PER_DAY - self.window_days
+            newest = conn.execute("SELECT MAX(id) FROM analytics_events").fetchone()[0] or 0
+            if newest < self.watermark:
+                # The events table was rebuilt (e.g. a migration); start over.
+                self._reset()
+            self._trim(horizon)
+            added = 0
+            first_new_day: int | None = None
+            cursor = conn.execute(_SELECT_SQL, (self.watermark, horizon))
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                self._append(rows)
+                added += len(rows)
+                earliest = min(row[2] for row in rows)
+                first_new_day = earliest if first_new_day is None else min(first_new_day, earliest)
+            if first_new_day is not None:
+                self._sort()
+                self._mark_first_views(first_new_day - 1)
+            self.refreshes += 1
+            self.last_refresh_ms = (time.perf_counter() - started) * 1000
+            return added
+
+    def _snapshot(self) -> dict[str, Any]:
+        # Appends only write past the current size and sorting or trimming
+        # swaps in new arrays, so these views stay valid after the lock is
+        # released.
+        with self._lock:
+            self._sort()
+            return {name: array[: self._size] for name, array in self._columns.items()}
+
+    def event_report(self, conn: sqlite3.Connection, start_day: int, end_day: int) -> dict[str, Any]:
+        """The page-view breakdowns of :func:`analytics.report.event_report`, from the columns."""
+
+        self.refresh(conn)
+        started = time.perf_counter()
+        columns = self._snapshot()
+        first, last = np.searchsorted(columns["day"], [start_day, end_day + 1])
+        picked = {name: array[first:last] for name, array in columns.items()}
+
+        hourly = np.bincount(picked["hour"], minlength=24)
+        dimension_counts = {
+            dimension: np.bincount(picked[dimension], minlength=1) for dimension in (*BREAKDOWN_LIMITS, "country")
+        }
+        ranked = {
+            dimension: _ranked(dimension_counts[dimension], limit)
+            for dimension, limit in (*BREAKDOWN_LIMITS.items(), ("country", TOP_LIMIT))
+        }
+
+        page_groups, page_counts, pages = self._groups(picked, ("page_slug", "page_title", "path"))
+        top_groups = _ranked(page_counts, TOP_LIMIT)
+        page_sessions = np.bincount(page_groups[picked["first_view"]], minlength=len(page_counts))
+
+        countries = ranked["country"]
+        country_visitors = self._distinct(
+            picked["country"], picked["visitor"], countries, len(dimension_counts["country"])
+        )
+
+        _, referrer_counts, referrers = self._groups(picked, ("referrer_domain", "traffic_source"))
+        top_referrers = _ranked(referrer_counts, TOP_LIMIT)
+        referrer_counts, referrers = referrer_counts[top_referrers], referrers[top_referrers]
+
+        labels = _labels(
+            conn,
+            [
+                *(int(value) for order in ranked.values() for value in order),
+                *(int(value) for value in pages[top_groups].ravel()),
+                *(int(value) for value in referrers.ravel()),
+            ],
+        )
+        label = labels.get
+
+        report = {
+            "hourly": [int(value) for value in hourly],
+            "breakdowns": {
+                dimension: [
+                    {"value": label(int(value)), "page_views": int(dimension_counts[dimension][value])}
+                    for value in ranked[dimension]
+                ]
+                for dimension in BREAKDOWN_LIMITS
+            },
+            "top_pages": [
+                {
+                    "page_slug": label(int(pages[group][0])),
+                    "page_title": label(int(pages[group][1])),
+                    "path": label(int(pages[group][2])),
+                    "page_views": int(page_counts[group]),
+                    "sessions": int(page_sessions[group]),
+                }
+                for group in top_groups
+            ],
+            "referrers": [
+                {"domain": label(referrer_id) or label(source_id), "traffic_source": label(source_id), "page_views": views}
+                for (referrer_id, source_id), views in zip(referrers.tolist(), referrer_counts.tolist())
+            ],
+            "countries": [
+                {
+                    "value": label(int(value)),
+                    "page_views": int(dimension_counts["country"][value]),
+                    "unique_visitors": country_visitors.get(int(value), 0),
+                }
+                for value in countries
+            ],
+        }
+        self.last_report_ms = (time.perf_counter() - started) * 1000
+        return report
+
+    @staticmethod
+    def _groups(picked: dict[str, Any], names: Sequence[str]) -> tuple[Any, Any, Any]:
+        """Group rows on the ``names`` columns packed into one int64 key.
+
+        Returns each row's group index, the row count of each group and the
+        column values of each group.
+        """
+
+        radices = [int(picked[name].max()) + 1 if len(picked[name]) else 1 for name in names]
+        keys = np.zeros(len(picked[names[0]]), dtype="int64")
+        for name, radix in zip(names, radices):
+            keys = keys * radix + picked[name]
+        span = 1
+        for radix in radices:
+            span *= radix
+        if span <= _BINCOUNT_SPAN:
+            counts = np.bincount(keys, minlength=1)
+            distinct = np.flatnonzero(counts)
+            counts = counts[distinct]
+            lookup = np.empty(span, dtype="int32")
+            lookup[distinct] = np.arange(len(distinct), dtype="int32")
+            inverse = lookup[keys]
+        else:
+            distinct, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        values = []
+        remainder = distinct
+        for radix in reversed(radices):
+            remainder, value = np.divmod(remainder, radix)
+            values.append(value)
+        return inverse, counts, np.stack(values[::-1], axis=1)
+
+    @staticmethod
+    def _distinct(groups: Any, members: Any, wanted: Any, size: int) -> dict[int, int]:
+        """Distinct ``members`` per group for the ``wanted`` groups (``groups`` lie in ``range(size)``).
+
+        Each member hash is shifted left and tagged with its group's slot in
+        the low bits, so one sort over the selected rows covers every group
+        (dropping the top bits of a random 64-bit hash adds no meaningful
+        collisions). Sorting and counting boundaries is far faster than
+        ``np.unique`` on this many random keys.
+        """
+
+        if not len(wanted) or not len(groups):
+            return {}
+        lookup = np.full(size, -1, dtype="int64")
+        lookup[wanted] = np.arange(len(wanted))
+        slots = lookup[groups]
+        rows = slots >= 0
+        bits = max(1, (len(wanted) - 1).bit_length())
+        tagged = np.sort((members[rows] << bits) | slots[rows])
+        boundaries = np.ones(len(tagged), dtype=bool)
+        boundaries[1:] = tagged[1:] != tagged[:-1]
+        counts = np.bincount(tagged[boundaries] & ((1 << bits) - 1), minlength=len(wanted))
+        return dict(zip((int(group) for group in wanted), counts.tolist()))
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._sort()
+            days = self._columns["day"][: self._size]
+            return {
+                "rows": self._size,
+                "capacity": len(self._columns["ts"]),
+                "memory_bytes": sum(array.nbytes for array in self._columns.values()),
+                "watermark": self.watermark,
+                "oldest_day": int(days[0]) if self._size else None,
+                "refreshes": self.refreshes,
+                "last_refresh_ms": round(self.last_refresh_ms, 1),
+                "last_report_ms": round(self.last_report_ms, 1),
+            }
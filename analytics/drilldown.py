@@ -0,0 +1,194 @@
+"""Ad-hoc page-view drill-downs: any date range, filters and one breakdown.
+
+A query names an inclusive range of UTC days, filters on any of
+:data:`FILTERS` (each one value label, e.g. ``country = "United Kingdom"``)
+and optionally one dimension of :data:`DIMENSIONS` to break page views down
+by. :func:`plan` picks the coarsest table able to answer it:
+
+1. ``analytics_rollup_daily``: no filters, a total or a daily series;
+2. ``analytics_rollup_breakdowns``: filters and breakdown all on one
+   dimension (e.g. the device mix, or page views of one country per day);
+3. ``analytics_rollup_cube``: filters and breakdown among its key columns
+   (traffic source, country, device type and page, plus the day);
+4. ``analytics_events``: anything else, such as browsers under a country
+   filter. Raw events only go back as far as retention keeps them, so
+   :func:`run` reports the first day such an answer covers.
+
+The roll-up tiers read a row per day and key, so a drill-down over years of
+data stays a bounded index range scan.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+from .rollups import SECONDS_PER_DAY
+
+
+@dataclass(frozen=True)
+class Dimension:
+    label: str
+    # Expression over analytics_events.
+    events: str
+    # Dimension and key column in analytics_rollup_breakdowns, if counted there.
+    breakdown: tuple[str, str] | None = None
+    # Key column of analytics_rollup_cube, if it is one.
+    cube: str | None = None
+    # analytics_dimension_values.dimension of the ids; None when the key is its own label.
+    values: str | None = None
+
+
+DIMENSIONS: dict[str, Dimension] = {
+    "day": Dimension("Day", "created_day", ("", "day"), "day"),
+    "hour": Dimension("Hour (UTC)", f"(created_ts % {SECONDS_PER_DAY}) / 3600", ("hour", "key1")),
+    "traffic_source": Dimension(
+        "Traffic source", "traffic_source_id", ("traffic_source", "key1"), "traffic_source_id", "traffic_source"
+    ),
+    "country": Dimension("Country", "country_id", ("country", "key1"), "country_id", "country"),
+    "device_type": Dimension("Device", "device_type_id", ("device_type", "key1"), "device_type_id", "device_type"),
+    "device_os": Dimension("Operating system", "device_os_id", ("device_os", "key1"), values="device_os"),
+    "browser": Dimension("Browser", "browser_id", ("browser", "key1"), values="browser"),
+    "timezone": Dimension("Time zone", "timezone_id", ("timezone", "key1"), values="timezone"),
+    "referrer": Dimension("Referrer", "referrer_domain_id", ("referrer", "key1"), values="referrer_domain"),
+    "page": Dimension("Page", "path_id", ("page", "key3"), "path_id", "path"),
+}
+
+# Dimensions a drill-down can filter on.
+FILTERS: tuple[str, ...] = ("traffic_source", "country", "device_type", "page")
+
+PLANS: tuple[str, ...] = ("daily", "breakdowns", "cube", "events")
+
+
+def plan(filters: Mapping[str, Any], breakdown: str | None) -> str:
+    """Name of the coarsest table that can answer the query (one of :data:`PLANS`)."""
+
+    if not filters and breakdown in (None, "day"):
+        return "daily"
+    dimensions = {*filters, breakdown} - {None, "day"}
+    if len(dimensions) == 1 and all(DIMENSIONS[name].breakdown for name in dimensions):
+        return "breakdowns"
+    if all(DIMENSIONS[name].cube for name in dimensions):
+        return "cube"
+    return "events"
+
+
+def _value_ids(conn: sqlite3.Connection, filters: Mapping[str, str]) -> dict[str, int] | None:
+    """Dimension-value ids of the filter labels; None when one of them was never seen."""
+
+    ids: dict[str, int] = {}
+    for name, label in filters.items():
+        row = conn.execute(
+            "SELECT id FROM analytics_dimension_values WHERE dimension = ? AND value = ?",
+            (DIMENSIONS[name].values, label),
+        ).fetchone()
+        if row is None:
+            return None
+        ids[name] = row[0]
+    return ids
+
+
+# Table and page-view measure of each plan.
+_SOURCES: dict[str, tuple[str, str]] = {
+    "daily": ("analytics_rollup_daily", "SUM(page_views)"),
+    "breakdowns": ("analytics_rollup_breakdowns", "SUM(page_views)"),
+    "cube": ("analytics_rollup_cube", "SUM(page_views)"),
+    "events": ("analytics_events", "COUNT(*)"),
+}
+
+
+def _column(source: str, name: str) -> str:
+    dimension = DIMENSIONS[name]
+    if source in ("daily", "breakdowns"):
+        return dimension.breakdown[1]
+    if source == "cube":
+        return dimension.cube
+    return dimension.events
+
+
+def _select(
+    source: str,
+    ids: Mapping[str, int],
+    breakdown: str | None,
+    start_day: int,
+    end_day: int,
+) -> tuple[str, list[Any]]:
+    table, measure = _SOURCES[source]
+    conditions = [f"{_column(source, 'day')} BETWEEN ? AND ?"]
+    params: list[Any] = [start_day, end_day]
+    if source == "breakdowns":
+        (name,) = {*ids, breakdown} - {None, "day"}
+        conditions.append("dimension = ?")
+        params.append(DIMENSIONS[name].breakdown[0])
+    for name, value_id in ids.items():
+        conditions.append(f"{_column(source, name)} = ?")
+        params.append(value_id)
+    where = " AND ".join(conditions)
+    if breakdown is None:
+        return f"SELECT NULL, COALESCE({measure}, 0) FROM {table} WHERE {where}", params
+    return f"SELECT {_column(source, breakdown)}, {measure} FROM {table} WHERE {where} GROUP BY 1", params
+
+
+def _day_label(day: int) -> str:
+    return datetime.fromtimestamp(day * SECONDS_PER_DAY, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def run(
+    conn: sqlite3.Connection,
+    start_day: int,
+    end_day: int,
+    *,
+    filters: Mapping[str, str] | None = None,
+    breakdown: str | None = None,
+    limit: int | None = 50,
+) -> dict[str, Any]:
+    """Page views for the range, filters and breakdown, answered by :func:`plan`'s table.
+
+    Rows are ``{"value", "page_views"}``, by day or hour for those
+    breakdowns and busiest first (up to ``limit``) otherwise. When raw
+    events answered and retention has already archived the start of the
+    range, ``complete_from`` is the first day the answer covers.
+    """
+
+    filters = {name: label for name, label in (filters or {}).items() if label}
+    unknown = set(filters) - set(FILTERS) | ({breakdown} - {None} - set(DIMENSIONS))
+    if unknown:
+        raise ValueError(f"unknown drill-down dimension(s): {', '.join(sorted(unknown))}")
+    source = plan(filters, breakdown)
+    result: dict[str, Any] = {"plan": source, "total": 0, "rows": [], "complete_from": None}
+    if source == "events":
+        first = conn.execute("SELECT MIN(created_day) FROM analytics_events").fetchone()[0]
+        if first is not None and first > start_day:
+            result["complete_from"] = _day_label(first)
+    ids = _value_ids(conn, filters)
+    if ids is None:
+        return result
+
+    sql, params = _select(source, ids, breakdown, start_day, end_day)
+    counts = [(key, views) for key, views in conn.execute(sql, params).fetchall() if views]
+    result["total"] = sum(views for _, views in counts)
+    if breakdown is None:
+        return result
+    if breakdown in ("day", "hour"):
+        counts.sort()
+    else:
+        counts.sort(key=lambda row: row[1], reverse=True)
+        counts = counts[:limit] if limit else counts
+
+    if breakdown == "day":
+        labels = {key: _day_label(key) for key, _ in counts}
+    elif breakdown == "hour":
+        labels = {key: f"{key:02d}:00" for key, _ in counts}
+    else:
+        keys = [key for key, _ in counts if key]
+        labels = dict(
+            conn.execute(
+                f"SELECT id, value FROM analytics_dimension_values WHERE id IN ({', '.join('?' for _ in keys)})",
+                keys,
+            ).fetchall()
+        )
+    result["rows"] = [{"value": labels.get(key), "page_views": views} for key, views in counts]
+    return result
@@ -0,0 +1,166 @@
+"""Engaged time per page, kept as one t-digest per page and day.
+
+The tracker sends an ``engagement`` event with the milliseconds a page was
+visible and focused when the visitor leaves it. Pings are never stored
+individually: each batch is folded into ``analytics_engagement``, one row
+per (day, page slug) holding the ping count, the summed time and a
+serialised :class:`~analytics.sketches.TDigest`. A report over any range
+merges the handful of digests it covers.
+"""
+
+from __future__ import annotations
+
+import math
+import sqlite3
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from .sketches import TDigest
+from .storage import SECONDS_PER_DAY, DimensionInterner, epoch_seconds
+
+MAX_ENGAGED_MS = 4 * 60 * 60 * 1000
+COMPRESSION = 100
+
+
+def ensure_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_engagement (
+            day INTEGER NOT NULL,
+            page_slug_id INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            total_ms INTEGER NOT NULL,
+            digest BLOB,
+            PRIMARY KEY (day, page_slug_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def parse_engaged_ms(value: object) -> int | None:
+    try:
+        number = float(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number) or number <= 0:
+        return None
+    return int(min(number, MAX_ENGAGED_MS))
+
+
+def write_events(
+    conn: sqlite3.Connection,
+    events: Iterable[Mapping[str, Any]],
+    interner: DimensionInterner,
+) -> int:
+    """Fold ``engagement`` events into the per-day digests without committing."""
+
+    events = list(events)
+    slugs = {("page_slug", str(event["page_slug"])) for event in events if event.get("page_slug")}
+    ids = interner.resolve(conn, slugs)
+
+    groups: dict[tuple[int, int], list[int]] = {}
+    for event in events:
+        engaged_ms = parse_engaged_ms(event.get("engaged_ms"))
+        if engaged_ms is None:
+            continue
+        created_ts = event.get("created_ts")
+        if created_ts is None:
+            try:
+                created_ts = epoch_seconds(str(event.get("created_at")))
+            except ValueError:
+                continue
+        key = (int(created_ts) // SECONDS_PER_DAY, ids.get(("page_slug", str(event.get("page_slug"))), 0))
+        groups.setdefault(key, []).append(engaged_ms)
+    if not groups:
+        return 0
+
+    # Touch every row first so this transaction holds the write lock before
+    # the digests are read back, merged and rewritten.
+    conn.executemany(
+        """
+        INSERT INTO analytics_engagement (day, page_slug_id, samples, total_ms, digest)
+        VALUES (?, ?, ?, ?, NULL)
+        ON CONFLICT (day, page_slug_id)
+        DO UPDATE SET samples = samples + excluded.samples, total_ms = total_ms + excluded.total_ms
+        """,
+        [(day, slug_id, len(values), sum(values)) for (day, slug_id), values in groups.items()],
+    )
+    updates = []
+    for (day, slug_id), values in groups.items():
+        row = conn.execute(
+            "SELECT digest FROM analytics_engagement WHERE day = ? AND page_slug_id = ?",
+            (day, slug_id),
+        ).fetchone()
+        digest = TDigest.from_bytes(row[0]) if row and row[0] else TDigest(COMPRESSION)
+        digest.update(values)
+        updates.append((digest.to_bytes(), day, slug_id))
+    conn.executemany(
+        "UPDATE analytics_engagement SET digest = ? WHERE day = ? AND page_slug_id = ?",
+        updates,
+    )
+    return sum(len(values) for values in groups.values())
+
+
+def format_duration(milliseconds: float | None) -> str:
+    if milliseconds is None:
+        return "–"
+    seconds = milliseconds / 1000
+    if seconds < 60:
+        return f"{seconds:.0f}s" if seconds >= 10 else f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds:02d}s"
+
+
+def _summary(samples: int, total_ms: int, digest: TDigest) -> dict[str, Any]:
+    values = {
+        "median": digest.quantile(0.5),
+        "p90": digest.quantile(0.9),
+        "mean": total_ms / samples if samples else None,
+    }
+    return {
+        "samples": samples,
+        "values": values,
+        "display": {name: format_duration(value) for name, value in values.items()},
+    }
+
+
+def page_report(
+    conn: sqlite3.Connection,
+    start_day: int,
+    end_day: int,
+    *,
+    limit: int = 10,
+) -> list[dict[str, Any]]:
+    """Median, p90 and mean engaged time per page (most pings first) plus ``All pages``."""
+
+    rows = conn.execute(
+        """
+        SELECT e.page_slug_id, e.samples, e.total_ms, e.digest, d.value
+        FROM analytics_engagement AS e
+        LEFT JOIN analytics_dimension_values AS d ON d.id = e.page_slug_id
+        WHERE e.day BETWEEN ? AND ?
+        """,
+        (start_day, end_day),
+    ).fetchall()
+    if not rows:
+        return []
+
+    pages: dict[int, list[Any]] = {}
+    overall = [0, 0, TDigest(COMPRESSION)]
+    for slug_id, samples, total_ms, blob, label in rows:
+        if not blob:
+            continue
+        digest = TDigest.from_bytes(blob)
+        entry = pages.setdefault(slug_id, [label, 0, 0, TDigest(COMPRESSION)])
+        entry[1] += samples
+        entry[2] += total_ms
+        entry[3].merge(digest)
+        overall[0] += samples
+        overall[1] += total_ms
+        overall[2].merge(digest)
+
+    busiest = sorted(pages.values(), key=lambda entry: entry[1], reverse=True)[:limit]
+    report = [{"page_slug": None, "label": "All pages", **_summary(*overall)}]
+    for label, samples, total_ms, digest in busiest:
+        report.append({"page_slug": label, "label": label or "Unknown", **_summary(samples, total_ms, digest)})
+    return report
@@ -0,0 +1,323 @@
+"""Offline IP-to-country lookup over a memory-mapped range table.
+
+``flask analytics-geoip-build`` compiles a CSV of IP ranges into a compact
+binary file; at ingest the file is memory-mapped read-only and searched with
+:mod:`bisect`. Pages come straight from the OS page cache, so every worker
+shares one copy and start-up does no parsing. The IPv4 columns are
+little-endian ``uint32`` so that, on little-endian hosts, :mod:`bisect` runs
+directly over a ``memoryview`` of the mapping without any Python-level
+indexing.
+
+File layout::
+
+    header   b"LMSCGEO1", IPv4 range count, IPv6 range count (big-endian uint32)
+    IPv4     starts, ends (little-endian uint32 each), countries (2 ASCII bytes each)
+    IPv6     starts, ends (big-endian 16 bytes each), countries (2 ASCII bytes each)
+
+Ranges within a family are sorted, non-overlapping and inclusive; adjacent
+ranges of the same country are merged when the file is built.
+
+The CSV may use dotted/colon addresses or integers for the range bounds
+(``start,end,country[,...]``, the DB-IP and IP2Location "lite" layouts), or a
+CIDR network followed by the country (``network,country``). A header row and
+rows without a two-letter country are skipped.
+"""
+
+from __future__ import annotations
+
+import bisect
+import csv
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+MAGIC = b"LMSCGEO1"
+_HEADER = struct.Struct(">8sII")
+_V4_MAPPED = int(ipaddress.IPv6Address("::ffff:0:0"))
+_V4_MAX = 0xFFFFFFFF
+
+Range = tuple[int, int, str]
+
+
+def _parse_address(value: str) -> tuple[int, int]:
+    """Return ``(version, integer)`` for a dotted/colon address or a bare integer."""
+
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        if number <= _V4_MAX:
+            return 4, number
+    else:
+        address = ipaddress.ip_address(value)
+        number = int(address)
+        if address.version == 4:
+            return 4, number
+    if _V4_MAPPED <= number <= _V4_MAPPED + _V4_MAX:
+        return 4, number - _V4_MAPPED
+    return 6, number
+
+
+def read_csv_ranges(path: str | os.PathLike[str]) -> Iterator[tuple[int, Range]]:
+    """Yield ``(version, (start, end, country))`` from a range or CIDR CSV."""
+
+    with open(path, newline="", encoding="utf-8") as handle:
+        for row in csv.reader(handle):
+            if len(row) < 2:
+                continue
+            try:
+                if "/" in row[0]:
+                    network = ipaddress.ip_network(row[0].strip(), strict=False)
+                    version, start = _parse_address(str(network.network_address))
+                    end = start + network.num_addresses - 1
+                    country = row[1]
+                else:
+                    version, start = _parse_address(row[0])
+                    _, end = _parse_address(row[1])
+                    country = row[2] if len(row) > 2 else ""
+            except ValueError:
+                continue
+            country = country.strip().upper()
+            if len(country) != 2 or not country.isalpha() or end < start:
+                continue
+            yield version, (start, end, country)
+
+
+def _normalise(ranges: Iterable[Range]) -> list[Range]:
+    merged: list[Range] = []
+    for start, end, country in sorted(ranges):
+        if merged:
+            last_start, last_end, last_country = merged[-1]
+            if start <= last_end:
+                # Overlap: keep the earlier range and only the uncovered tail.
+                if end <= last_end:
+                    continue
+                start = last_end + 1
+            if start == last_end + 1 and country == last_country:
+                merged[-1] = (last_start, end, country)
+                continue
+        merged.append((start, end, country))
+    return merged
+
+
+_BYTEORDER = {4: "little", 16: "big"}
+
+
+def _pack(ranges: list[Range], width: int) -> bytes:
+    order = _BYTEORDER[width]
+    return b"".join(
+        (
+            b"".join(start.to_bytes(width, order) for start, _, _ in ranges),
+            b"".join(end.to_bytes(width, order) for _, end, _ in ranges),
+            b"".join(country.encode("ascii") for _, _, country in ranges),
+        )
+    )
+
+
+def build_database(source: str | os.PathLike[str], target: str | os.PathLike[str]) -> tuple[int, int]:
+    """Compile the CSV at ``source`` into ``target``; returns the IPv4/IPv6 range counts.
+
+    The file is written beside ``target`` and renamed into place, so running
+    workers keep reading their existing mapping until they reopen it.
+    """
+
+    families: dict[int, list[Range]] = {4: [], 6: []}
+    for version, item in read_csv_ranges(source):
+        families[version].append(item)
+    v4 = _normalise(families[4])
+    v6 = _normalise(families[6])
+
+    target_path = Path(target)
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target_path.with_name(f".{target_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as handle:
+        handle.write(_HEADER.pack(MAGIC, len(v4), len(v6)))
+        handle.write(_pack(v4, 4))
+        handle.write(_pack(v6, 16))
+        handle.flush()
+        os.fsync(handle.fileno())
+    temp_path.replace(target_path)
+    return len(v4), len(v6)
+
+
+class _Column:
+    """Sequence view of fixed-width integers in a buffer, for bisect."""
+
+    __slots__ = ("buffer", "offset", "width", "count", "byteorder")
+
+    def __init__(self, buffer: Any, offset: int, width: int, count: int) -> None:
+        self.buffer = buffer
+        self.offset = offset
+        self.width = width
+        self.count = count
+        self.byteorder = _BYTEORDER[width]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> int:
+        start = self.offset + index * self.width
+        return int.from_bytes(self.buffer[start : start + self.width], self.byteorder)
+
+
+def _column(buffer: Any, offset: int, width: int, count: int) -> Any:
+    if width == 4 and sys.byteorder == "little" and struct.calcsize("I") == 4:
+        return memoryview(buffer)[offset : offset + 4 * count].cast("I")
+    return _Column(buffer, offset, width, count)
+
+
+@dataclass
+class _Family:
+    starts: Any
+    ends: Any
+    countries_offset: int
+
+    @classmethod
+    def at(cls, buffer: Any, offset: int, width: int, count: int) -> tuple[_Family, int]:
+        starts = _column(buffer, offset, width, count)
+        ends = _column(buffer, offset + width * count, width, count)
+        countries_offset = offset + 2 * width * count
+        return cls(starts, ends, countries_offset), countries_offset + 2 * count
+
+
+class GeoIPDatabase:
+    """Read-only view of a compiled range file."""
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.v4_count, self.v6_count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{self.path} is not a GeoIP range file")
+        if len(self._map) != _HEADER.size + 10 * self.v4_count + 34 * self.v6_count:
+            self._map.close()
+            raise ValueError(f"{self.path} is truncated or corrupt")
+        self._v4, offset = _Family.at(self._map, _HEADER.size, 4, self.v4_count)
+        self._v6, _ = _Family.at(self._map, offset, 16, self.v6_count)
+
+    def _search(self, family: _Family, number: int) -> str | None:
+        index = bisect.bisect_right(family.starts, number) - 1
+        if index < 0 or number > family.ends[index]:
+            return None
+        offset = family.countries_offset + 2 * index
+        return self._map[offset : offset + 2].decode("ascii")
+
+    def lookup(self, ip: str) -> str | None:
+        try:
+            return self._search(self._v4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"))
+        except OSError:
+            pass
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if address.version == 4:
+            return self._search(self._v4, int(address))
+        return self._search(self._v6, int(address))
+
+    def close(self) -> None:
+        for family in (getattr(self, "_v4", None), getattr(self, "_v6", None)):
+            for column in (family.starts, family.ends) if family is not None else ():
+                if isinstance(column, memoryview):
+                    column.release()
+        self._map.close()
+
+
+class GeoIPResolver:
+    """Worker-level handle on the range file that reopens it after a rebuild.
+
+    The file's inode and mtime are checked at most every ``refresh_seconds``;
+    a missing file simply resolves nothing. Results are cached per IP. A
+    replaced mapping stays open for ``RETIRE_SECONDS``, far longer than any
+    lookup that may still be reading it, and is closed at a later refresh.
+    """
+
+    RETIRE_SECONDS = 5.0
+
+    def __init__(self, path: str | os.PathLike[str], *, refresh_seconds: float = 60.0, cache_size: int = 8192) -> None:
+        self.path = Path(path)
+        self.refresh_seconds = refresh_seconds
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._database: GeoIPDatabase | None = None
+        self._signature: tuple[int, int] | None = None
+        self._checked_at = float("-inf")
+        self._retired: list[tuple[float, GeoIPDatabase]] = []
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _refresh(self) -> GeoIPDatabase | None:
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_seconds:
+            return self._database
+        with self._lock:
+            if now - self._checked_at < self.refresh_seconds:
+                return self._database
+            self._checked_at = now
+            self._close_retired(now)
+            try:
+                stat = self.path.stat()
+            except OSError:
+                self._retire(now)
+                self._database = None
+                self._signature = None
+                return None
+            signature = (stat.st_ino, stat.st_mtime_ns)
+            if signature != self._signature:
+                try:
+                    database = GeoIPDatabase(self.path)
+                except (OSError, ValueError, struct.error):
+                    return self._database
+                # Other threads may still be reading the previous mapping.
+                self._retire(now)
+                self._database = database
+                self._signature = signature
+                self.reloads += 1
+                self.lookup.cache_clear()
+            return self._database
+
+    def _retire(self, now: float) -> None:
+        if self._database is not None:
+            self._retired.append((now, self._database))
+
+    def _close_retired(self, now: float) -> None:
+        kept = []
+        for retired_at, database in self._retired:
+            if now - retired_at >= self.RETIRE_SECONDS:
+                database.close()
+            else:
+                kept.append((retired_at, database))
+        self._retired = kept
+
+    def _lookup(self, ip: str) -> str | None:
+        database = self._database
+        return database.lookup(ip) if database is not None else None
+
+    def country_for(self, ip: str | None) -> str | None:
+        if not ip or self._refresh() is None:
+            return None
+        return self.lookup(ip)
+
+    def stats(self) -> dict[str, Any]:
+        database = self._database
+        info = self.lookup.cache_info()
+        return {
+            "loaded": database is not None,
+            "ipv4_ranges": database.v4_count if database is not None else 0,
+            "ipv6_ranges": database.v6_count if database is not None else 0,
+            "reloads": self.reloads,
+            "hits": info.hits,
+            "misses": info.misses,
+        }
@@ -0,0 +1,181 @@
+"""Per-worker admission control for analytics beacons.
+
+A stuck tab, a retry loop or a scripted client can post the same page view
+many times a second, and every copy would otherwise become a committed row
+and inflate every report. :class:`IngestGuard` sits in front of the write
+buffer and drops such events before they are queued:
+
+* a sliding-window dedupe on ``(visitor_id, path)`` discards a page view when
+  the same visitor already viewed the same path within ``dedupe_seconds``;
+* token buckets per client IP and per visitor cap the sustained event rate
+  while still allowing a burst (several tabs, a batched beacon).
+
+All state lives in memory and is bounded by ``max_keys``, so each worker
+enforces its limits independently; that is enough to keep a single noisy
+client from dominating the write path without any shared store.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Sequence
+from typing import Any
+
+Event = dict[str, Any]
+
+
+class DedupeWindow:
+    """Remembers keys for ``window`` seconds; repeats inside the window are duplicates.
+
+    Keys are kept in first-seen order, so expiry only ever looks at the front
+    of the ordered dict. A duplicate does not extend the window: a visitor
+    who reloads a page every few seconds still gets one view per window.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        *,
+        max_keys: int = 50_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window = float(window)
+        self.max_keys = max(1, int(max_keys))
+        self._clock = clock
+        self._seen: OrderedDict[Hashable, float] = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window
+        seen = self._seen
+        while seen:
+            key, first_seen = next(iter(seen.items()))
+            if first_seen > cutoff and len(seen) < self.max_keys:
+                break
+            seen.popitem(last=False)
+
+    def seen(self, key: Hashable) -> bool:
+        """Record ``key``; returns ``True`` when it was already seen in the window."""
+
+        if self.window <= 0:
+            return False
+        now = self._clock()
+        self._expire(now)
+        if key in self._seen:
+            return True
+        self._seen[key] = now
+        return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class TokenBuckets:
+    """Token bucket per key refilled at ``rate`` tokens/second up to ``burst``.
+
+    Buckets are kept in least-recently-used order and the oldest are dropped
+    beyond ``max_keys``; a dropped bucket simply starts full again.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        *,
+        max_keys: int = 50_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_keys = max(1, int(max_keys))
+        self._clock = clock
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: Hashable, cost: float = 1.0) -> bool:
+        """Spend ``cost`` tokens from ``key``'s bucket; ``False`` when it is empty."""
+
+        if self.rate <= 0:
+            return True
+        now = self._clock()
+        buckets = self._buckets
+        tokens, updated = buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        buckets[key] = (tokens, now)
+        while len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+        return allowed
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class IngestGuard:
+    """Filters beacon events through the dedupe window and rate limits.
+
+    Only page views are deduplicated; every event type counts against the
+    IP and visitor buckets. Counters are per worker since start-up.
+    """
+
+    def __init__(
+        self,
+        *,
+        dedupe_seconds: float = 10.0,
+        ip_rate: float = 10.0,
+        ip_burst: float = 100.0,
+        visitor_rate: float = 2.0,
+        visitor_burst: float = 30.0,
+        max_keys: int = 50_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.dedupe = DedupeWindow(dedupe_seconds, max_keys=max_keys, clock=clock)
+        self.ip_buckets = TokenBuckets(ip_rate, ip_burst, max_keys=max_keys, clock=clock)
+        self.visitor_buckets = TokenBuckets(visitor_rate, visitor_burst, max_keys=max_keys, clock=clock)
+        self.accepted = 0
+        self.duplicates = 0
+        self.ip_limited = 0
+        self.visitor_limited = 0
+        self._lock = threading.Lock()
+
+    def admit(self, events: Sequence[Event], client_ip: str | None) -> list[Event]:
+        """Return the events that may be queued, counting the ones dropped."""
+
+        admitted: list[Event] = []
+        with self._lock:
+            for event in events:
+                visitor_id = event.get("visitor_id")
+                if (
+                    event.get("type", "pageview") == "pageview"
+                    and self.dedupe.seen((visitor_id, event.get("path")))
+                ):
+                    self.duplicates += 1
+                    continue
+                if client_ip and not self.ip_buckets.take(client_ip):
+                    self.ip_limited += 1
+                    continue
+                if visitor_id and not self.visitor_buckets.take(visitor_id):
+                    self.visitor_limited += 1
+                    continue
+                admitted.append(event)
+            self.accepted += len(admitted)
+        return admitted
+
+    @property
+    def dropped(self) -> int:
+        return self.duplicates + self.ip_limited + self.visitor_limited
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "accepted": self.accepted,
+                "dropped": self.dropped,
+                "duplicates": self.duplicates,
+                "ip_limited": self.ip_limited,
+                "visitor_limited": self.visitor_limited,
+                "tracked_pages": len(self.dedupe),
+                "tracked_ips": len(self.ip_buckets),
+                "tracked_visitors": len(self.visitor_buckets),
+            }
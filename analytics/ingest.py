@@ -0,0 +1,388 @@
+"""Beacon parsing shared by the Flask route and the raw WSGI ingest app.
+
+:class:`BeaconIngest` turns a decoded beacon body into stored-event dicts and
+hands them to the guard and the write queue. It only needs a
+:class:`BeaconRequest` (user agent, client IP, host, referrer, headers), so
+the same code runs behind ``/analytics/track`` in Flask and in
+:class:`IngestApp`, a bare WSGI callable that :class:`BeaconDispatcher`
+mounts in front of the Flask app.
+
+The raw path skips everything a beacon does not need (``ProxyFix``, the
+HTTPS redirect hook, sessions, Flask-Compress, routing and the response
+object), which is most of the per-request cost for a request whose answer
+is always an empty 204.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+from urllib.parse import urlparse
+
+from .canonical import Canonicalizer, canonical_path, canonical_title, canonical_url
+from .engagement import parse_engaged_ms
+from .guard import IngestGuard
+from .vitals import METRICS as VITAL_METRICS
+from .vitals import parse_metric
+from .user_agents import UserAgentClassifier, UserAgentInfo
+
+Event = dict[str, Any]
+EventBuilder = Callable[[Mapping[str, Any], "BeaconRequest", UserAgentInfo], "Event | None"]
+SourceClassifier = Callable[[str | None, str | None, str], tuple[str, str | None, str | None, str | None, str | None]]
+
+MAX_BODY_BYTES = 64 * 1024
+
+# Longest visitor/session id, URL and other text field kept from a beacon.
+MAX_ID_LENGTH = 128
+MAX_URL_LENGTH = 2048
+MAX_TEXT_LENGTH = 256
+
+_NO_CONTENT = "204 No Content"
+_NO_CONTENT_HEADERS = [("Cache-Control", "no-store"), ("Content-Length", "0")]
+
+
+class EnvironHeaders:
+    """Read-only ``headers.get`` over a WSGI environ, without copying it."""
+
+    __slots__ = ("environ",)
+
+    def __init__(self, environ: Mapping[str, Any]) -> None:
+        self.environ = environ
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        key = name.upper().replace("-", "_")
+        if key not in {"CONTENT_TYPE", "CONTENT_LENGTH"}:
+            key = f"HTTP_{key}"
+        return self.environ.get(key, default)
+
+
+@dataclass(slots=True)
+class BeaconRequest:
+    user_agent: str
+    client_ip: str | None
+    host: str
+    host_url: str
+    referrer: str | None
+    headers: Any
+
+
+def _forwarded(environ: Mapping[str, Any], key: str, trusted: int) -> str | None:
+    value = environ.get(key)
+    if not value or trusted < 1:
+        return None
+    values = [part.strip() for part in value.split(",")]
+    if len(values) < trusted:
+        return None
+    return values[-trusted] or None
+
+
+def beacon_request_from_environ(environ: Mapping[str, Any], *, trusted_proxies: int = 1) -> BeaconRequest:
+    """Build a :class:`BeaconRequest`, trusting ``X-Forwarded-*`` like ``ProxyFix``."""
+
+    scheme = _forwarded(environ, "HTTP_X_FORWARDED_PROTO", trusted_proxies) or environ.get("wsgi.url_scheme", "http")
+    host = (
+        _forwarded(environ, "HTTP_X_FORWARDED_HOST", trusted_proxies)
+        or environ.get("HTTP_HOST")
+        or environ.get("SERVER_NAME", "")
+    )
+    return BeaconRequest(
+        user_agent=environ.get("HTTP_USER_AGENT", ""),
+        client_ip=_forwarded(environ, "HTTP_X_FORWARDED_FOR", trusted_proxies) or environ.get("REMOTE_ADDR"),
+        host=host,
+        host_url=f"{scheme}://{host}/",
+        referrer=environ.get("HTTP_REFERER"),
+        headers=EnvironHeaders(environ),
+    )
+
+
+def resolve_event_timestamp(event_ts: object, sent_at: object) -> str:
+    """Place a queued client event on the server clock.
+
+    The tracker stamps each event with ``ts`` and the beacon with ``sent_at``
+    (both client milliseconds), so the delay between the two survives any
+    skew in the visitor's clock.
+    """
+
+    received_at = datetime.utcnow()
+    try:
+        delay_seconds = (float(sent_at) - float(event_ts)) / 1000.0  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return received_at.strftime("%Y-%m-%d %H:%M:%S")
+    delay_seconds = min(max(delay_seconds, 0.0), 24 * 60 * 60)
+    return (received_at - timedelta(seconds=delay_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def extract_beacon_events(body: object, limit: int) -> list[dict[str, Any]]:
+    """Normalise a beacon body into a list of event payloads.
+
+    Accepts a single event object, a bare list of events, or an envelope
+    ``{"events": [...], ...}`` whose other keys (visitor/session ids,
+    ``sent_at``) are shared by every event in the batch.
+    """
+
+    shared: dict[str, Any] = {}
+    if isinstance(body, dict) and isinstance(body.get("events"), list):
+        shared = {key: value for key, value in body.items() if key != "events"}
+        items = body["events"]
+    elif isinstance(body, list):
+        items = body
+    elif isinstance(body, dict):
+        items = [body]
+    else:
+        items = []
+
+    return [{**shared, **item} for item in items[:limit] if isinstance(item, dict)]
+
+
+def _text(value: object, limit: int = MAX_TEXT_LENGTH) -> str | None:
+    """``value`` as a bounded, stripped string; ``None`` when it is not a string or is blank."""
+
+    if not isinstance(value, str):
+        return None
+    return value.strip()[:limit] or None
+
+
+def _safe_int(value: object) -> int | None:
+    try:
+        return int(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class BeaconIngest:
+    """Classifies beacon payloads and queues the resulting events.
+
+    ``builders`` maps an event ``type`` to a function returning the stored
+    event (or ``None`` to skip it); payloads of unknown types are ignored.
+    """
+
+    def __init__(
+        self,
+        *,
+        user_agents: UserAgentClassifier,
+        classify_source: SourceClassifier,
+        country_for: Callable[[Any, str | None, str | None], str],
+        canonicalizer: Canonicalizer,
+        guard: IngestGuard,
+        enqueue: Callable[[Sequence[Event]], Any],
+        max_batch_events: int = 50,
+    ) -> None:
+        self.user_agents = user_agents
+        self.classify_source = classify_source
+        self.country_for = country_for
+        self.canonicalizer = canonicalizer
+        self.guard = guard
+        self.enqueue = enqueue
+        self.max_batch_events = int(max_batch_events)
+        self.builders: dict[str, EventBuilder] = {
+            "pageview": self.build_pageview,
+            "vitals": self.build_vitals,
+            "engagement": self.build_engagement,
+        }
+
+    def accepts_origin(self, origin: str | None, beacon: BeaconRequest) -> bool:
+        return not origin or origin.startswith(beacon.host_url.rstrip("/"))
+
+    def handle(self, body: object, beacon: BeaconRequest) -> int:
+        """Build, filter and queue the events in ``body``; returns how many were queued."""
+
+        agent = self.user_agents.classify(beacon.user_agent)
+        if agent.is_bot:
+            return 0
+
+        events: list[Event] = []
+        for payload in extract_beacon_events(body, self.max_batch_events):
+            builder = self.builders.get(str(payload.get("type") or "pageview"))
+            if builder is None:
+                continue
+            event = builder(payload, beacon, agent)
+            if event is not None:
+                events.append(event)
+
+        admitted = self.guard.admit(events, beacon.client_ip)
+        if admitted:
+            self.enqueue(admitted)
+        return len(admitted)
+
+    def build_pageview(
+        self,
+        payload: Mapping[str, Any],
+        beacon: BeaconRequest,
+        agent: UserAgentInfo,
+    ) -> Event | None:
+        url_value = _text(payload.get("url"), MAX_URL_LENGTH)
+        raw_path = _text(payload.get("path"), MAX_URL_LENGTH) or ""
+        if not raw_path and url_value:
+            try:
+                raw_path = urlparse(url_value).path or ""
+            except ValueError:
+                raw_path = ""
+        path = canonical_path(raw_path)
+        if path is not None and path.startswith("/admin"):
+            return None
+
+        referrer_value = _text(payload.get("referrer"), MAX_URL_LENGTH) or beacon.referrer
+
+        language = _text(payload.get("language"))
+        visitor_id = _text(payload.get("visitor_id"), MAX_ID_LENGTH)
+        if not visitor_id:
+            fallback_key = f"{beacon.client_ip}|{beacon.user_agent}"
+            visitor_id = hashlib.sha256(fallback_key.encode("utf-8", "ignore")).hexdigest()[:32]
+
+        session_id = _text(payload.get("session_id"), MAX_ID_LENGTH)
+        if not session_id:
+            now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            session_hash_source = f"{visitor_id}|{payload.get('is_session_start')}|{now}"
+            session_id = hashlib.sha256(session_hash_source.encode("utf-8", "ignore")).hexdigest()[:32]
+
+        traffic_source, utm_source, utm_medium, utm_campaign, referrer_domain = self.classify_source(
+            url_value,
+            referrer_value,
+            beacon.host or "",
+        )
+
+        return {
+            "type": "pageview",
+            "visitor_id": visitor_id,
+            "session_id": session_id,
+            "page_slug": self._page_slug(path, _text(payload.get("page_slug"))),
+            "page_title": canonical_title(_text(payload.get("page_title"))),
+            "path": path,
+            "url": canonical_url(url_value),
+            "referrer": canonical_url(referrer_value),
+            "referrer_domain": referrer_domain,
+            "traffic_source": traffic_source,
+            "utm_source": utm_source,
+            "utm_medium": utm_medium,
+            "utm_campaign": utm_campaign,
+            "device_type": agent.device_type,
+            "device_os": agent.device_os,
+            "browser": agent.browser,
+            "language": language,
+            "country": self.country_for(beacon.headers, beacon.client_ip, language),
+            "timezone": _text(payload.get("timezone")),
+            "screen_width": _safe_int(payload.get("screen_width")),
+            "screen_height": _safe_int(payload.get("screen_height")),
+            "is_session_start": 1 if payload.get("is_session_start") else 0,
+            "created_at": resolve_event_timestamp(payload.get("ts"), payload.get("sent_at")),
+        }
+
+    def build_vitals(
+        self,
+        payload: Mapping[str, Any],
+        beacon: BeaconRequest,
+        agent: UserAgentInfo,
+    ) -> Event | None:
+        path = canonical_path(_text(payload.get("path"), MAX_URL_LENGTH) or "")
+        if path is not None and path.startswith("/admin"):
+            return None
+        metrics = {
+            metric: value
+            for metric in VITAL_METRICS
+            if (value := parse_metric(metric, payload.get(metric))) is not None
+        }
+        if not metrics:
+            return None
+        return {
+            "type": "vitals",
+            "visitor_id": _text(payload.get("visitor_id"), MAX_ID_LENGTH),
+            "page_slug": self._page_slug(path, _text(payload.get("page_slug"))),
+            "device_type": agent.device_type,
+            "created_at": resolve_event_timestamp(payload.get("ts"), payload.get("sent_at")),
+            **metrics,
+        }
+
+    def build_engagement(
+        self,
+        payload: Mapping[str, Any],
+        beacon: BeaconRequest,
+        agent: UserAgentInfo,
+    ) -> Event | None:
+        path = canonical_path(_text(payload.get("path"), MAX_URL_LENGTH) or "")
+        if path is not None and path.startswith("/admin"):
+            return None
+        engaged_ms = parse_engaged_ms(payload.get("engaged_ms"))
+        if engaged_ms is None:
+            return None
+        return {
+            "type": "engagement",
+            "visitor_id": _text(payload.get("visitor_id"), MAX_ID_LENGTH),
+            "page_slug": self._page_slug(path, _text(payload.get("page_slug"))),
+            "created_at": resolve_event_timestamp(payload.get("ts"), payload.get("sent_at")),
+            "engaged_ms": engaged_ms,
+        }
+
+    def _page_slug(self, path: str | None, hint: object) -> str | None:
+        """Slug from the routing table, else the tracker's hint, else the last path segment."""
+
+        slug = self.canonicalizer.slug(path)
+        if slug:
+            return slug
+        if hint:
+            return str(hint).strip().strip("/").lower() or None
+        if path:
+            return path.rsplit("/", 1)[-1] or None
+        return None
+
+
+class IngestApp:
+    """WSGI callable that accepts tracking beacons and always answers 204."""
+
+    def __init__(
+        self,
+        ingest: BeaconIngest,
+        *,
+        trusted_proxies: int = 1,
+        max_body_bytes: int = MAX_BODY_BYTES,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.ingest = ingest
+        self.trusted_proxies = trusted_proxies
+        self.max_body_bytes = max_body_bytes
+        self.logger = logger or logging.getLogger(__name__)
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable[..., Any]) -> Iterable[bytes]:
+        try:
+            self._handle(environ)
+        except Exception:  # a beacon must never surface a server error
+            self.logger.exception("Analytics beacon failed")
+        start_response(_NO_CONTENT, list(_NO_CONTENT_HEADERS))
+        return []
+
+    def _handle(self, environ: dict[str, Any]) -> None:
+        if "json" not in environ.get("CONTENT_TYPE", ""):
+            return
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            return
+        if length <= 0 or length > self.max_body_bytes:
+            return
+
+        beacon = beacon_request_from_environ(environ, trusted_proxies=self.trusted_proxies)
+        if not self.ingest.accepts_origin(environ.get("HTTP_ORIGIN"), beacon):
+            return
+        try:
+            body = json.loads(environ["wsgi.input"].read(length))
+        except ValueError:
+            return
+        self.ingest.handle(body, beacon)
+
+
+class BeaconDispatcher:
+    """Sends ``POST <path>`` to ``ingest_app`` and everything else to ``app``."""
+
+    def __init__(self, app: Callable[..., Any], ingest_app: Callable[..., Any], path: str = "/analytics/track") -> None:
+        self.app = app
+        self.ingest_app = ingest_app
+        self.path = path
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable[..., Any]) -> Iterable[bytes]:
+        if environ.get("PATH_INFO") == self.path and environ.get("REQUEST_METHOD") == "POST":
+            return self.ingest_app(environ, start_response)
+        return self.app(environ, start_response)
@@ -0,0 +1,266 @@
+"""Referrer host to acquisition channel classification.
+
+Known referrer domains live in the ``analytics_referrer_domains`` table so
+admins can extend the list without a deploy. The table is compiled into a
+:class:`ReferrerIndex`, a trie over reversed host labels
+(``m.facebook.com`` -> ``com`` -> ``facebook`` -> ``m``). A lookup walks at
+most one node per label of the referrer host, so its cost does not depend on
+how many domains are registered, and matching is exact on label boundaries:
+``t.co`` matches ``t.co`` and ``www.t.co`` but not ``reddit.com``.
+
+Entries ending in ``.*`` (``google.*``) match the name under one of the
+public suffixes in :data:`WILDCARD_SUFFIXES` (``google.de``,
+``google.co.uk``) and nothing else, so a host such as ``google.evil.com``
+cannot pass itself off as a search engine.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterable
+from datetime import datetime
+from functools import lru_cache
+from typing import Any
+
+SOCIAL = "Social"
+ORGANIC_SEARCH = "Organic Search"
+
+DEFAULT_REFERRER_CHANNELS: dict[str, str] = {
+    # Social networks and messaging
+    "facebook.com": SOCIAL,
+    "fb.com": SOCIAL,
+    "fb.me": SOCIAL,
+    "messenger.com": SOCIAL,
+    "instagram.com": SOCIAL,
+    "threads.net": SOCIAL,
+    "twitter.com": SOCIAL,
+    "x.com": SOCIAL,
+    "t.co": SOCIAL,
+    "linkedin.com": SOCIAL,
+    "lnkd.in": SOCIAL,
+    "youtube.com": SOCIAL,
+    "youtu.be": SOCIAL,
+    "tiktok.com": SOCIAL,
+    "snapchat.com": SOCIAL,
+    "pinterest.com": SOCIAL,
+    "pin.it": SOCIAL,
+    "reddit.com": SOCIAL,
+    "quora.com": SOCIAL,
+    "tumblr.com": SOCIAL,
+    "medium.com": SOCIAL,
+    "discord.com": SOCIAL,
+    "whatsapp.com": SOCIAL,
+    "wa.me": SOCIAL,
+    "telegram.org": SOCIAL,
+    "t.me": SOCIAL,
+    "weibo.com": SOCIAL,
+    "vk.com": SOCIAL,
+    "wechat.com": SOCIAL,
+    "line.me": SOCIAL,
+    "mastodon.social": SOCIAL,
+    "bsky.app": SOCIAL,
+    "xiaohongshu.com": SOCIAL,
+    "student-room.co.uk": SOCIAL,
+    "thestudentroom.co.uk": SOCIAL,
+    "mumsnet.com": SOCIAL,
+    # Search engines
+    "google.*": ORGANIC_SEARCH,
+    "bing.com": ORGANIC_SEARCH,
+    "yahoo.*": ORGANIC_SEARCH,
+    "search.yahoo.com": ORGANIC_SEARCH,
+    "duckduckgo.com": ORGANIC_SEARCH,
+    "baidu.com": ORGANIC_SEARCH,
+    "yandex.*": ORGANIC_SEARCH,
+    "ya.ru": ORGANIC_SEARCH,
+    "ask.com": ORGANIC_SEARCH,
+    "ecosia.org": ORGANIC_SEARCH,
+    "startpage.com": ORGANIC_SEARCH,
+    "qwant.com": ORGANIC_SEARCH,
+    "brave.com": ORGANIC_SEARCH,
+    "search.brave.com": ORGANIC_SEARCH,
+    "naver.com": ORGANIC_SEARCH,
+    "daum.net": ORGANIC_SEARCH,
+    "seznam.cz": ORGANIC_SEARCH,
+    "sogou.com": ORGANIC_SEARCH,
+    "so.com": ORGANIC_SEARCH,
+    "aol.com": ORGANIC_SEARCH,
+    "mojeek.com": ORGANIC_SEARCH,
+    "perplexity.ai": ORGANIC_SEARCH,
+    "chatgpt.com": ORGANIC_SEARCH,
+    "you.com": ORGANIC_SEARCH,
+}
+
+# Public suffixes a ".*" entry may stand for: generic and country-code TLDs
+# plus the common second-level registries under them.
+WILDCARD_SUFFIXES: frozenset[str] = frozenset(
+    (
+        "com net org info biz eu uk ie de fr es it nl be lu at ch pl pt se no dk fi is cz sk "
+        "hu ro bg gr hr si rs lt lv ee ua ru by kz tr il ae sa qa eg ma ng ke za in pk bd lk "
+        "cn hk tw jp kr sg my id ph th vn au nz ca us mx br ar cl co pe ve "
+        "co.uk org.uk ac.uk co.jp co.kr co.in co.id co.il co.nz co.th co.za co.ke com.au "
+        "com.br com.mx com.ar com.co com.pe com.tr com.sg com.hk com.tw com.my com.ph com.pk "
+        "com.bd com.eg com.sa com.ng com.ua com.vn com.cn"
+    ).split()
+)
+
+_TERMINAL = ""
+_WILDCARD = "*"
+
+
+def normalise_domain(value: str) -> str:
+    domain = (value or "").strip().lower().rstrip(".")
+    if "://" in domain:
+        domain = domain.split("://", 1)[1]
+    domain = domain.split("/", 1)[0].split(":", 1)[0]
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain
+
+
+class ReferrerIndex:
+    """Reversed-label suffix trie mapping referrer hosts to channels."""
+
+    def __init__(
+        self,
+        entries: Iterable[tuple[str, str]],
+        *,
+        wildcard_suffixes: frozenset[str] = WILDCARD_SUFFIXES,
+    ) -> None:
+        self.wildcard_suffixes = wildcard_suffixes
+        self._root: dict[str, Any] = {}
+        self.size = 0
+        for domain, channel in entries:
+            labels = normalise_domain(domain).split(".")
+            if not labels or not all(labels):
+                continue
+            node = self._root
+            for label in reversed(labels):
+                node = node.setdefault(label, {})
+            node[_TERMINAL] = channel
+            self.size += 1
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    @staticmethod
+    def _walk(node: dict[str, Any], labels: list[str]) -> tuple[int, str | None]:
+        depth = 0
+        best: tuple[int, str | None] = (0, None)
+        for label in labels:
+            node = node.get(label)  # type: ignore[assignment]
+            if node is None:
+                break
+            depth += 1
+            if _TERMINAL in node:
+                best = (depth, node[_TERMINAL])
+        return best
+
+    def _lookup(self, host: str) -> str | None:
+        labels = list(reversed(normalise_domain(host).split(".")))
+        depth, channel = self._walk(self._root, labels)
+        wildcard = self._root.get(_WILDCARD)
+        if wildcard is not None:
+            # "*" stands in for a one- or two-label public suffix.
+            for suffix_labels in (1, 2):
+                if len(labels) <= suffix_labels:
+                    break
+                if ".".join(reversed(labels[:suffix_labels])) not in self.wildcard_suffixes:
+                    continue
+                matched, candidate = self._walk(wildcard, labels[suffix_labels:])
+                if candidate is not None and matched + suffix_labels > depth:
+                    depth, channel = matched + suffix_labels, candidate
+        return channel
+
+
+def ensure_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_referrer_domains (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            domain TEXT NOT NULL UNIQUE,
+            channel TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    if conn.execute("SELECT 1 FROM analytics_referrer_domains LIMIT 1").fetchone() is None:
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO analytics_referrer_domains (domain, channel, created_at, updated_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(domain, channel, now, now) for domain, channel in DEFAULT_REFERRER_CHANNELS.items()],
+        )
+
+
+def _signature(conn: sqlite3.Connection) -> tuple[Any, ...]:
+    row = conn.execute(
+        "SELECT COUNT(*), MAX(id), MAX(updated_at) FROM analytics_referrer_domains"
+    ).fetchone()
+    return tuple(row)
+
+
+class ReferrerClassifier:
+    """Worker-level cache of the referrer index that reloads when the table changes.
+
+    The table signature (row count, max id, last update) is checked at most
+    every ``refresh_seconds``; :meth:`invalidate` forces a reload on the next
+    lookup, which admin edits in the same worker use.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        *,
+        refresh_seconds: float = 30.0,
+    ) -> None:
+        self.connect = connect
+        self.refresh_seconds = refresh_seconds
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._index: ReferrerIndex | None = None
+        self._signature: tuple[Any, ...] | None = None
+        self._checked_at = 0.0
+
+    def invalidate(self) -> None:
+        self._checked_at = 0.0
+        self._signature = None
+
+    def _refresh(self) -> ReferrerIndex:
+        with self._lock:
+            now = time.monotonic()
+            if self._index is not None and now - self._checked_at < self.refresh_seconds:
+                return self._index
+            conn: sqlite3.Connection | None = None
+            try:
+                conn = self.connect()
+                signature = _signature(conn)
+                if self._index is None or signature != self._signature:
+                    rows = conn.execute(
+                        "SELECT domain, channel FROM analytics_referrer_domains"
+                    ).fetchall()
+                    self._index = ReferrerIndex((row[0], row[1]) for row in rows)
+                    self._signature = signature
+                    self.reloads += 1
+            except sqlite3.Error:
+                if self._index is None:
+                    self._index = ReferrerIndex(DEFAULT_REFERRER_CHANNELS.items())
+            finally:
+                if conn is not None:
+                    conn.close()
+            self._checked_at = now
+            return self._index
+
+    def channel_for(self, host: str | None) -> str | None:
+        if not host:
+            return None
+        return self._refresh().lookup(host)
+
+    def stats(self) -> dict[str, Any]:
+        index = self._index
+        if index is None:
+            return {"domains": 0, "reloads": self.reloads, "hits": 0, "misses": 0}
+        info = index.lookup.cache_info()
+        return {"domains": index.size, "reloads": self.reloads, "hits": info.hits, "misses": info.misses}
@@ -0,0 +1,277 @@
+"""Queries behind the admin analytics report, answered from the daily roll-ups.
+
+Every function takes an inclusive range of UTC day numbers and reads
+``analytics_rollup_daily`` / ``analytics_rollup_breakdowns`` (see
+:mod:`analytics.rollups`), so its cost grows with the number of days in the
+range, not with the traffic in it. Labels for dimension-value ids are
+joined from ``analytics_dimension_values`` only for the rows returned.
+
+Unique visitor counts over a range are the one figure the roll-ups cannot
+add up. By default they are estimated by merging the range's per-day
+HyperLogLog sketches (relative standard error :data:`UNIQUE_VISITORS_ERROR`);
+with ``exact=True`` they are counted from ``analytics_sessions`` (one row
+per session, indexed on its start time) instead.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Any
+
+from .rollups import DAILY_COLUMNS, SECONDS_PER_DAY, SKETCH_PRECISION
+from .sketches import HyperLogLog
+
+# Page-view breakdowns shown on the report and how many rows each keeps.
+BREAKDOWN_LIMITS: dict[str, int | None] = {
+    "device_type": None,
+    "device_os": None,
+    "browser": 8,
+    "traffic_source": None,
+    "timezone": 8,
+}
+TOP_LIMIT = 10
+UNIQUE_VISITORS_ERROR = HyperLogLog(SKETCH_PRECISION).relative_error
+
+
+def _sketch_counts(conn: sqlite3.Connection, dimension: str, start_day: int, end_day: int) -> dict[int, int]:
+    """Estimated unique visitors per sketch key over the range."""
+
+    days: dict[int, list[HyperLogLog]] = {}
+    cursor = conn.execute(
+        """
+        SELECT key1, sketch FROM analytics_rollup_sketches
+        WHERE dimension = ? AND day BETWEEN ? AND ?
+        """,
+        (dimension, start_day, end_day),
+    )
+    for key1, blob in cursor:
+        days.setdefault(key1, []).append(HyperLogLog.from_bytes(blob))
+    return {key1: HyperLogLog.union(sketches, SKETCH_PRECISION).count() for key1, sketches in days.items()}
+
+
+def summed_counters(conn: sqlite3.Connection, start_day: int, end_day: int) -> dict[str, int]:
+    """Daily counters summed over the range, without the per-day ``visitors``."""
+
+    row = conn.execute(
+        f"""
+        SELECT {", ".join(f"COALESCE(SUM({column}), 0)" for column in DAILY_COLUMNS)}
+        FROM analytics_rollup_daily
+        WHERE day BETWEEN ? AND ?
+        """,
+        (start_day, end_day),
+    ).fetchone()
+    totals = dict(zip(DAILY_COLUMNS, row))
+    totals.pop("visitors")
+    return totals
+
+
+def period_totals(conn: sqlite3.Connection, start_day: int, end_day: int, *, exact: bool = False) -> dict[str, int]:
+    """Summed daily counters plus unique visitors for the range."""
+
+    totals = summed_counters(conn, start_day, end_day)
+    if not exact:
+        totals["unique_visitors"] = _sketch_counts(conn, "all", start_day, end_day).get(0, 0)
+        return totals
+    totals["unique_visitors"] = conn.execute(
+        """
+        SELECT COUNT(DISTINCT visitor_id) FROM analytics_sessions
+        WHERE started_ts >= ? AND started_ts < ?
+        """,
+        (start_day * SECONDS_PER_DAY, (end_day + 1) * SECONDS_PER_DAY),
+    ).fetchone()[0]
+    return totals
+
+
+def daily_series(conn: sqlite3.Connection, start_day: int, end_day: int) -> dict[int, dict[str, int]]:
+    """Daily counters keyed by day; ``visitors`` is that day's unique visitors."""
+
+    rows = conn.execute(
+        f"SELECT day, {', '.join(DAILY_COLUMNS)} FROM analytics_rollup_daily WHERE day BETWEEN ? AND ?",
+        (start_day, end_day),
+    ).fetchall()
+    return {row[0]: dict(zip(DAILY_COLUMNS, row[1:])) for row in rows}
+
+
+def hourly(conn: sqlite3.Connection, start_day: int, end_day: int) -> list[int]:
+    """Page views per UTC hour of day (24 values)."""
+
+    values = [0] * 24
+    for hour, views in conn.execute(
+        """
+        SELECT key1, SUM(page_views) FROM analytics_rollup_breakdowns
+        WHERE dimension = 'hour' AND day BETWEEN ? AND ?
+        GROUP BY key1
+        """,
+        (start_day, end_day),
+    ):
+        values[hour] = views
+    return values
+
+
+def breakdown(
+    conn: sqlite3.Connection,
+    dimension: str,
+    start_day: int,
+    end_day: int,
+    *,
+    limit: int | None = None,
+) -> list[dict[str, Any]]:
+    """Page views per value of a single-key breakdown, busiest first."""
+
+    rows = conn.execute(
+        f"""
+        SELECT d.value, t.page_views
+        FROM (
+            SELECT key1, SUM(page_views) AS page_views
+            FROM analytics_rollup_breakdowns
+            WHERE dimension = ? AND day BETWEEN ? AND ?
+            GROUP BY key1
+            ORDER BY page_views DESC
+            {"LIMIT ?" if limit else ""}
+        ) AS t
+        LEFT JOIN analytics_dimension_values AS d ON d.id = t.key1
+        ORDER BY t.page_views DESC
+        """,
+        (dimension, start_day, end_day, *((limit,) if limit else ())),
+    ).fetchall()
+    return [{"value": value, "page_views": views} for value, views in rows]
+
+
+def referrers(conn: sqlite3.Connection, start_day: int, end_day: int, *, limit: int = 10) -> list[dict[str, Any]]:
+    """Page views per referrer domain (or channel when there is none)."""
+
+    rows = conn.execute(
+        """
+        SELECT
+            COALESCE(referrer.value, source.value) AS domain,
+            source.value AS traffic_source,
+            SUM(t.page_views) AS page_views
+        FROM (
+            SELECT key1, key2, SUM(page_views) AS page_views
+            FROM analytics_rollup_breakdowns
+            WHERE dimension = 'referrer' AND day BETWEEN ? AND ?
+            GROUP BY key1, key2
+        ) AS t
+        LEFT JOIN analytics_dimension_values AS referrer ON referrer.id = t.key1
+        LEFT JOIN analytics_dimension_values AS source ON source.id = t.key2
+        GROUP BY domain, traffic_source
+        ORDER BY page_views DESC
+        LIMIT ?
+        """,
+        (start_day, end_day, limit),
+    ).fetchall()
+    return [{"domain": domain, "traffic_source": source, "page_views": views} for domain, source, views in rows]
+
+
+def top_pages(conn: sqlite3.Connection, start_day: int, end_day: int, *, limit: int = 10) -> list[dict[str, Any]]:
+    """Page views and viewing sessions per (slug, title, path)."""
+
+    rows = conn.execute(
+        """
+        SELECT slug.value, title.value, path.value, t.page_views, t.sessions
+        FROM (
+            SELECT key1, key2, key3, SUM(page_views) AS page_views, SUM(sessions) AS sessions
+            FROM analytics_rollup_breakdowns
+            WHERE dimension = 'page' AND day BETWEEN ? AND ?
+            GROUP BY key1, key2, key3
+            ORDER BY page_views DESC
+            LIMIT ?
+        ) AS t
+        LEFT JOIN analytics_dimension_values AS slug ON slug.id = t.key1
+        LEFT JOIN analytics_dimension_values AS title ON title.id = t.key2
+        LEFT JOIN analytics_dimension_values AS path ON path.id = t.key3
+        ORDER BY t.page_views DESC
+        """,
+        (start_day, end_day, limit),
+    ).fetchall()
+    return [
+        {"page_slug": slug, "page_title": title, "path": path, "page_views": views, "sessions": sessions}
+        for slug, title, path, views, sessions in rows
+    ]
+
+
+def session_pages(
+    conn: sqlite3.Connection,
+    kind: str,
+    start_day: int,
+    end_day: int,
+    *,
+    limit: int = 8,
+) -> list[dict[str, Any]]:
+    """Sessions and single-page sessions per landing (``kind="landing"``) or exit page."""
+
+    rows = conn.execute(
+        """
+        SELECT slug.value, path.value, t.sessions, t.single_page_sessions
+        FROM (
+            SELECT key1, key2, SUM(sessions) AS sessions, SUM(single_page_sessions) AS single_page_sessions
+            FROM analytics_rollup_breakdowns
+            WHERE dimension = ? AND day BETWEEN ? AND ?
+            GROUP BY key1, key2
+            HAVING SUM(sessions) > 0
+            ORDER BY sessions DESC
+            LIMIT ?
+        ) AS t
+        LEFT JOIN analytics_dimension_values AS slug ON slug.id = t.key1
+        LEFT JOIN analytics_dimension_values AS path ON path.id = t.key2
+        ORDER BY t.sessions DESC
+        """,
+        (kind, start_day, end_day, limit),
+    ).fetchall()
+    return [
+        {"page_slug": slug, "path": path, "sessions": sessions, "single_page_sessions": single}
+        for slug, path, sessions, single in rows
+    ]
+
+
+def countries(
+    conn: sqlite3.Connection,
+    start_day: int,
+    end_day: int,
+    *,
+    limit: int = 10,
+    exact: bool = False,
+) -> list[dict[str, Any]]:
+    """Page views per country, with unique visitors of the sessions that started there."""
+
+    rows = breakdown(conn, "country", start_day, end_day, limit=limit)
+    if not exact:
+        counts = _sketch_counts(conn, "country", start_day, end_day)
+        labels = dict(
+            conn.execute(
+                f"SELECT id, value FROM analytics_dimension_values WHERE id IN ({', '.join('?' for _ in counts)})",
+                list(counts),
+            ).fetchall()
+        )
+        visitors = {labels.get(key1): count for key1, count in counts.items()}
+    else:
+        visitors = dict(
+            conn.execute(
+                """
+                SELECT d.value, COUNT(DISTINCT s.visitor_id)
+                FROM analytics_sessions AS s
+                LEFT JOIN analytics_dimension_values AS d ON d.id = s.country_id
+                WHERE s.started_ts >= ? AND s.started_ts < ?
+                GROUP BY s.country_id
+                """,
+                (start_day * SECONDS_PER_DAY, (end_day + 1) * SECONDS_PER_DAY),
+            ).fetchall()
+        )
+    for row in rows:
+        row["unique_visitors"] = visitors.get(row["value"], 0)
+    return rows
+
+
+def event_report(conn: sqlite3.Connection, start_day: int, end_day: int, *, exact: bool = False) -> dict[str, Any]:
+    """Every page-view breakdown the report shows, in the shape :mod:`analytics.columnar` also returns."""
+
+    return {
+        "hourly": hourly(conn, start_day, end_day),
+        "breakdowns": {
+            dimension: breakdown(conn, dimension, start_day, end_day, limit=limit)
+            for dimension, limit in BREAKDOWN_LIMITS.items()
+        },
+        "top_pages": top_pages(conn, start_day, end_day, limit=TOP_LIMIT),
+        "referrers": referrers(conn, start_day, end_day, limit=TOP_LIMIT),
+        "countries": countries(conn, start_day, end_day, limit=TOP_LIMIT, exact=exact),
+    }
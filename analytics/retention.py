@@ -0,0 +1,300 @@
+"""Tiered retention for raw analytics events.
+
+Raw events older than the retention window go through four steps, one UTC
+day at a time:
+
+1. **Check** that the report roll-ups of :mod:`analytics.rollups` match the
+   day's raw rows, rebuilding the day when they do not. Once the raw rows
+   are gone those roll-ups are all the report has for the day.
+2. **Archive** the day's rows, with their text values from
+   ``analytics_events_wide``, to a gzip JSON-lines file under the archive
+   directory. The file is fsynced before its row goes into
+   ``analytics_archives``, which records the day and the id range it covers.
+3. **Prune** the archived id range from ``analytics_events`` in bounded
+   batches, each batch in its own short transaction.
+4. **Vacuum** incrementally, so freed pages are handed back to the file
+   system instead of lingering on the free list. Analytics databases that
+   predate ``auto_vacuum = INCREMENTAL`` are only converted, with one full
+   ``VACUUM``, when asked to (``full_vacuum=True``).
+
+A crash at any point is safe to re-run: the next archive for a day only
+picks up ids above the last archived id, and pruning only removes ids that
+an archive already covers. :func:`restore_day` loads an archived day back
+into the live table.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import sqlite3
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from . import rollups
+
+EventWriter = Callable[[sqlite3.Connection, Iterable[Mapping[str, Any]]], Any]
+
+_EPOCH = date(1970, 1, 1)
+
+
+def day_number(value: date) -> int:
+    return (value - _EPOCH).days
+
+
+def day_date(day: int) -> date:
+    return _EPOCH + timedelta(days=day)
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    # Daily aggregates written by earlier versions; analytics_rollup_* replaced them.
+    conn.execute("DROP TABLE IF EXISTS analytics_daily_totals")
+    conn.execute("DROP TABLE IF EXISTS analytics_daily_dimensions")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_archives (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            day INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            events INTEGER NOT NULL,
+            first_event_id INTEGER NOT NULL,
+            last_event_id INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_archives_day ON analytics_archives(day)")
+
+
+def ensure_rolled_up(conn: sqlite3.Connection, day: int) -> bool:
+    """Rebuild the report roll-ups of ``day`` unless they match its raw events.
+
+    Returns whether the day had to be rebuilt.
+    """
+
+    if not any(rollups.check(conn, day, day).values()):
+        return False
+    rollups.rebuild(conn, day, day)
+    return True
+
+
+@dataclass
+class ArchiveRecord:
+    path: Path
+    events: int
+    first_event_id: int
+    last_event_id: int
+
+
+def archive_day(conn: sqlite3.Connection, directory: str | os.PathLike[str], day: int) -> ArchiveRecord | None:
+    """Write the not-yet-archived rows of ``day`` to a new gzip JSON-lines file."""
+
+    row = conn.execute(
+        "SELECT COALESCE(MAX(last_event_id), 0) FROM analytics_archives WHERE day = ?",
+        (day,),
+    ).fetchone()
+    after_id = row[0]
+    cursor = conn.execute(
+        "SELECT * FROM analytics_events_wide WHERE created_day = ? AND id > ? ORDER BY id",
+        (day, after_id),
+    )
+    columns = [description[0] for description in cursor.description]
+
+    stamp = day_date(day)
+    target_dir = Path(directory) / f"{stamp:%Y}"
+    target_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = target_dir / f".{stamp:%Y-%m-%d}-{os.getpid()}.tmp"
+
+    events = 0
+    first_id = last_id = 0
+    with open(temp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for values in rows:
+                    record = dict(zip(columns, values))
+                    if not events:
+                        first_id = record["id"]
+                    last_id = record["id"]
+                    events += 1
+                    archive.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    if not events:
+        temp_path.unlink(missing_ok=True)
+        return None
+
+    final_path = target_dir / f"{stamp:%Y-%m-%d}-{last_id}.jsonl.gz"
+    temp_path.replace(final_path)
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO analytics_archives (day, path, events, first_event_id, last_event_id, bytes, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                day,
+                str(final_path.relative_to(directory)),
+                events,
+                first_id,
+                last_id,
+                final_path.stat().st_size,
+                datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+    return ArchiveRecord(final_path, events, first_id, last_id)
+
+
+def prune_day(conn: sqlite3.Connection, day: int, *, batch_size: int = 5000) -> int:
+    """Delete raw rows of ``day`` that an archive already covers."""
+
+    row = conn.execute(
+        "SELECT MAX(last_event_id) FROM analytics_archives WHERE day = ?",
+        (day,),
+    ).fetchone()
+    if row[0] is None:
+        return 0
+    deleted = 0
+    while True:
+        with conn:
+            cursor = conn.execute(
+                """
+                DELETE FROM analytics_events
+                WHERE id IN (
+                    SELECT id FROM analytics_events
+                    WHERE created_day = ? AND id <= ?
+                    LIMIT ?
+                )
+                """,
+                (day, row[0], batch_size),
+            )
+        if cursor.rowcount <= 0:
+            return deleted
+        deleted += cursor.rowcount
+
+
+def incremental_vacuum(conn: sqlite3.Connection, *, convert: bool = False) -> int | None:
+    """Return free pages to the file system; returns the number of pages released.
+
+    Databases created by :func:`analytics.storage.connect` use
+    ``auto_vacuum = INCREMENTAL`` from the start. An older file only switches
+    after one full ``VACUUM``, which rewrites it under an exclusive lock, so
+    that only happens with ``convert=True``; otherwise ``None`` is returned.
+    """
+
+    conn.commit()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        if not convert:
+            return None
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute("VACUUM")
+        return before
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.execute("PRAGMA incremental_vacuum").fetchall()
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+@dataclass
+class RetentionResult:
+    days: list[int] = field(default_factory=list)
+    rebuilt_days: list[int] = field(default_factory=list)
+    archived_events: int = 0
+    deleted_events: int = 0
+    archive_files: list[Path] = field(default_factory=list)
+    pages_released: int = 0
+    # Set when the database still needs its one-off full VACUUM (``full_vacuum=True``).
+    needs_full_vacuum: bool = False
+
+
+def run_retention(
+    conn: sqlite3.Connection,
+    directory: str | os.PathLike[str],
+    *,
+    retain_days: int,
+    batch_size: int = 5000,
+    vacuum: bool = True,
+    full_vacuum: bool = False,
+    today: date | None = None,
+) -> RetentionResult:
+    """Check the roll-ups of, archive and prune every day older than ``retain_days``."""
+
+    ensure_tables(conn)
+    rollups.ensure_tables(conn)
+    conn.commit()
+    # Beacons can be back-dated by up to a day, so the newest two days are
+    # never treated as complete.
+    retain_days = max(int(retain_days), 2)
+    cutoff_day = day_number(today or datetime.utcnow().date()) - retain_days
+
+    result = RetentionResult()
+    days = [
+        row[0]
+        for row in conn.execute(
+            "SELECT DISTINCT created_day FROM analytics_events WHERE created_day < ? ORDER BY created_day",
+            (cutoff_day,),
+        ).fetchall()
+    ]
+    for day in days:
+        if ensure_rolled_up(conn, day):
+            result.rebuilt_days.append(day)
+        record = archive_day(conn, directory, day)
+        if record is not None:
+            result.archived_events += record.events
+            result.archive_files.append(record.path)
+        result.deleted_events += prune_day(conn, day, batch_size=batch_size)
+        result.days.append(day)
+
+    if full_vacuum or (vacuum and result.deleted_events):
+        released = incremental_vacuum(conn, convert=full_vacuum)
+        result.pages_released = released or 0
+        result.needs_full_vacuum = released is None
+    return result
+
+
+def restore_day(
+    conn: sqlite3.Connection,
+    directory: str | os.PathLike[str],
+    day: int,
+    write_events: EventWriter,
+) -> int:
+    """Load every archive of ``day`` back into ``analytics_events``.
+
+    The archive files and their index rows are removed once the events are
+    committed, so the next retention run archives the day afresh instead of
+    writing duplicates.
+    """
+
+    ensure_tables(conn)
+    archives = conn.execute(
+        "SELECT id, path FROM analytics_archives WHERE day = ? ORDER BY last_event_id",
+        (day,),
+    ).fetchall()
+    if not archives:
+        return 0
+    events: list[dict[str, Any]] = []
+    for _, relative_path in archives:
+        with gzip.open(Path(directory) / relative_path, "rt", encoding="utf-8") as handle:
+            events.extend(json.loads(line) for line in handle if line.strip())
+    for event in events:
+        event.pop("id", None)
+    # One write_events call for the whole day keeps the interner's cache
+    # consistent if the transaction rolls back.
+    with conn:
+        restored = write_events(conn, events) or 0
+        conn.executemany(
+            "DELETE FROM analytics_archives WHERE id = ?",
+            [(archive_id,) for archive_id, _ in archives],
+        )
+    for _, relative_path in archives:
+        (Path(directory) / relative_path).unlink(missing_ok=True)
+    return restored
+
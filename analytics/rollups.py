@@ -0,0 +1,599 @@
+"""Incrementally maintained daily roll-ups behind the admin analytics report.
+
+These tables hold everything the report shows, one row per UTC day (and
+breakdown key), so a report costs a ``SUM`` over the days in its range
+rather than a scan of the events in it:
+
+* ``analytics_rollup_daily``: page views, sessions, single-page sessions,
+  unique visitors and new visitors per day;
+* ``analytics_rollup_breakdowns``: per day, ``dimension`` and up to three
+  dimension-value ids (``key1``..``key3``, 0 when missing), the page views,
+  sessions and single-page sessions of that breakdown row;
+* ``analytics_rollup_cube``: page views per day and combination of
+  :data:`CUBE_COLUMNS`, for drill-downs that filter on several of them at
+  once (:mod:`analytics.drilldown`).
+
+Page-view counters are added as each batch of events is written
+(:func:`apply_pageviews`). Session counters follow the session rows: the
+writer snapshots the sessions and visitors a batch touches before and after
+upserting them and :func:`apply_sessions` / :func:`apply_visitors` add the
+difference, so a session that gains a second page view moves from "single
+page" to "multi page" and its exit page moves with it.
+
+Sessions and page sessions (how many sessions viewed a page) are both
+credited to the day the session started (``analytics_sessions.started_ts``);
+an event arriving late with an earlier timestamp moves them.
+:func:`rebuild` recomputes a range of days from raw events and
+``analytics_sessions``; :func:`check` compares the stored rows with a fresh
+computation without changing anything.
+
+Distinct visitors cannot be added up across days, so
+``analytics_rollup_sketches`` keeps a :class:`~analytics.sketches.HyperLogLog`
+of the visitors who started a session on each day, overall (``all``) and
+per session country. A range's unique visitors are the merged sketches of
+its days. A sketch only grows: a session whose start moves to an earlier
+day (a late event) leaves its visitor in the old day's sketch as well,
+which :func:`rebuild` cleans up.
+
+``analytics_rollup_version`` holds a single counter that every write batch
+and rebuild increments in its own transaction. Anything derived from the
+analytics tables (such as a cached report) is current as long as the
+counter it was computed at is.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any
+
+from .sketches import HyperLogLog
+
+SECONDS_PER_DAY = 86_400
+
+# Breakdowns counted per page view, with the event columns that key them.
+PAGEVIEW_BREAKDOWNS: dict[str, tuple[str, ...]] = {
+    "device_type": ("device_type_id",),
+    "device_os": ("device_os_id",),
+    "browser": ("browser_id",),
+    "traffic_source": ("traffic_source_id",),
+    "country": ("country_id",),
+    "timezone": ("timezone_id",),
+    "referrer": ("referrer_domain_id", "traffic_source_id"),
+    "page": ("page_slug_id", "page_title_id", "path_id"),
+}
+
+# Breakdowns counted per session, with the session columns that key them.
+SESSION_BREAKDOWNS: dict[str, tuple[str, ...]] = {
+    "landing": ("landing_slug_id", "landing_path_id"),
+    "exit": ("exit_slug_id", "exit_path_id"),
+}
+
+# Event columns keying the drill-down cube: every combination seen on a day.
+CUBE_COLUMNS: tuple[str, ...] = ("traffic_source_id", "country_id", "device_type_id", "path_id")
+
+DAILY_COLUMNS: tuple[str, ...] = ("page_views", "sessions", "single_page_sessions", "visitors", "new_visitors")
+BREAKDOWN_COLUMNS: tuple[str, ...] = ("page_views", "sessions", "single_page_sessions")
+BREAKDOWN_KEY: tuple[str, ...] = ("day", "dimension", "key1", "key2", "key3")
+
+# Visitor sketches kept per day: overall and per value of a session column.
+SKETCH_DIMENSIONS: dict[str, str | None] = {"all": None, "country": "country_id"}
+SKETCH_PRECISION = 12
+
+_SESSION_SNAPSHOT: tuple[str, ...] = (
+    "session_id",
+    "visitor_id",
+    "started_day",
+    "page_views",
+    *(column for columns in SESSION_BREAKDOWNS.values() for column in columns),
+    *(column for column in SKETCH_DIMENSIONS.values() if column),
+)
+
+_UPSERT_DAILY_SQL = (
+    f"INSERT INTO analytics_rollup_daily (day, {', '.join(DAILY_COLUMNS)}) "
+    f"VALUES (?, {', '.join('?' for _ in DAILY_COLUMNS)}) "
+    "ON CONFLICT (day) DO UPDATE SET "
+    + ", ".join(f"{column} = {column} + excluded.{column}" for column in DAILY_COLUMNS)
+)
+
+_UPSERT_CUBE_SQL = (
+    f"INSERT INTO analytics_rollup_cube (day, {', '.join(CUBE_COLUMNS)}, page_views) "
+    f"VALUES (?, {', '.join('?' for _ in CUBE_COLUMNS)}, ?) "
+    f"ON CONFLICT (day, {', '.join(CUBE_COLUMNS)}) DO UPDATE SET page_views = page_views + excluded.page_views"
+)
+
+_UPSERT_BREAKDOWN_SQL = (
+    f"INSERT INTO analytics_rollup_breakdowns ({', '.join(BREAKDOWN_KEY)}, {', '.join(BREAKDOWN_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in BREAKDOWN_KEY + BREAKDOWN_COLUMNS)}) "
+    f"ON CONFLICT ({', '.join(BREAKDOWN_KEY)}) DO UPDATE SET "
+    + ", ".join(f"{column} = {column} + excluded.{column}" for column in BREAKDOWN_COLUMNS)
+)
+
+
+def _create_tables(conn: sqlite3.Connection, prefix: str = "") -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {prefix}analytics_rollup_daily (
+            day INTEGER PRIMARY KEY,
+            {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in DAILY_COLUMNS)}
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {prefix}analytics_rollup_breakdowns (
+            day INTEGER NOT NULL,
+            dimension TEXT NOT NULL,
+            key1 INTEGER NOT NULL,
+            key2 INTEGER NOT NULL,
+            key3 INTEGER NOT NULL,
+            {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in BREAKDOWN_COLUMNS)},
+            PRIMARY KEY (dimension, day, key1, key2, key3)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {prefix}analytics_rollup_cube (
+            day INTEGER NOT NULL,
+            {", ".join(f"{column} INTEGER NOT NULL" for column in CUBE_COLUMNS)},
+            page_views INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, {", ".join(CUBE_COLUMNS)})
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    """Create the roll-up tables, filling them from existing data the first time."""
+
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_rollup_daily'"
+    ).fetchone()
+    cube_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_rollup_cube'"
+    ).fetchone()
+    _create_tables(conn)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_rollup_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO analytics_rollup_version (id, version) VALUES (1, 0)")
+    sketches_exist = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_rollup_sketches'"
+    ).fetchone()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_rollup_sketches (
+            day INTEGER NOT NULL,
+            dimension TEXT NOT NULL,
+            key1 INTEGER NOT NULL,
+            sketch BLOB NOT NULL,
+            PRIMARY KEY (dimension, day, key1)
+        ) WITHOUT ROWID
+        """
+    )
+    if exists is None:
+        rebuild(conn)
+        return
+    if cube_exists is None:
+        # Only days that still have raw events can be filled in.
+        bounds = default_range(conn)
+        if bounds is not None:
+            with conn:
+                _compute_cube(conn, "", *bounds)
+    if sketches_exist is None:
+        # Sessions outlive raw events, so sketch every day that has sessions.
+        first, last = conn.execute("SELECT MIN(started_day), MAX(started_day) FROM analytics_sessions").fetchone()
+        if first is not None:
+            with conn:
+                _rebuild_sketches(conn, first, last)
+
+
+def bump_version(conn: sqlite3.Connection) -> None:
+    conn.execute("UPDATE analytics_rollup_version SET version = version + 1 WHERE id = 1")
+
+
+def version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT version FROM analytics_rollup_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def _keys(row: Mapping[str, Any], columns: Sequence[str]) -> tuple[int, ...]:
+    values = [row[column] or 0 for column in columns]
+    return tuple(values + [0] * (3 - len(values)))
+
+
+def _write(
+    conn: sqlite3.Connection,
+    daily: Mapping[int, list[int]],
+    breakdowns: Mapping[tuple[Any, ...], list[int]],
+    cube: Mapping[tuple[int, ...], int] | None = None,
+) -> None:
+    conn.executemany(
+        _UPSERT_DAILY_SQL,
+        [(day, *values) for day, values in daily.items() if any(values)],
+    )
+    conn.executemany(
+        _UPSERT_BREAKDOWN_SQL,
+        [(*key, *values) for key, values in breakdowns.items() if any(values)],
+    )
+    if cube:
+        conn.executemany(_UPSERT_CUBE_SQL, [(*key, page_views) for key, page_views in cube.items()])
+
+
+def _sketch_keys(row: Mapping[str, Any]) -> list[tuple[int, str, int]]:
+    return [
+        (row["started_day"], dimension, (row[column] or 0) if column else 0)
+        for dimension, column in SKETCH_DIMENSIONS.items()
+    ]
+
+
+def _add_to_sketches(conn: sqlite3.Connection, additions: Mapping[tuple[int, str, int], set[str]]) -> None:
+    updates = []
+    for (day, dimension, key1), visitor_ids in additions.items():
+        row = conn.execute(
+            "SELECT sketch FROM analytics_rollup_sketches WHERE dimension = ? AND day = ? AND key1 = ?",
+            (dimension, day, key1),
+        ).fetchone()
+        sketch = HyperLogLog.from_bytes(row[0]) if row else HyperLogLog(SKETCH_PRECISION)
+        registers = bytes(sketch.registers)
+        sketch.update(visitor_ids)
+        if row is None or sketch.registers != registers:
+            updates.append((day, dimension, key1, sketch.to_bytes()))
+    conn.executemany(
+        "INSERT OR REPLACE INTO analytics_rollup_sketches (day, dimension, key1, sketch) VALUES (?, ?, ?, ?)",
+        updates,
+    )
+
+
+def _rebuild_sketches(conn: sqlite3.Connection, start_day: int, end_day: int) -> None:
+    conn.execute("DELETE FROM analytics_rollup_sketches WHERE day BETWEEN ? AND ?", (start_day, end_day))
+    columns = [column for column in SKETCH_DIMENSIONS.values() if column]
+    sketches: dict[tuple[int, str, int], HyperLogLog] = {}
+    cursor = conn.execute(
+        f"""
+        SELECT visitor_id, started_day, {", ".join(columns)} FROM analytics_sessions
+        WHERE started_day BETWEEN ? AND ? AND visitor_id IS NOT NULL
+        """,
+        (start_day, end_day),
+    )
+    for values in cursor:
+        row = dict(zip(("visitor_id", "started_day", *columns), values))
+        for key in _sketch_keys(row):
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = HyperLogLog(SKETCH_PRECISION)
+            sketch.add(row["visitor_id"])
+    conn.executemany(
+        "INSERT INTO analytics_rollup_sketches (day, dimension, key1, sketch) VALUES (?, ?, ?, ?)",
+        [(*key, sketch.to_bytes()) for key, sketch in sketches.items()],
+    )
+
+
+def apply_pageviews(conn: sqlite3.Connection, events: Iterable[Mapping[str, Any]]) -> None:
+    """Count a batch of page views; call before the batch is inserted.
+
+    ``events`` are stored rows keyed by column name (``created_ts``,
+    ``created_day``, ``session_id`` and the ``<dimension>_id`` columns).
+    """
+
+    daily: dict[int, list[int]] = {}
+    breakdowns: dict[tuple[Any, ...], list[int]] = {}
+    cube: dict[tuple[int, ...], int] = {}
+    # Earliest day and pages of each session in the batch.
+    batch_sessions: dict[str, tuple[int, set[tuple[int, ...]]]] = {}
+    for event in events:
+        day = event["created_day"]
+        daily.setdefault(day, [0] * len(DAILY_COLUMNS))[0] += 1
+        cube_key = (day, *(event[column] or 0 for column in CUBE_COLUMNS))
+        cube[cube_key] = cube.get(cube_key, 0) + 1
+        hour = (event["created_ts"] % SECONDS_PER_DAY) // 3600
+        breakdowns.setdefault((day, "hour", hour, 0, 0), [0, 0, 0])[0] += 1
+        for dimension, columns in PAGEVIEW_BREAKDOWNS.items():
+            breakdowns.setdefault((day, dimension, *_keys(event, columns)), [0, 0, 0])[0] += 1
+        session_id = event["session_id"]
+        if session_id:
+            first_day, pages = batch_sessions.get(session_id, (day, set()))
+            pages.add(_keys(event, PAGEVIEW_BREAKDOWNS["page"]))
+            batch_sessions[session_id] = (min(first_day, day), pages)
+
+    # A page counts one session on the day its session started, the same
+    # rule as _compute; an earlier event moves the pages already counted.
+    slug, title, path = (f"COALESCE({column}, 0)" for column in PAGEVIEW_BREAKDOWNS["page"])
+    for session_id, (first_day, pages) in batch_sessions.items():
+        row = conn.execute("SELECT started_day FROM analytics_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        known = {
+            tuple(page)
+            for page in conn.execute(
+                f"SELECT DISTINCT {slug}, {title}, {path} FROM analytics_events WHERE session_id = ?",
+                (session_id,),
+            )
+        }
+        started_day = first_day if row is None else min(row[0], first_day)
+        if row is not None and started_day != row[0]:
+            for page in known:
+                breakdowns.setdefault((row[0], "page", *page), [0, 0, 0])[1] -= 1
+                breakdowns.setdefault((started_day, "page", *page), [0, 0, 0])[1] += 1
+        for page in pages - known:
+            breakdowns.setdefault((started_day, "page", *page), [0, 0, 0])[1] += 1
+    _write(conn, daily, breakdowns, cube)
+
+
+def session_snapshot(conn: sqlite3.Connection, session_ids: Sequence[str]) -> dict[str, dict[str, Any]]:
+    """The roll-up relevant columns of the given sessions, keyed by session id."""
+
+    rows: dict[str, dict[str, Any]] = {}
+    for start in range(0, len(session_ids), 500):
+        chunk = session_ids[start : start + 500]
+        cursor = conn.execute(
+            f"SELECT {', '.join(_SESSION_SNAPSHOT)} FROM analytics_sessions "
+            f"WHERE session_id IN ({', '.join('?' for _ in chunk)})",
+            chunk,
+        )
+        for values in cursor:
+            rows[values[0]] = dict(zip(_SESSION_SNAPSHOT, values))
+    return rows
+
+
+def visitor_snapshot(conn: sqlite3.Connection, visitor_ids: Sequence[str]) -> dict[str, int]:
+    """First-seen day of the given visitors, keyed by visitor id."""
+
+    days: dict[str, int] = {}
+    for start in range(0, len(visitor_ids), 500):
+        chunk = visitor_ids[start : start + 500]
+        days.update(
+            conn.execute(
+                f"SELECT visitor_id, first_seen_day FROM analytics_visitors "
+                f"WHERE visitor_id IN ({', '.join('?' for _ in chunk)})",
+                chunk,
+            ).fetchall()
+        )
+    return days
+
+
+def apply_sessions(
+    conn: sqlite3.Connection,
+    before: Mapping[str, Mapping[str, Any]],
+    after: Mapping[str, Mapping[str, Any]],
+) -> None:
+    """Add the difference between two :func:`session_snapshot` results."""
+
+    daily: dict[int, list[int]] = {}
+    breakdowns: dict[tuple[Any, ...], list[int]] = {}
+
+    def count(row: Mapping[str, Any], sign: int) -> None:
+        single = sign if row["page_views"] == 1 else 0
+        totals = daily.setdefault(row["started_day"], [0] * len(DAILY_COLUMNS))
+        totals[1] += sign
+        totals[2] += single
+        for dimension, columns in SESSION_BREAKDOWNS.items():
+            values = breakdowns.setdefault((row["started_day"], dimension, *_keys(row, columns)), [0, 0, 0])
+            values[1] += sign
+            values[2] += single
+
+    # Net change in how many sessions each (visitor, day) pair started.
+    visitor_days: dict[tuple[str, int], int] = {}
+    sketched: dict[tuple[int, str, int], set[str]] = {}
+    for session_id, row in after.items():
+        previous = before.get(session_id)
+        if previous == row:
+            continue
+        if row["visitor_id"]:
+            moved = set(_sketch_keys(row)) - set(_sketch_keys(previous) if previous else ())
+            for key in moved:
+                sketched.setdefault(key, set()).add(row["visitor_id"])
+        if previous is not None:
+            count(previous, -1)
+            if previous["visitor_id"]:
+                key = (previous["visitor_id"], previous["started_day"])
+                visitor_days[key] = visitor_days.get(key, 0) - 1
+        count(row, 1)
+        if row["visitor_id"]:
+            key = (row["visitor_id"], row["started_day"])
+            visitor_days[key] = visitor_days.get(key, 0) + 1
+
+    # A visitor counts once on each day they started a session; compare the
+    # session count now with what it was before the batch.
+    for (visitor_id, day), change in visitor_days.items():
+        if not change:
+            continue
+        now = conn.execute(
+            "SELECT COUNT(*) FROM analytics_sessions WHERE visitor_id = ? AND started_day = ?",
+            (visitor_id, day),
+        ).fetchone()[0]
+        visited = int(now > 0) - int(now - change > 0)
+        if visited:
+            daily.setdefault(day, [0] * len(DAILY_COLUMNS))[3] += visited
+    _add_to_sketches(conn, sketched)
+    _write(conn, daily, breakdowns)
+
+
+def apply_visitors(conn: sqlite3.Connection, before: Mapping[str, int], after: Mapping[str, int]) -> None:
+    """Move new-visitor counts to match two :func:`visitor_snapshot` results."""
+
+    daily: dict[int, list[int]] = {}
+    for visitor_id, day in after.items():
+        previous = before.get(visitor_id)
+        if previous == day:
+            continue
+        if previous is not None:
+            daily.setdefault(previous, [0] * len(DAILY_COLUMNS))[4] -= 1
+        daily.setdefault(day, [0] * len(DAILY_COLUMNS))[4] += 1
+    _write(conn, daily, {})
+
+
+def _compute(conn: sqlite3.Connection, prefix: str, start_day: int, end_day: int) -> None:
+    """Insert fresh roll-up rows for ``start_day``..``end_day`` into ``{prefix}analytics_rollup_*``."""
+
+    days = {"start": start_day, "end": end_day}
+    conn.execute(
+        f"""
+        INSERT INTO {prefix}analytics_rollup_daily (day, {", ".join(DAILY_COLUMNS)})
+        SELECT day, SUM(page_views), SUM(sessions), SUM(single_page_sessions), SUM(visitors), SUM(new_visitors)
+        FROM (
+            SELECT created_day AS day, COUNT(*) AS page_views, 0 AS sessions, 0 AS single_page_sessions,
+                   0 AS visitors, 0 AS new_visitors
+            FROM analytics_events
+            WHERE created_day BETWEEN :start AND :end
+            GROUP BY created_day
+            UNION ALL
+            SELECT started_day, 0, COUNT(*), SUM(page_views = 1), COUNT(DISTINCT visitor_id), 0
+            FROM analytics_sessions
+            WHERE started_day BETWEEN :start AND :end
+            GROUP BY started_day
+            UNION ALL
+            SELECT first_seen_day, 0, 0, 0, 0, COUNT(*)
+            FROM analytics_visitors
+            WHERE first_seen_day BETWEEN :start AND :end
+            GROUP BY first_seen_day
+        )
+        GROUP BY day
+        """,
+        days,
+    )
+
+    def keys(columns: Sequence[str]) -> str:
+        values = [f"COALESCE({column}, 0)" for column in columns]
+        return ", ".join([*values, *("0" for _ in range(3 - len(values)))])
+
+    parts = [
+        f"""
+        SELECT created_day AS day, 'hour' AS dimension, (created_ts % {SECONDS_PER_DAY}) / 3600 AS key1,
+               0 AS key2, 0 AS key3, COUNT(*) AS page_views, 0 AS sessions, 0 AS single_page_sessions
+        FROM analytics_events
+        WHERE created_day BETWEEN :start AND :end
+        GROUP BY 1, 3
+        """
+    ]
+    for dimension, columns in PAGEVIEW_BREAKDOWNS.items():
+        parts.append(
+            f"""
+            SELECT created_day, '{dimension}', {keys(columns)}, COUNT(*), 0, 0
+            FROM analytics_events
+            WHERE created_day BETWEEN :start AND :end
+            GROUP BY 1, 3, 4, 5
+            """
+        )
+    # Sessions per page, on the day the session started (analytics_sessions.started_ts).
+    slug, title, path = (f"COALESCE(e.{column}, 0)" for column in PAGEVIEW_BREAKDOWNS["page"])
+    parts.append(
+        f"""
+        SELECT started_day, 'page', key1, key2, key3, 0, COUNT(*), 0
+        FROM (
+            SELECT DISTINCT s.session_id, s.started_day, {slug} AS key1, {title} AS key2, {path} AS key3
+            FROM analytics_sessions AS s
+            JOIN analytics_events AS e ON e.session_id = s.session_id
+            WHERE s.started_ts BETWEEN :start * {SECONDS_PER_DAY} AND (:end + 1) * {SECONDS_PER_DAY} - 1
+        )
+        GROUP BY 1, 3, 4, 5
+        """
+    )
+    for dimension, columns in SESSION_BREAKDOWNS.items():
+        parts.append(
+            f"""
+            SELECT started_day, '{dimension}', {keys(columns)}, 0, COUNT(*), SUM(page_views = 1)
+            FROM analytics_sessions
+            WHERE started_day BETWEEN :start AND :end
+            GROUP BY 1, 3, 4, 5
+            """
+        )
+    conn.execute(
+        f"""
+        INSERT INTO {prefix}analytics_rollup_breakdowns ({", ".join(BREAKDOWN_KEY)}, {", ".join(BREAKDOWN_COLUMNS)})
+        SELECT day, dimension, key1, key2, key3, SUM(page_views), SUM(sessions), SUM(single_page_sessions)
+        FROM ({" UNION ALL ".join(parts)})
+        GROUP BY day, dimension, key1, key2, key3
+        """,
+        days,
+    )
+    _compute_cube(conn, prefix, start_day, end_day)
+
+
+def _compute_cube(conn: sqlite3.Connection, prefix: str, start_day: int, end_day: int) -> None:
+    keys = ", ".join(f"COALESCE({column}, 0)" for column in CUBE_COLUMNS)
+    conn.execute(
+        f"""
+        INSERT INTO {prefix}analytics_rollup_cube (day, {", ".join(CUBE_COLUMNS)}, page_views)
+        SELECT created_day, {keys}, COUNT(*)
+        FROM analytics_events
+        WHERE created_day BETWEEN ? AND ?
+        GROUP BY {", ".join(str(position) for position in range(1, len(CUBE_COLUMNS) + 2))}
+        """,
+        (start_day, end_day),
+    )
+
+
+def default_range(conn: sqlite3.Connection) -> tuple[int, int] | None:
+    """First and last day that still have raw events (days archived by retention are left alone)."""
+
+    row = conn.execute("SELECT MIN(created_day), MAX(created_day) FROM analytics_events").fetchone()
+    session_row = conn.execute("SELECT MAX(started_day) FROM analytics_sessions").fetchone()
+    if row[0] is None:
+        return None
+    return row[0], max(row[1], session_row[0] or row[1])
+
+
+def rebuild(conn: sqlite3.Connection, start_day: int | None = None, end_day: int | None = None) -> int:
+    """Recompute the roll-ups for a range of days; returns the number of days rebuilt."""
+
+    bounds = default_range(conn)
+    if bounds is None:
+        return 0
+    start_day = bounds[0] if start_day is None else max(start_day, bounds[0])
+    end_day = bounds[1] if end_day is None else end_day
+    if end_day < start_day:
+        return 0
+    with conn:
+        conn.execute("DELETE FROM analytics_rollup_daily WHERE day BETWEEN ? AND ?", (start_day, end_day))
+        conn.execute("DELETE FROM analytics_rollup_breakdowns WHERE day BETWEEN ? AND ?", (start_day, end_day))
+        conn.execute("DELETE FROM analytics_rollup_cube WHERE day BETWEEN ? AND ?", (start_day, end_day))
+        _compute(conn, "", start_day, end_day)
+        _rebuild_sketches(conn, start_day, end_day)
+        bump_version(conn)
+    return end_day - start_day + 1
+
+
+def check(conn: sqlite3.Connection, start_day: int | None = None, end_day: int | None = None) -> dict[str, int]:
+    """Count stored roll-up rows that differ from a fresh computation, per table."""
+
+    bounds = default_range(conn)
+    if bounds is None:
+        return {}
+    start_day = bounds[0] if start_day is None else max(start_day, bounds[0])
+    end_day = bounds[1] if end_day is None else end_day
+    _create_tables(conn, "temp.")
+    try:
+        conn.execute("DELETE FROM temp.analytics_rollup_daily")
+        conn.execute("DELETE FROM temp.analytics_rollup_breakdowns")
+        conn.execute("DELETE FROM temp.analytics_rollup_cube")
+        _compute(conn, "temp.", start_day, end_day)
+        differences: dict[str, int] = {}
+        for table, columns in (
+            ("analytics_rollup_daily", DAILY_COLUMNS),
+            ("analytics_rollup_breakdowns", BREAKDOWN_COLUMNS),
+            ("analytics_rollup_cube", ("page_views",)),
+        ):
+            nonzero = " OR ".join(f"{column} != 0" for column in columns)
+            stored = f"SELECT * FROM main.{table} WHERE day BETWEEN ? AND ? AND ({nonzero})"
+            fresh = f"SELECT * FROM temp.{table} WHERE {nonzero}"
+            differences[table] = conn.execute(
+                f"""
+                SELECT COUNT(*) FROM (
+                    SELECT * FROM ({stored} EXCEPT {fresh})
+                    UNION ALL
+                    SELECT * FROM ({fresh} EXCEPT {stored})
+                )
+                """,
+                (start_day, end_day, start_day, end_day),
+            ).fetchone()[0]
+        return differences
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.analytics_rollup_daily")
+        conn.execute("DROP TABLE IF EXISTS temp.analytics_rollup_breakdowns")
+        conn.execute("DROP TABLE IF EXISTS temp.analytics_rollup_cube")
+        conn.commit()
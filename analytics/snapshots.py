@@ -0,0 +1,136 @@
+"""Worker-level cache of computed analytics report contexts.
+
+Building the admin report runs a few dozen queries; most views of it repeat
+a range that nothing has been written to since. :class:`ReportCache` keeps
+one computed value per key (a report panel and its range) together with the
+watermark it was computed at, normally the roll-up version from
+:func:`analytics.rollups.version`:
+
+* same watermark and younger than ``ttl_seconds``: served as is;
+* otherwise, younger than ``stale_seconds``: served as is while one
+  background thread recomputes it;
+* missing or older: computed in the request. Concurrent requests for the
+  same key wait for that one computation instead of repeating it.
+
+The TTL still matters with an unchanged watermark because some inputs are
+not versioned (CMS leads, the current day rolling over).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass
+class _Entry:
+    watermark: Any
+    built_at: float
+    value: Any
+
+
+class ReportCache:
+    def __init__(self, *, ttl_seconds: float = 60.0, stale_seconds: float = 600.0, max_entries: int = 32) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: dict[Hashable, _Entry] = {}
+        self._building: dict[Hashable, threading.Event] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+
+    def get(
+        self,
+        key: Hashable,
+        watermark: Any,
+        build: Callable[[], Any],
+        *,
+        background: Callable[[], Any] | None = None,
+    ) -> tuple[Any, float]:
+        """Return ``(value, built_at)`` for ``key``.
+
+        ``build`` computes a fresh value in the calling thread;
+        ``background`` (defaults to ``build``) is what a revalidation thread
+        runs, for callers that need to carry context across threads.
+        """
+
+        if self.ttl_seconds <= 0:
+            return build(), time.time()
+        while True:
+            now = time.time()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    age = now - entry.built_at
+                    if entry.watermark == watermark and age < self.ttl_seconds:
+                        self.hits += 1
+                        return entry.value, entry.built_at
+                    if age < self.stale_seconds:
+                        self.stale_hits += 1
+                        if key not in self._building:
+                            self._building[key] = threading.Event()
+                            threading.Thread(
+                                target=self._refresh,
+                                args=(key, watermark, background or build),
+                                name="analytics-report-refresh",
+                                daemon=True,
+                            ).start()
+                        return entry.value, entry.built_at
+                pending = self._building.get(key)
+                if pending is None:
+                    self.misses += 1
+                    self._building[key] = threading.Event()
+                    break
+            # Someone else is computing this key; use their result.
+            pending.wait()
+        try:
+            value = build()
+            self._store(key, watermark, value)
+            return value, time.time()
+        finally:
+            self._finish(key)
+
+    def _refresh(self, key: Hashable, watermark: Any, build: Callable[[], Any]) -> None:
+        try:
+            self._store(key, watermark, build())
+            self.refreshes += 1
+        except Exception:  # the stale entry stays; the next request retries
+            self.failed_refreshes += 1
+        finally:
+            self._finish(key)
+
+    def _store(self, key: Hashable, watermark: Any, value: Any) -> None:
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda name: self._entries[name].built_at)
+                del self._entries[oldest]
+            self._entries[key] = _Entry(watermark, time.time(), value)
+
+    def _finish(self, key: Hashable) -> None:
+        with self._lock:
+            event = self._building.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+        }
@@ -0,0 +1,360 @@
+"""Append-only spool for analytics events.
+
+In spool mode the tracking endpoint only appends one compact JSON line per
+event to a segment file under ``instance/`` and returns immediately, so beacon
+latency no longer depends on SQLite at all. Segments are named
+``<timestamp>-<pid>-<seq>.open`` while a worker writes to them and renamed to
+``.ready`` once rotated (by size, by age, or at worker exit).
+
+The writing worker holds an exclusive ``flock`` on its open segment, so
+:func:`seal_orphaned_segments` knows a segment without one was left behind by
+a dead worker, whatever PID has since been reused. A segment untouched for
+``max_age`` is sealed even while its owner lives (an idle worker only rotates
+on its next append). Appends, including creating and locking a new
+segment, hold a shared lock on the directory's ``.seal.lock`` and sealing
+holds an exclusive one, so a segment is never renamed under an append in
+flight or between its creation and its lock; the owner notices the rename
+and starts a new segment.
+
+:func:`load_segments` bulk-loads ready segments. Each segment is loaded in one
+transaction that also records the segment name in
+``analytics_spool_checkpoints``; the checkpoint row is inserted first, so a
+second loader racing on the same segment fails on the primary key and rolls
+back instead of loading it twice. A segment file is only deleted after its
+transaction has committed, and a crash between commit and delete is healed on
+the next run by the checkpoint lookup. A segment whose events cannot be
+written for any reason but a busy, locked or failing database (the
+buffer's :func:`~analytics.buffer.transient_error`) is moved to ``failed/``
+so it neither blocks the segments after it nor loses its events. Such a
+database error stops the run instead: that segment and the ones after it
+are listed in ``LoadResult.deferred`` and left for the next run.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any
+
+from .buffer import transient_error
+
+OPEN_SUFFIX = ".open"
+READY_SUFFIX = ".ready"
+FAILED_DIR = "failed"
+SEAL_LOCK = ".seal.lock"
+
+EventWriter = Callable[[sqlite3.Connection, Iterable[Mapping[str, Any]]], Any]
+
+
+def ensure_checkpoint_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_spool_checkpoints (
+            segment TEXT PRIMARY KEY,
+            events INTEGER NOT NULL,
+            skipped_lines INTEGER NOT NULL DEFAULT 0,
+            loaded_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+class SpoolWriter:
+    """Append events to rotating per-process segment files.
+
+    Lines are flushed to the OS after every append so a worker crash loses
+    nothing; ``os.fsync`` is only issued when a segment is rotated, which keeps
+    the per-beacon cost at a buffered ``write``.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        *,
+        max_bytes: int = 4 * 1024 * 1024,
+        max_age: float = 60.0,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(1024, int(max_bytes))
+        self.max_age = max(1.0, float(max_age))
+
+        self.appended = 0
+        self.segments_closed = 0
+
+        self._reset_worker_state()
+
+    def _reset_worker_state(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._handle: IO[str] | None = None
+        self._path: Path | None = None
+        self._opened_at = 0.0
+        self._sequence = 0
+        self._seal_lock: IO[bytes] | None = None
+
+    def _open_segment(self) -> IO[str]:
+        self._sequence += 1
+        stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+        self._path = self.directory / f"{stamp}-{self._pid}-{self._sequence:06d}{OPEN_SUFFIX}"
+        self._handle = open(self._path, "a", encoding="utf-8")
+        fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._opened_at = time.monotonic()
+        return self._handle
+
+    def _seal_locked(self) -> None:
+        if self._handle is None or self._path is None:
+            return
+        handle, path = self._handle, self._path
+        self._handle = None
+        self._path = None
+        handle.flush()
+        os.fsync(handle.fileno())
+        empty = handle.tell() == 0
+        # Rename while still holding the segment's lock, so no loader takes
+        # it for an orphan in between.
+        try:
+            if empty:
+                path.unlink()
+            else:
+                path.rename(path.with_suffix(READY_SUFFIX))
+                self.segments_closed += 1
+        except FileNotFoundError:
+            pass  # a loader already sealed it
+        finally:
+            handle.close()
+
+    def append(self, events: Iterable[Mapping[str, Any]]) -> int:
+        lines = [json.dumps(event, separators=(",", ":"), default=str) for event in events]
+        if not lines:
+            return 0
+        if self._pid != os.getpid():
+            # Forked: the inherited segment and its lock belong to the parent.
+            if self._handle is not None:
+                self._handle.close()
+            self._reset_worker_state()
+
+        with self._lock:
+            if self._seal_lock is None:
+                self._seal_lock = open(self.directory / SEAL_LOCK, "ab")
+            fcntl.flock(self._seal_lock.fileno(), fcntl.LOCK_SH)
+            try:
+                if self._handle is not None and self._path is not None and not self._path.exists():
+                    # Sealed by a loader while this worker was idle.
+                    self._handle.close()
+                    self._handle = None
+                    self._path = None
+                handle = self._handle or self._open_segment()
+                handle.write("\n".join(lines) + "\n")
+                handle.flush()
+            finally:
+                fcntl.flock(self._seal_lock.fileno(), fcntl.LOCK_UN)
+            self.appended += len(lines)
+            if handle.tell() >= self.max_bytes or time.monotonic() - self._opened_at >= self.max_age:
+                self._seal_locked()
+        return len(lines)
+
+    def rotate_if_due(self) -> None:
+        """Seal the current segment if it has outlived ``max_age``."""
+
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            if self._handle is not None and time.monotonic() - self._opened_at >= self.max_age:
+                self._seal_locked()
+
+    def close(self) -> None:
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._seal_locked()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "appended": self.appended,
+            "segments_closed": self.segments_closed,
+            "ready_segments": sum(1 for _ in self.directory.glob(f"*{READY_SUFFIX}")),
+        }
+
+
+def _owned(fd: int) -> bool:
+    """Whether a live writer holds the segment open behind ``fd``."""
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    return False
+
+
+def seal_orphaned_segments(directory: str | os.PathLike[str], *, max_age: float | None = None) -> int:
+    """Mark ``.open`` segments as ready when their writer is gone or idle.
+
+    A segment counts as orphaned when no process holds its lock. With
+    ``max_age``, a segment whose owner has not written to it for that many
+    seconds is sealed too. Ownership is only checked while holding the seal
+    lock exclusively: a writer creates and locks a new segment under the
+    shared lock, so a segment is never caught between the two.
+    """
+
+    directory = Path(directory)
+    candidates = sorted(directory.glob(f"*{OPEN_SUFFIX}"))
+    if not candidates:
+        return 0
+    sealed = 0
+    with open(directory / SEAL_LOCK, "ab") as seal_lock:
+        # Waits for appends in flight; new ones see the rename.
+        fcntl.flock(seal_lock.fileno(), fcntl.LOCK_EX)
+        for path in candidates:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                if _owned(fd) and (max_age is None or time.time() - os.fstat(fd).st_mtime < max_age):
+                    continue
+                try:
+                    path.rename(path.with_suffix(READY_SUFFIX))
+                except FileNotFoundError:
+                    continue
+                sealed += 1
+            finally:
+                os.close(fd)
+    return sealed
+
+
+@dataclass
+class LoadResult:
+    segments: int = 0
+    events: int = 0
+    skipped_lines: int = 0
+    already_loaded: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+    deferred: list[str] = field(default_factory=list)
+
+
+def _read_segment(path: Path) -> tuple[list[dict[str, Any]], int]:
+    events: list[dict[str, Any]] = []
+    skipped = 0
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # A torn final line from a crashed worker; everything before it is intact.
+                skipped += 1
+                continue
+            if isinstance(event, dict):
+                events.append(event)
+            else:
+                skipped += 1
+    return events, skipped
+
+
+def load_segments(
+    conn: sqlite3.Connection,
+    directory: str | os.PathLike[str],
+    write_events: EventWriter,
+    *,
+    limit: int | None = None,
+) -> LoadResult:
+    """Load ready segments in name (i.e. creation) order, one transaction each."""
+
+    ensure_checkpoint_table(conn)
+    conn.commit()
+
+    result = LoadResult()
+    ready = sorted(Path(directory).glob(f"*{READY_SUFFIX}"))
+    if limit is not None:
+        ready = ready[:limit]
+
+    for index, path in enumerate(ready):
+        name = path.name
+        already = conn.execute(
+            "SELECT 1 FROM analytics_spool_checkpoints WHERE segment = ?",
+            (name,),
+        ).fetchone()
+        if already is None:
+            try:
+                events, skipped = _read_segment(path)
+            except FileNotFoundError:
+                continue
+            try:
+                with conn:
+                    try:
+                        conn.execute(
+                            """
+                            INSERT INTO analytics_spool_checkpoints (segment, events, skipped_lines, loaded_at)
+                            VALUES (?, ?, ?, ?)
+                            """,
+                            (name, len(events), skipped, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")),
+                        )
+                    except sqlite3.IntegrityError:
+                        # Another loader committed this segment first.
+                        loaded = False
+                    else:
+                        write_events(conn, events)
+                        loaded = True
+            except Exception as error:
+                if transient_error(error):
+                    # The database cannot take writes right now: leave the rest for the next run.
+                    result.deferred.extend(later.name for later in ready[index:])
+                    break
+                _move_to_failed(path)
+                result.failed.append(name)
+                continue
+            if loaded:
+                result.segments += 1
+                result.events += len(events)
+                result.skipped_lines += skipped
+            else:
+                result.already_loaded.append(name)
+        else:
+            result.already_loaded.append(name)
+        path.unlink(missing_ok=True)
+
+    return result
+
+
+def _move_to_failed(path: Path) -> None:
+    failed_dir = path.parent / FAILED_DIR
+    failed_dir.mkdir(exist_ok=True)
+    try:
+        path.replace(failed_dir / path.name)
+    except FileNotFoundError:
+        pass
+
+
+def start_autoloader(
+    interval: float,
+    run_once: Callable[[], Any],
+    *,
+    logger: logging.Logger | None = None,
+) -> threading.Thread:
+    """Run ``run_once`` every ``interval`` seconds on a daemon thread."""
+
+    logger = logger or logging.getLogger(__name__)
+
+    def _loop() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                run_once()
+            except Exception:  # the next cycle retries; segments stay on disk
+                logger.exception("Analytics spool load failed")
+
+    thread = threading.Thread(target=_loop, name="analytics-spool-loader", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,881 @@
+"""SQLite persistence helpers for analytics events.
+
+Analytics lives in its own database file (``ANALYTICS_DATABASE``), opened in
+WAL mode by :func:`connect`, so beacon writes and long report scans never
+contend with CMS, lead or booking transactions for the main database lock.
+
+The tracking endpoint never writes rows itself; parsed events are handed to a
+writer (see :mod:`analytics.buffer`) which calls :func:`insert_events` with a
+whole batch so every flush costs a single transaction and a single fsync.
+
+``analytics_events`` is dictionary encoded. The repetitive text attributes
+listed in :data:`DIMENSIONS` (paths, titles, referrers, device and locale
+labels, ...) are stored once each in ``analytics_dimension_values`` and
+events carry integer ``<dimension>_id`` references, so rows stay small,
+reports group on integers and join the handful of labels they display. The
+``analytics_events_wide`` view reassembles the original text columns for
+ad-hoc queries.
+
+Timestamps are stored as ``created_ts`` (UTC epoch seconds) and
+``created_day`` (whole UTC days since the epoch). Reports filter and group on
+those two indexed integers so a date range is an index range scan.
+
+``analytics_sessions`` holds one row per session (start and end, page view
+count, landing and exit page, acquisition attributes) and
+``analytics_visitors`` one row per visitor (first and last seen, visits,
+page views). Both are upserted in the same transaction as the events, so
+session and new-versus-returning KPIs never group raw events. Each new
+session is also counted into ``analytics_attribution`` (day × campaign ×
+source × channel × landing page), which :mod:`analytics.attribution` extends
+with lead and booking counts. The same writes keep the daily report
+roll-ups of :mod:`analytics.rollups` current.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from collections import Counter
+from collections.abc import Callable, Iterable, Mapping
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from . import rollups
+
+SECONDS_PER_DAY = 86_400
+
+# Writes a group of non-page-view events (e.g. web vitals) inside the batch transaction.
+EventWriter = Callable[[sqlite3.Connection, list[Mapping[str, Any]], "DimensionInterner"], Any]
+
+# Tables that belong in the analytics database, in dependency order.
+ANALYTICS_TABLES: tuple[str, ...] = (
+    "analytics_dimension_values",
+    "analytics_events",
+    "analytics_sessions",
+    "analytics_visitors",
+    "analytics_referrer_domains",
+    "analytics_spool_checkpoints",
+    "analytics_archives",
+    "analytics_attribution",
+    "analytics_rollup_daily",
+    "analytics_rollup_breakdowns",
+    "analytics_rollup_cube",
+    "analytics_rollup_sketches",
+    "analytics_rollup_version",
+)
+
+DIMENSIONS: tuple[str, ...] = (
+    "page_slug",
+    "page_title",
+    "path",
+    "url",
+    "referrer",
+    "referrer_domain",
+    "traffic_source",
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+    "device_type",
+    "device_os",
+    "browser",
+    "language",
+    "country",
+    "timezone",
+)
+
+FACT_COLUMNS: tuple[str, ...] = (
+    "visitor_id",
+    "session_id",
+    "screen_width",
+    "screen_height",
+    "is_session_start",
+    "created_ts",
+    "created_day",
+)
+
+# Keys understood on an event mapping handed to :func:`write_events`.
+EVENT_COLUMNS: tuple[str, ...] = (
+    "visitor_id",
+    "session_id",
+    *DIMENSIONS,
+    "screen_width",
+    "screen_height",
+    "is_session_start",
+    "created_at",
+    "created_ts",
+    "created_day",
+)
+
+# Acquisition attributes copied onto a session from its first page view.
+SESSION_DIMENSIONS: tuple[str, ...] = (
+    "traffic_source",
+    "referrer_domain",
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+    "device_type",
+    "country",
+)
+
+# Session attributes that key the campaign attribution roll-up, plus the
+# landing page. Missing values are stored as 0 so they can be part of the key.
+ATTRIBUTION_DIMENSIONS: tuple[str, ...] = ("utm_campaign", "utm_source", "traffic_source")
+ATTRIBUTION_KEY: tuple[str, ...] = (
+    "day",
+    *(f"{dimension}_id" for dimension in ATTRIBUTION_DIMENSIONS),
+    "landing_slug_id",
+)
+
+_STORED_COLUMNS: tuple[str, ...] = (
+    *FACT_COLUMNS[:2],
+    *(f"{dimension}_id" for dimension in DIMENSIONS),
+    *FACT_COLUMNS[2:],
+)
+
+_INSERT_EVENT_SQL = (
+    f"INSERT INTO analytics_events ({', '.join(_STORED_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _STORED_COLUMNS)})"
+)
+
+_SESSION_COLUMNS: tuple[str, ...] = (
+    "session_id",
+    "visitor_id",
+    "started_ts",
+    "ended_ts",
+    "started_day",
+    "page_views",
+    "landing_path_id",
+    "landing_slug_id",
+    "exit_path_id",
+    "exit_slug_id",
+    *(f"{dimension}_id" for dimension in SESSION_DIMENSIONS),
+)
+
+_FIRST_EVENT_COLUMNS = (
+    "landing_path_id",
+    "landing_slug_id",
+    *(f"{dimension}_id" for dimension in SESSION_DIMENSIONS),
+)
+
+# Every right-hand side sees the row as it was before the update, so
+# started_ts/ended_ts below still hold the old bounds when compared.
+_UPSERT_SESSION_SQL = (
+    f"INSERT INTO analytics_sessions ({', '.join(_SESSION_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _SESSION_COLUMNS)}) "
+    "ON CONFLICT(session_id) DO UPDATE SET "
+    "visitor_id = COALESCE(visitor_id, excluded.visitor_id), "
+    + ", ".join(
+        f"{column} = CASE WHEN excluded.started_ts < started_ts THEN excluded.{column} ELSE {column} END"
+        for column in _FIRST_EVENT_COLUMNS
+    )
+    + ", exit_path_id = CASE WHEN excluded.ended_ts >= ended_ts THEN excluded.exit_path_id ELSE exit_path_id END"
+    + ", exit_slug_id = CASE WHEN excluded.ended_ts >= ended_ts THEN excluded.exit_slug_id ELSE exit_slug_id END"
+    + ", page_views = page_views + excluded.page_views"
+    + ", started_ts = MIN(started_ts, excluded.started_ts)"
+    + ", started_day = MIN(started_day, excluded.started_day)"
+    + ", ended_ts = MAX(ended_ts, excluded.ended_ts)"
+)
+
+
+def connect(path: str, *, timeout: float = 30.0, cache_size_kib: int = 0) -> sqlite3.Connection:
+    """Open a connection to the analytics database.
+
+    WAL lets report queries read while a flush writes, ``synchronous=NORMAL``
+    drops the per-commit fsync of the WAL (a power cut can lose the last few
+    batches, never corrupt the file), and a generous busy timeout lets a
+    writer wait out another instead of failing with ``database is locked``.
+    """
+
+    conn = sqlite3.connect(path, timeout=timeout)
+    conn.row_factory = sqlite3.Row
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        # Only takes effect before the first table is created; retention then
+        # hands pages back with an incremental vacuum instead of a full one.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+    if cache_size_kib:
+        conn.execute(f"PRAGMA cache_size = -{int(cache_size_kib)}")
+    return conn
+
+
+def move_tables(conn: sqlite3.Connection, legacy_path: str) -> list[str]:
+    """Move analytics tables out of the CMS database into ``conn``'s database.
+
+    Both sides must already have the current schema. Rows are copied in one
+    transaction and the legacy tables dropped in a second, so a crash in
+    between only means the copy is repeated on the next start.
+    """
+
+    conn.commit()
+    conn.execute("ATTACH DATABASE ? AS legacy", (legacy_path,))
+    try:
+        present = {
+            row[0]
+            for row in conn.execute("SELECT name FROM legacy.sqlite_master WHERE type = 'table'").fetchall()
+        }
+        tables = [table for table in ANALYTICS_TABLES if table in present]
+        if not tables:
+            return []
+        with conn:
+            for table in tables:
+                columns = ", ".join(
+                    row[1] for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+                )
+                conn.execute(f"DELETE FROM main.{table}")
+                conn.execute(
+                    f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM legacy.{table}"
+                )
+        with conn:
+            conn.execute("DROP VIEW IF EXISTS legacy.analytics_events_wide")
+            for table in reversed(tables):
+                conn.execute(f"DROP TABLE legacy.{table}")
+        return tables
+    finally:
+        conn.execute("DETACH DATABASE legacy")
+
+
+def backup_database(
+    source_path: str,
+    directory: str | os.PathLike[str],
+    *,
+    keep: int = 7,
+    pages: int = 1024,
+) -> Path:
+    """Write an online, consistent copy of the analytics database.
+
+    The copy proceeds ``pages`` at a time so ingest can keep writing between
+    steps. Only the ``keep`` newest backups in ``directory`` are retained.
+    """
+
+    target_dir = Path(directory)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    stem = Path(source_path).stem
+    target = target_dir / f"{stem}-{datetime.utcnow():%Y%m%d%H%M%S}.sqlite3"
+    source = sqlite3.connect(source_path)
+    destination = sqlite3.connect(target)
+    try:
+        source.backup(destination, pages=pages, sleep=0.005)
+    finally:
+        destination.close()
+        source.close()
+    for stale in sorted(target_dir.glob(f"{stem}-*.sqlite3"), reverse=True)[max(keep, 1):]:
+        stale.unlink(missing_ok=True)
+    return target
+
+
+def epoch_seconds(created_at: str) -> int:
+    """Convert a ``YYYY-MM-DD HH:MM:SS`` UTC timestamp to epoch seconds."""
+
+    moment = datetime.fromisoformat(created_at)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Create the analytics tables, migrating a legacy text-column table in place.
+
+    The migration (:func:`migrate_text_columns`) commits as it goes, one
+    chunk of rows at a time.
+    """
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_dimension_values (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            UNIQUE (dimension, value)
+        )
+        """
+    )
+    existing = _event_columns(conn)
+    if not existing:
+        conn.execute(_create_events_sql("analytics_events"))
+    elif "url" in existing:
+        migrate_text_columns(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_created_ts ON analytics_events(created_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_created_day ON analytics_events(created_day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_session ON analytics_events(session_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_slug ON analytics_events(page_slug_id)")
+    has_sessions = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_sessions'"
+    ).fetchone()
+    if has_sessions is None:
+        dimension_columns = "".join(f"{dimension}_id INTEGER,\n" for dimension in SESSION_DIMENSIONS)
+        conn.execute(
+            f"""
+            CREATE TABLE analytics_sessions (
+                session_id TEXT PRIMARY KEY,
+                visitor_id TEXT,
+                started_ts INTEGER NOT NULL,
+                ended_ts INTEGER NOT NULL,
+                started_day INTEGER NOT NULL,
+                page_views INTEGER NOT NULL,
+                landing_path_id INTEGER,
+                landing_slug_id INTEGER,
+                exit_path_id INTEGER,
+                exit_slug_id INTEGER,
+                {dimension_columns.rstrip().rstrip(",")}
+            )
+            """
+        )
+        rebuild_sessions(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_sessions_started ON analytics_sessions(started_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_sessions_visitor ON analytics_sessions(visitor_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_visitor ON analytics_events(visitor_id)")
+    has_visitors = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_visitors'"
+    ).fetchone()
+    if has_visitors is None:
+        conn.execute(
+            """
+            CREATE TABLE analytics_visitors (
+                visitor_id TEXT PRIMARY KEY,
+                first_seen_ts INTEGER NOT NULL,
+                first_seen_day INTEGER NOT NULL,
+                last_seen_ts INTEGER NOT NULL,
+                visits INTEGER NOT NULL DEFAULT 0,
+                page_views INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        rebuild_visitors(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_visitors_first_seen ON analytics_visitors(first_seen_ts)")
+    has_attribution = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_attribution'"
+    ).fetchone()
+    if has_attribution is None:
+        conn.execute(
+            f"""
+            CREATE TABLE analytics_attribution (
+                {", ".join(f"{column} INTEGER NOT NULL" for column in ATTRIBUTION_KEY)},
+                sessions INTEGER NOT NULL DEFAULT 0,
+                leads INTEGER NOT NULL DEFAULT 0,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY ({", ".join(ATTRIBUTION_KEY)})
+            ) WITHOUT ROWID
+            """
+        )
+        rebuild_attribution_sessions(conn)
+    conn.execute("DROP VIEW IF EXISTS analytics_events_wide")
+    joins = "\n".join(
+        f"LEFT JOIN analytics_dimension_values AS {dimension} ON {dimension}.id = e.{dimension}_id"
+        for dimension in DIMENSIONS
+    )
+    conn.execute(
+        f"""
+        CREATE VIEW analytics_events_wide AS
+        SELECT
+            e.id,
+            e.visitor_id,
+            e.session_id,
+            {", ".join(f"{dimension}.value AS {dimension}" for dimension in DIMENSIONS)},
+            e.screen_width,
+            e.screen_height,
+            e.is_session_start,
+            datetime(e.created_ts, 'unixepoch') AS created_at,
+            e.created_ts,
+            e.created_day
+        FROM analytics_events AS e
+        {joins}
+        """
+    )
+
+
+def rebuild_sessions(conn: sqlite3.Connection) -> int:
+    """Recompute ``analytics_sessions`` from the raw events in one statement."""
+
+    attributes = ", ".join(f"first.{dimension}_id" for dimension in SESSION_DIMENSIONS)
+    event_attributes = ", ".join(f"{dimension}_id" for dimension in SESSION_DIMENSIONS)
+    with conn:
+        conn.execute("DELETE FROM analytics_sessions")
+        cursor = conn.execute(
+            f"""
+            WITH ranked AS (
+                SELECT
+                    session_id,
+                    visitor_id,
+                    created_ts,
+                    path_id,
+                    page_slug_id,
+                    {event_attributes},
+                    ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY created_ts, id) AS first_rank,
+                    ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY created_ts DESC, id DESC) AS last_rank,
+                    COUNT(*) OVER (PARTITION BY session_id) AS views
+                FROM analytics_events
+                WHERE session_id IS NOT NULL
+            )
+            INSERT INTO analytics_sessions ({", ".join(_SESSION_COLUMNS)})
+            SELECT
+                first.session_id,
+                first.visitor_id,
+                first.created_ts,
+                last.created_ts,
+                first.created_ts / {SECONDS_PER_DAY},
+                first.views,
+                first.path_id,
+                first.page_slug_id,
+                last.path_id,
+                last.page_slug_id,
+                {attributes}
+            FROM ranked AS first
+            JOIN ranked AS last ON last.session_id = first.session_id AND last.last_rank = 1
+            WHERE first.first_rank = 1
+            """
+        )
+    return cursor.rowcount
+
+
+def rebuild_attribution_sessions(conn: sqlite3.Connection) -> int:
+    """Recount the ``sessions`` column of ``analytics_attribution`` from ``analytics_sessions``.
+
+    Lead and booking counts are left alone; rows that end up with nothing in
+    any column are removed.
+    """
+
+    key = ", ".join(
+        [
+            "started_day",
+            *(f"COALESCE({dimension}_id, 0)" for dimension in ATTRIBUTION_DIMENSIONS),
+            "COALESCE(landing_slug_id, 0)",
+        ]
+    )
+    with conn:
+        conn.execute("UPDATE analytics_attribution SET sessions = 0")
+        cursor = conn.execute(
+            f"""
+            INSERT INTO analytics_attribution ({", ".join(ATTRIBUTION_KEY)}, sessions)
+            SELECT {key}, COUNT(*)
+            FROM analytics_sessions
+            WHERE true  -- lets SQLite parse the ON CONFLICT clause after GROUP BY
+            GROUP BY {key}
+            ON CONFLICT ({", ".join(ATTRIBUTION_KEY)}) DO UPDATE SET sessions = excluded.sessions
+            """
+        )
+        conn.execute("DELETE FROM analytics_attribution WHERE sessions = 0 AND leads = 0 AND bookings = 0")
+    return cursor.rowcount
+
+
+def rebuild_visitors(conn: sqlite3.Connection) -> int:
+    """Recompute ``analytics_visitors`` from raw events.
+
+    Visitors whose raw events have all been archived by retention are then
+    filled in from ``analytics_sessions``, which is never pruned.
+    """
+
+    with conn:
+        conn.execute("DELETE FROM analytics_visitors")
+        cursor = conn.execute(
+            f"""
+            INSERT INTO analytics_visitors (
+                visitor_id, first_seen_ts, first_seen_day, last_seen_ts, visits, page_views
+            )
+            SELECT
+                visitor_id,
+                MIN(created_ts),
+                MIN(created_ts) / {SECONDS_PER_DAY},
+                MAX(created_ts),
+                COUNT(DISTINCT session_id),
+                COUNT(*)
+            FROM analytics_events
+            WHERE visitor_id IS NOT NULL
+            GROUP BY visitor_id
+            """
+        )
+        inserted = cursor.rowcount
+        cursor = conn.execute(
+            f"""
+            INSERT OR IGNORE INTO analytics_visitors (
+                visitor_id, first_seen_ts, first_seen_day, last_seen_ts, visits, page_views
+            )
+            SELECT
+                visitor_id,
+                MIN(started_ts),
+                MIN(started_ts) / {SECONDS_PER_DAY},
+                MAX(ended_ts),
+                COUNT(*),
+                SUM(page_views)
+            FROM analytics_sessions
+            WHERE visitor_id IS NOT NULL
+            GROUP BY visitor_id
+            """
+        )
+    return inserted + cursor.rowcount
+
+
+def _create_events_sql(table: str) -> str:
+    dimension_columns = "".join(f"{dimension}_id INTEGER,\n" for dimension in DIMENSIONS)
+    return f"""
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            visitor_id TEXT,
+            session_id TEXT,
+            {dimension_columns}
+            screen_width INTEGER,
+            screen_height INTEGER,
+            is_session_start INTEGER DEFAULT 0,
+            created_ts INTEGER NOT NULL,
+            created_day INTEGER NOT NULL
+        )
+        """
+
+
+def _event_columns(conn: sqlite3.Connection) -> set[str]:
+    return {row[1] for row in conn.execute("PRAGMA table_info(analytics_events)").fetchall()}
+
+
+def migrate_text_columns(conn: sqlite3.Connection, *, chunk_size: int = 5000) -> int:
+    """Rebuild a legacy text-column ``analytics_events`` table with dimension ids.
+
+    Rows are copied into ``analytics_events_migrated`` in id order,
+    ``chunk_size`` at a time. Each chunk runs in its own ``BEGIN IMMEDIATE``
+    transaction that interns the chunk's dimension values and copies its rows
+    with their ids looked up through the unique index, then commits. The copy
+    always resumes after the highest id already copied, so an interrupted
+    migration carries on where it stopped, and workers starting at the same
+    time share the chunks rather than one holding the write lock for the
+    whole table. Once no rows are left, the tables are swapped in one short
+    transaction. Returns the number of rows this call copied.
+    """
+
+    conn.commit()
+    copied = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = _event_columns(conn)
+            if "url" not in existing:
+                # Another worker finished the migration.
+                conn.commit()
+                return copied
+            has_target = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_events_migrated'"
+            ).fetchone()
+            if has_target is None:
+                conn.execute(_create_events_sql("analytics_events_migrated"))
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM analytics_events_migrated").fetchone()[0]
+            chunk_end = conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM analytics_events WHERE id > ? ORDER BY id LIMIT ?)",
+                (last_id, chunk_size),
+            ).fetchone()[0]
+            if chunk_end is None:
+                conn.execute("DROP VIEW IF EXISTS analytics_events_wide")
+                conn.execute("DROP TABLE analytics_events")
+                conn.execute("ALTER TABLE analytics_events_migrated RENAME TO analytics_events")
+            else:
+                copied += _copy_text_rows(conn, existing, last_id, chunk_end)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        if chunk_end is None:
+            return copied
+
+
+def _copy_text_rows(conn: sqlite3.Connection, existing: set[str], after_id: int, last_id: int) -> int:
+    """Intern and copy the legacy rows with ``after_id < id <= last_id``."""
+
+    def source(column: str) -> str:
+        return f"e.{column}" if column in existing else "NULL"
+
+    if "created_ts" in existing:
+        created_ts = "COALESCE(e.created_ts, CAST(strftime('%s', e.created_at) AS INTEGER), 0)"
+    else:
+        created_ts = "COALESCE(CAST(strftime('%s', e.created_at) AS INTEGER), 0)"
+
+    for dimension in DIMENSIONS:
+        if dimension not in existing:
+            continue
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO analytics_dimension_values (dimension, value)
+            SELECT DISTINCT ?, {dimension} FROM analytics_events
+            WHERE id > ? AND id <= ? AND {dimension} IS NOT NULL AND {dimension} != ''
+            """,
+            (dimension, after_id, last_id),
+        )
+    lookups = ",\n".join(
+        f"""(SELECT d.id FROM analytics_dimension_values AS d
+             WHERE d.dimension = '{dimension}' AND d.value = {source(dimension)})"""
+        for dimension in DIMENSIONS
+    )
+    cursor = conn.execute(
+        f"""
+        INSERT INTO analytics_events_migrated ({", ".join(("id", *_STORED_COLUMNS))})
+        SELECT
+            e.id,
+            e.visitor_id,
+            e.session_id,
+            {lookups},
+            {source("screen_width")},
+            {source("screen_height")},
+            {source("is_session_start")},
+            {created_ts},
+            {created_ts} / {SECONDS_PER_DAY}
+        FROM analytics_events AS e
+        WHERE e.id > ? AND e.id <= ?
+        """,
+        (after_id, last_id),
+    )
+    return cursor.rowcount
+
+
+class DimensionInterner:
+    """Process-wide cache of ``(dimension, value) -> id`` for one database.
+
+    Only ids read back from committed rows are cached. A value first inserted
+    by the current transaction stays out of the cache until a later batch
+    sees it, so a rolled-back flush can never leave a dangling id behind;
+    this relies on :func:`write_events` being called once per transaction.
+    """
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+        self._ids: dict[tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, conn: sqlite3.Connection, keys: set[tuple[str, str]]) -> dict[tuple[str, str], int]:
+        resolved: dict[tuple[str, str], int] = {}
+        missing: list[tuple[str, str]] = []
+        for key in keys:
+            cached = self._ids.get(key)
+            if cached is None:
+                missing.append(key)
+            else:
+                resolved[key] = cached
+        self.hits += len(resolved)
+        self.misses += len(missing)
+        if not missing:
+            return resolved
+
+        created: set[tuple[str, str]] = set()
+        for key in missing:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO analytics_dimension_values (dimension, value) VALUES (?, ?)",
+                key,
+            )
+            if cursor.rowcount == 1:
+                created.add(key)
+        for key in missing:
+            row = conn.execute(
+                "SELECT id FROM analytics_dimension_values WHERE dimension = ? AND value = ?",
+                key,
+            ).fetchone()
+            resolved[key] = row[0]
+            if key not in created:
+                if len(self._ids) >= self.max_entries:
+                    self._ids.clear()
+                self._ids[key] = row[0]
+        return resolved
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {"entries": len(self._ids), "hits": self.hits, "misses": self.misses}
+
+
+def _dimension_value(value: Any) -> str | None:
+    if value is None:
+        return None
+    text = str(value)
+    return text if text else None
+
+
+_UPSERT_VISITOR_SQL = """
+    INSERT INTO analytics_visitors (
+        visitor_id, first_seen_ts, first_seen_day, last_seen_ts, visits, page_views
+    )
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(visitor_id) DO UPDATE SET
+        first_seen_ts = MIN(first_seen_ts, excluded.first_seen_ts),
+        first_seen_day = MIN(first_seen_day, excluded.first_seen_day),
+        last_seen_ts = MAX(last_seen_ts, excluded.last_seen_ts),
+        visits = visits + excluded.visits,
+        page_views = page_views + excluded.page_views
+"""
+
+_UPSERT_ATTRIBUTION_SESSIONS_SQL = (
+    f"INSERT INTO analytics_attribution ({', '.join(ATTRIBUTION_KEY)}, sessions) "
+    f"VALUES ({', '.join('?' for _ in ATTRIBUTION_KEY)}, ?) "
+    f"ON CONFLICT ({', '.join(ATTRIBUTION_KEY)}) DO UPDATE SET sessions = sessions + excluded.sessions"
+)
+
+
+def _upsert_aggregates(conn: sqlite3.Connection, rows: list[list[Any]]) -> None:
+    position = {column: index for index, column in enumerate(_STORED_COLUMNS)}
+    sessions: dict[str, list[Any]] = {}
+    visitors: dict[str, list[Any]] = {}
+    for row in rows:
+        created_ts = row[position["created_ts"]]
+        visitor_id = row[position["visitor_id"]]
+        if visitor_id:
+            visitor = visitors.get(visitor_id)
+            if visitor is None:
+                visitors[visitor_id] = [visitor_id, created_ts, created_ts // SECONDS_PER_DAY, created_ts, 0, 1]
+            else:
+                if created_ts < visitor[1]:
+                    visitor[1], visitor[2] = created_ts, created_ts // SECONDS_PER_DAY
+                visitor[3] = max(visitor[3], created_ts)
+                visitor[5] += 1
+
+        session_id = row[position["session_id"]]
+        if not session_id:
+            continue
+        path_id = row[position["path_id"]]
+        slug_id = row[position["page_slug_id"]]
+        session = sessions.get(session_id)
+        if session is None:
+            sessions[session_id] = [
+                session_id,
+                row[position["visitor_id"]],
+                created_ts,
+                created_ts,
+                created_ts // SECONDS_PER_DAY,
+                1,
+                path_id,
+                slug_id,
+                path_id,
+                slug_id,
+                *(row[position[f"{dimension}_id"]] for dimension in SESSION_DIMENSIONS),
+            ]
+            continue
+        session[5] += 1
+        if created_ts < session[2]:
+            session[2] = created_ts
+            session[4] = created_ts // SECONDS_PER_DAY
+            session[6], session[7] = path_id, slug_id
+            session[10:] = [row[position[f"{dimension}_id"]] for dimension in SESSION_DIMENSIONS]
+        if created_ts >= session[3]:
+            session[3] = created_ts
+            session[8], session[9] = path_id, slug_id
+    if sessions:
+        # A visit is counted when its session row is first created.
+        session_ids = list(sessions)
+        known = rollups.session_snapshot(conn, session_ids)
+        attribution: Counter[tuple[int, ...]] = Counter()
+        offset = 10
+        for session_id, session in sessions.items():
+            if session_id in known:
+                continue
+            visitor = visitors.get(session[1]) if session[1] else None
+            if visitor is not None:
+                visitor[4] += 1
+            attribution[
+                (
+                    session[4],
+                    *(session[offset + SESSION_DIMENSIONS.index(dimension)] or 0 for dimension in ATTRIBUTION_DIMENSIONS),
+                    session[7] or 0,
+                )
+            ] += 1
+        conn.executemany(_UPSERT_SESSION_SQL, list(sessions.values()))
+        conn.executemany(
+            _UPSERT_ATTRIBUTION_SESSIONS_SQL, [(*key, count) for key, count in attribution.items()]
+        )
+        rollups.apply_sessions(conn, known, rollups.session_snapshot(conn, session_ids))
+    if visitors:
+        visitor_ids = list(visitors)
+        first_seen = rollups.visitor_snapshot(conn, visitor_ids)
+        conn.executemany(_UPSERT_VISITOR_SQL, list(visitors.values()))
+        rollups.apply_visitors(conn, first_seen, rollups.visitor_snapshot(conn, visitor_ids))
+
+
+def write_events(
+    conn: sqlite3.Connection,
+    events: Iterable[Mapping[str, Any]],
+    *,
+    interner: DimensionInterner | None = None,
+    update_aggregates: bool = True,
+    writers: Mapping[str, EventWriter] | None = None,
+) -> int:
+    """Insert ``events`` without committing so callers can extend the transaction.
+
+    Page views go to ``analytics_events``; events of any other ``type`` are
+    handed to the matching entry of ``writers`` (and dropped when there is
+    none). ``update_aggregates=False`` leaves ``analytics_sessions``,
+    ``analytics_visitors`` and the roll-ups alone, for callers such as
+    archive restores whose events were already counted. Any batch that
+    writes something increments the roll-up version.
+    """
+
+    interner = interner or DimensionInterner()
+    pageviews: list[Mapping[str, Any]] = []
+    others: dict[str, list[Mapping[str, Any]]] = {}
+    for event in events:
+        event_type = event.get("type") or "pageview"
+        if event_type == "pageview":
+            pageviews.append(event)
+        else:
+            others.setdefault(event_type, []).append(event)
+
+    written = 0
+    if pageviews:
+        written += _write_pageviews(conn, pageviews, interner, update_aggregates)
+    # Other writers run second so they can see the sessions this batch created.
+    for event_type, group in others.items():
+        writer = (writers or {}).get(event_type)
+        if writer is not None:
+            written += writer(conn, group, interner) or 0
+    if written:
+        rollups.bump_version(conn)
+    return written
+
+
+def _write_pageviews(
+    conn: sqlite3.Connection,
+    events: list[Mapping[str, Any]],
+    interner: DimensionInterner,
+    update_aggregates: bool,
+) -> int:
+    keys: set[tuple[str, str]] = set()
+    for event in events:
+        for dimension in DIMENSIONS:
+            value = _dimension_value(event.get(dimension))
+            if value is not None:
+                keys.add((dimension, value))
+    ids = interner.resolve(conn, keys)
+
+    rows = []
+    for event in events:
+        created_ts = event.get("created_ts")
+        if created_ts is None:
+            try:
+                created_ts = epoch_seconds(str(event.get("created_at")))
+            except ValueError:
+                created_ts = 0
+        row: list[Any] = [event.get("visitor_id"), event.get("session_id")]
+        for dimension in DIMENSIONS:
+            value = _dimension_value(event.get(dimension))
+            row.append(ids[(dimension, value)] if value is not None else None)
+        row.extend(
+            (
+                event.get("screen_width"),
+                event.get("screen_height"),
+                event.get("is_session_start"),
+                created_ts,
+                created_ts // SECONDS_PER_DAY,
+            )
+        )
+        rows.append(row)
+    if update_aggregates:
+        rollups.apply_pageviews(conn, [dict(zip(_STORED_COLUMNS, row)) for row in rows])
+    conn.executemany(_INSERT_EVENT_SQL, rows)
+    if update_aggregates:
+        _upsert_aggregates(conn, rows)
+    return len(rows)
+
+
+def insert_events(
+    conn: sqlite3.Connection,
+    events: Iterable[Mapping[str, Any]],
+    *,
+    interner: DimensionInterner | None = None,
+    writers: Mapping[str, EventWriter] | None = None,
+) -> int:
+    with conn:
+        return write_events(conn, events, interner=interner, writers=writers)
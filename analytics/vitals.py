@@ -0,0 +1,249 @@
+"""Real-user Core Web Vitals stored as log-bucket histograms.
+
+The tracker sends one ``vitals`` event per page view with LCP, FCP, TTFB and
+INP in milliseconds and CLS as a unitless score. Nothing is stored per
+event: each value is counted into a bucket of ``analytics_vitals``, keyed by
+day, page slug, device type and metric. Bucket ``i`` covers values in
+``[GAMMA ** (i - OFFSET), GAMMA ** (i - OFFSET + 1))``, so any percentile
+read back from the counts is within about 4% of the true value, and a
+report over any range is a ``SUM`` over at most a few hundred rows per page.
+"""
+
+from __future__ import annotations
+
+import math
+import sqlite3
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from .storage import SECONDS_PER_DAY, DimensionInterner, epoch_seconds
+
+METRICS: tuple[str, ...] = ("lcp", "fcp", "ttfb", "inp", "cls")
+METRIC_LABELS = {"lcp": "LCP", "fcp": "FCP", "ttfb": "TTFB", "inp": "INP", "cls": "CLS"}
+
+# CLS is stored in thousandths so every metric shares the bucket scale.
+_SCALE = {"cls": 1000.0}
+_MAX_VALUE = {"lcp": 120_000.0, "fcp": 120_000.0, "ttfb": 120_000.0, "inp": 60_000.0, "cls": 10.0}
+
+# "Good" and "poor" thresholds published for each metric (ms, CLS unitless).
+THRESHOLDS = {
+    "lcp": (2500.0, 4000.0),
+    "fcp": (1800.0, 3000.0),
+    "ttfb": (800.0, 1800.0),
+    "inp": (200.0, 500.0),
+    "cls": (0.1, 0.25),
+}
+
+GAMMA = 1.08
+OFFSET = 10
+_LOG_GAMMA = math.log(GAMMA)
+
+QUANTILES: tuple[float, ...] = (0.5, 0.75, 0.95)
+
+
+def ensure_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_vitals (
+            day INTEGER NOT NULL,
+            page_slug_id INTEGER NOT NULL,
+            device_type_id INTEGER NOT NULL,
+            metric INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (day, page_slug_id, device_type_id, metric, bucket)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def parse_metric(metric: str, value: object) -> float | None:
+    """Return ``value`` as a float when it is a plausible reading for ``metric``."""
+
+    try:
+        number = float(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number) or number < 0 or number > _MAX_VALUE[metric]:
+        return None
+    return number
+
+
+def bucket_for(metric: str, value: float) -> int:
+    scaled = value * _SCALE.get(metric, 1.0)
+    if scaled < 0.5:
+        return 0
+    return max(1, math.floor(math.log(scaled) / _LOG_GAMMA) + OFFSET)
+
+
+def bucket_value(metric: str, bucket: int) -> float:
+    """Representative value (the bucket's midpoint) in the metric's own unit."""
+
+    if bucket <= 0:
+        return 0.0
+    low = GAMMA ** (bucket - OFFSET)
+    return low * (1 + GAMMA) / 2 / _SCALE.get(metric, 1.0)
+
+
+def write_events(
+    conn: sqlite3.Connection,
+    events: Iterable[Mapping[str, Any]],
+    interner: DimensionInterner,
+) -> int:
+    """Count ``vitals`` events into the histogram table without committing."""
+
+    events = list(events)
+    keys: set[tuple[str, str]] = set()
+    for event in events:
+        for dimension in ("page_slug", "device_type"):
+            if event.get(dimension):
+                keys.add((dimension, str(event[dimension])))
+    ids = interner.resolve(conn, keys)
+
+    counts: Counter[tuple[int, int, int, int, int]] = Counter()
+    for event in events:
+        created_ts = event.get("created_ts")
+        if created_ts is None:
+            try:
+                created_ts = epoch_seconds(str(event.get("created_at")))
+            except ValueError:
+                continue
+        day = int(created_ts) // SECONDS_PER_DAY
+        slug_id = ids.get(("page_slug", str(event.get("page_slug"))), 0)
+        device_id = ids.get(("device_type", str(event.get("device_type"))), 0)
+        for index, metric in enumerate(METRICS):
+            value = parse_metric(metric, event.get(metric))
+            if value is not None:
+                counts[(day, slug_id, device_id, index, bucket_for(metric, value))] += 1
+
+    conn.executemany(
+        """
+        INSERT INTO analytics_vitals (day, page_slug_id, device_type_id, metric, bucket, samples)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (day, page_slug_id, device_type_id, metric, bucket)
+        DO UPDATE SET samples = samples + excluded.samples
+        """,
+        [(*key, samples) for key, samples in counts.items()],
+    )
+    return len(events)
+
+
+def quantile(histogram: Mapping[int, int], q: float, metric: str) -> float | None:
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket_value(metric, bucket)
+    return bucket_value(metric, max(histogram))
+
+
+def rating(metric: str, value: float | None) -> str | None:
+    if value is None:
+        return None
+    good, poor = THRESHOLDS[metric]
+    if value <= good:
+        return "good"
+    if value <= poor:
+        return "needs-improvement"
+    return "poor"
+
+
+def format_value(metric: str, value: float | None) -> str:
+    if value is None:
+        return "–"
+    if metric == "cls":
+        return f"{value:.2f}"
+    if value >= 1000:
+        return f"{value / 1000:.1f} s"
+    return f"{value:.0f} ms"
+
+
+def _summarise(histograms: Mapping[int, Mapping[int, int]], quantiles: tuple[float, ...]) -> dict[str, Any]:
+    metrics: dict[str, Any] = {}
+    for index, metric in enumerate(METRICS):
+        histogram = histograms.get(index, {})
+        values = {f"p{round(q * 100)}": quantile(histogram, q, metric) for q in quantiles}
+        p75 = values.get("p75")
+        metrics[metric] = {
+            "samples": sum(histogram.values()),
+            "values": values,
+            "display": {name: format_value(metric, value) for name, value in values.items()},
+            "rating": rating(metric, p75),
+        }
+    return metrics
+
+
+def page_report(
+    conn: sqlite3.Connection,
+    start_day: int,
+    end_day: int,
+    *,
+    limit: int = 10,
+    device_type: str | None = None,
+    quantiles: tuple[float, ...] = QUANTILES,
+) -> list[dict[str, Any]]:
+    """Percentiles per page (busiest first) plus an ``All pages`` row, over whole days."""
+
+    filters = ["v.day BETWEEN ? AND ?"]
+    params: list[Any] = [start_day, end_day]
+    if device_type:
+        filters.append(
+            "v.device_type_id = ("
+            "SELECT id FROM analytics_dimension_values WHERE dimension = 'device_type' AND value = ?)"
+        )
+        params.append(device_type)
+    rows = conn.execute(
+        f"""
+        SELECT v.page_slug_id, v.metric, v.bucket, SUM(v.samples) AS samples
+        FROM analytics_vitals AS v
+        WHERE {' AND '.join(filters)}
+        GROUP BY v.page_slug_id, v.metric, v.bucket
+        """,
+        params,
+    ).fetchall()
+    if not rows:
+        return []
+
+    pages: dict[int, dict[int, Counter[int]]] = {}
+    overall: dict[int, Counter[int]] = {}
+    for slug_id, metric, bucket, samples in rows:
+        pages.setdefault(slug_id, {}).setdefault(metric, Counter())[bucket] += samples
+        overall.setdefault(metric, Counter())[bucket] += samples
+
+    def page_samples(histograms: Mapping[int, Counter[int]]) -> int:
+        return max(sum(histogram.values()) for histogram in histograms.values())
+
+    busiest = sorted(pages, key=lambda slug_id: page_samples(pages[slug_id]), reverse=True)[:limit]
+    labels: dict[int, str] = {}
+    if busiest:
+        placeholders = ",".join("?" * len(busiest))
+        labels = dict(
+            conn.execute(
+                f"SELECT id, value FROM analytics_dimension_values WHERE id IN ({placeholders})",
+                busiest,
+            ).fetchall()
+        )
+
+    report = [
+        {
+            "page_slug": None,
+            "label": "All pages",
+            "samples": page_samples(overall),
+            "metrics": _summarise(overall, quantiles),
+        }
+    ]
+    for slug_id in busiest:
+        report.append(
+            {
+                "page_slug": labels.get(slug_id),
+                "label": labels.get(slug_id) or "Unknown",
+                "samples": page_samples(pages[slug_id]),
+                "metrics": _summarise(pages[slug_id], quantiles),
+            }
+        )
+    return report
@@ -1,8 +1,10 @@
-import hashlib
+import atexit
 import json
 import os
 import re
 import sqlite3
+import threading
+import time
 from collections.abc import Sequence
 from datetime import datetime, timedelta
 from functools import wraps
@@ -11,7 +13,8 @@ from typing import Any
 from urllib.parse import parse_qs, quote_plus, urlparse
 
 import click
-from flask import (Flask, abort, flash, g, redirect, render_template, request,
+from flask import (Flask, Response, abort, copy_current_request_context,
+                   flash, g, jsonify, redirect, render_template, request,
                    send_from_directory, session, url_for)
 from flask.typing import ResponseReturnValue
 from flask_compress import Compress
@@ -21,6 +24,25 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 
+from analytics import attribution as analytics_attribution
+from analytics import columnar as analytics_columnar
+from analytics import drilldown as analytics_drilldown
+from analytics import engagement as analytics_engagement
+from analytics import export as analytics_export
+from analytics import geoip as analytics_geoip
+from analytics import referrers as analytics_referrers
+from analytics import retention as analytics_retention
+from analytics import report as analytics_report
+from analytics import rollups as analytics_rollups
+from analytics import snapshots as analytics_snapshots
+from analytics import spool as analytics_spool
+from analytics import storage as analytics_storage
+from analytics import vitals as analytics_vitals
+from analytics.buffer import EventBuffer
+from analytics.canonical import Canonicalizer
+from analytics.guard import IngestGuard
+from analytics.ingest import BeaconDispatcher, BeaconIngest, BeaconRequest, IngestApp
+from analytics.user_agents import UserAgentClassifier
 from scripts import process_images as process_images_module
 
 LEAD_STATUSES = [
@@ -888,30 +910,6 @@ NOINDEX_SLUGS: frozenset[str] = frozenset(
     }
 )
 
-SOCIAL_DOMAINS = (
-    "facebook.com",
-    "instagram.com",
-    "twitter.com",
-    "t.co",
-    "linkedin.com",
-    "youtube.com",
-    "tiktok.com",
-    "snapchat.com",
-    "pinterest.com",
-)
-
-SEARCH_DOMAINS = (
-    "google.",
-    "bing.",
-    "yahoo.",
-    "duckduckgo.",
-    "baidu.",
-    "yandex.",
-    "ask.com",
-    "ecosia.org",
-)
-
-
 BLOG_IMAGE_FIELD_MAP: dict[str, tuple[str, str, str]] = {
     "thumbnail": ("thumbnail_path", "thumbnail_alt", "thumbnail"),
     "cover_image": ("cover_image_path", "cover_image_alt", "cover"),
@@ -1002,6 +1000,13 @@ COURSE_RELATION_FIELDS: tuple[str, ...] = (
     "related_course_3_slug",
 )
 
+# Tracker ids posted with the site's forms, used to attribute leads and bookings.
+ATTRIBUTION_COLUMNS: dict[str, str] = {
+    "visitor_id": "TEXT",
+    "session_id": "TEXT",
+}
+ATTRIBUTION_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
 COURSE_SCHEMA_ADDITIONAL_COLUMNS: dict[str, str] = {
     "slug": "TEXT",
     "about_course": "TEXT",
@@ -1085,7 +1090,11 @@ compress = Compress()
 
 
 def create_app() -> Flask:
-    app = Flask(__name__)
+    # INSTANCE_PATH moves the CMS database and every instance-relative default
+    # (analytics database, spool, archives, backups) somewhere else, e.g. a
+    # scratch directory for benchmarks.
+    instance_override = os.environ.get("INSTANCE_PATH")
+    app = Flask(__name__, instance_path=os.path.abspath(instance_override) if instance_override else None)
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)  # type: ignore[assignment]
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "change-this-secret")
     app.config.setdefault("PREFERRED_URL_SCHEME", "https")
@@ -1222,6 +1231,171 @@ def create_app() -> Flask:
     instance_path.mkdir(parents=True, exist_ok=True)
     app.config["DATABASE"] = str(instance_path / "lmsc.sqlite3")
 
+    def env_number(name: str, default: int | float) -> int | float:
+        raw_value = os.environ.get(name)
+        if raw_value is None:
+            return default
+        try:
+            return type(default)(raw_value)
+        except ValueError:
+            return default
+
+    app.config.setdefault(
+        "ANALYTICS_DATABASE",
+        os.environ.get("ANALYTICS_DATABASE", str(instance_path / "analytics.sqlite3")),
+    )
+    app.config.setdefault("ANALYTICS_DB_CACHE_KIB", env_number("ANALYTICS_DB_CACHE_KIB", 16_384))
+    app.config.setdefault(
+        "ANALYTICS_BACKUP_DIR",
+        os.environ.get("ANALYTICS_BACKUP_DIR", str(instance_path / "backups")),
+    )
+    app.config.setdefault("ANALYTICS_BACKUP_KEEP", env_number("ANALYTICS_BACKUP_KEEP", 7))
+
+    def connect_analytics_db() -> sqlite3.Connection:
+        return analytics_storage.connect(
+            app.config["ANALYTICS_DATABASE"],
+            cache_size_kib=app.config["ANALYTICS_DB_CACHE_KIB"],
+        )
+
+    app.config.setdefault("ANALYTICS_BUFFER_SIZE", env_number("ANALYTICS_BUFFER_SIZE", 100))
+    app.config.setdefault("ANALYTICS_FLUSH_SECONDS", env_number("ANALYTICS_FLUSH_SECONDS", 2.0))
+    app.config.setdefault("ANALYTICS_MAX_PENDING", env_number("ANALYTICS_MAX_PENDING", 10_000))
+    app.config.setdefault("ANALYTICS_MAX_BATCH_EVENTS", env_number("ANALYTICS_MAX_BATCH_EVENTS", 50))
+
+    dimension_interner = analytics_storage.DimensionInterner()
+    app.extensions["analytics_dimensions"] = dimension_interner
+
+    # Event types other than page views and the writer that stores each one.
+    analytics_event_writers: dict[str, analytics_storage.EventWriter] = {
+        "vitals": analytics_vitals.write_events,
+        "engagement": analytics_engagement.write_events,
+        "conversion": analytics_attribution.write_events,
+    }
+
+    def write_analytics_events(conn: sqlite3.Connection, events: Sequence[dict[str, Any]]) -> int:
+        return analytics_storage.write_events(
+            conn, events, interner=dimension_interner, writers=analytics_event_writers
+        )
+
+    def write_analytics_batch(events: Sequence[dict[str, Any]]) -> None:
+        conn = connect_analytics_db()
+        try:
+            analytics_storage.insert_events(
+                conn, events, interner=dimension_interner, writers=analytics_event_writers
+            )
+        finally:
+            conn.close()
+
+    analytics_buffer = EventBuffer(
+        write_analytics_batch,
+        max_size=app.config["ANALYTICS_BUFFER_SIZE"],
+        max_age=app.config["ANALYTICS_FLUSH_SECONDS"],
+        max_pending=app.config["ANALYTICS_MAX_PENDING"],
+    )
+    app.extensions["analytics_buffer"] = analytics_buffer
+
+    app.config.setdefault("ANALYTICS_INGEST_MODE", os.environ.get("ANALYTICS_INGEST_MODE", "buffer"))
+    app.config.setdefault(
+        "ANALYTICS_SPOOL_DIR",
+        os.environ.get("ANALYTICS_SPOOL_DIR", str(instance_path / "analytics_spool")),
+    )
+    app.config.setdefault(
+        "ANALYTICS_SPOOL_SEGMENT_BYTES",
+        env_number("ANALYTICS_SPOOL_SEGMENT_BYTES", 4 * 1024 * 1024),
+    )
+    app.config.setdefault("ANALYTICS_SPOOL_SEGMENT_SECONDS", env_number("ANALYTICS_SPOOL_SEGMENT_SECONDS", 60.0))
+    app.config.setdefault("ANALYTICS_SPOOL_AUTOLOAD_SECONDS", env_number("ANALYTICS_SPOOL_AUTOLOAD_SECONDS", 0.0))
+
+    spool_writer: analytics_spool.SpoolWriter | None = None
+    if app.config["ANALYTICS_INGEST_MODE"] == "spool":
+        spool_writer = analytics_spool.SpoolWriter(
+            app.config["ANALYTICS_SPOOL_DIR"],
+            max_bytes=app.config["ANALYTICS_SPOOL_SEGMENT_BYTES"],
+            max_age=app.config["ANALYTICS_SPOOL_SEGMENT_SECONDS"],
+        )
+        atexit.register(spool_writer.close)
+    app.extensions["analytics_spool"] = spool_writer
+
+    app.config.setdefault("ANALYTICS_DEDUPE_SECONDS", env_number("ANALYTICS_DEDUPE_SECONDS", 10.0))
+    app.config.setdefault("ANALYTICS_IP_RATE", env_number("ANALYTICS_IP_RATE", 10.0))
+    app.config.setdefault("ANALYTICS_IP_BURST", env_number("ANALYTICS_IP_BURST", 100.0))
+    app.config.setdefault("ANALYTICS_VISITOR_RATE", env_number("ANALYTICS_VISITOR_RATE", 2.0))
+    app.config.setdefault("ANALYTICS_VISITOR_BURST", env_number("ANALYTICS_VISITOR_BURST", 30.0))
+
+    ingest_guard = IngestGuard(
+        dedupe_seconds=app.config["ANALYTICS_DEDUPE_SECONDS"],
+        ip_rate=app.config["ANALYTICS_IP_RATE"],
+        ip_burst=app.config["ANALYTICS_IP_BURST"],
+        visitor_rate=app.config["ANALYTICS_VISITOR_RATE"],
+        visitor_burst=app.config["ANALYTICS_VISITOR_BURST"],
+    )
+    app.extensions["analytics_guard"] = ingest_guard
+
+    def enqueue_analytics_events(events: Sequence[dict[str, Any]]) -> None:
+        if spool_writer is not None:
+            spool_writer.append(events)
+        else:
+            analytics_buffer.extend(events)
+
+    def load_analytics_spool(limit: int | None = None) -> analytics_spool.LoadResult:
+        spool_dir = app.config["ANALYTICS_SPOOL_DIR"]
+        if spool_writer is not None:
+            spool_writer.rotate_if_due()
+        analytics_spool.seal_orphaned_segments(spool_dir, max_age=app.config["ANALYTICS_SPOOL_SEGMENT_SECONDS"])
+        conn = connect_analytics_db()
+        try:
+            return analytics_spool.load_segments(
+                conn,
+                spool_dir,
+                write_analytics_events,
+                limit=limit,
+            )
+        finally:
+            conn.close()
+
+    if spool_writer is not None and app.config["ANALYTICS_SPOOL_AUTOLOAD_SECONDS"] > 0:
+        analytics_spool.start_autoloader(
+            app.config["ANALYTICS_SPOOL_AUTOLOAD_SECONDS"], load_analytics_spool, logger=app.logger
+        )
+
+    app.config.setdefault("ANALYTICS_RETENTION_DAYS", env_number("ANALYTICS_RETENTION_DAYS", 400))
+    app.config.setdefault("ANALYTICS_RETENTION_BATCH_SIZE", env_number("ANALYTICS_RETENTION_BATCH_SIZE", 5000))
+    app.config.setdefault(
+        "ANALYTICS_ARCHIVE_DIR",
+        os.environ.get("ANALYTICS_ARCHIVE_DIR", str(instance_path / "analytics_archive")),
+    )
+
+    # "rollups" answers the report from the SQL roll-ups; "columnar" keeps recent
+    # events in per-worker NumPy arrays and falls back to the roll-ups without NumPy.
+    app.config.setdefault("ANALYTICS_REPORT_ENGINE", os.environ.get("ANALYTICS_REPORT_ENGINE", "rollups"))
+    app.config.setdefault(
+        "ANALYTICS_COLUMNAR_DAYS",
+        env_number("ANALYTICS_COLUMNAR_DAYS", app.config["ANALYTICS_RETENTION_DAYS"]),
+    )
+    columnar_engine: analytics_columnar.EventColumns | None = None
+    if app.config["ANALYTICS_REPORT_ENGINE"] == "columnar":
+        if analytics_columnar.available():
+            columnar_engine = analytics_columnar.EventColumns(window_days=int(app.config["ANALYTICS_COLUMNAR_DAYS"]))
+        else:
+            app.logger.warning("ANALYTICS_REPORT_ENGINE=columnar needs NumPy; using the SQL roll-ups instead.")
+    app.extensions["analytics_columnar"] = columnar_engine
+
+    # Computed report panels are reused while the roll-up version is unchanged
+    # and younger than the TTL; older ones are served while a thread recomputes them.
+    app.config.setdefault("ANALYTICS_REPORT_CACHE_SECONDS", env_number("ANALYTICS_REPORT_CACHE_SECONDS", 60.0))
+    app.config.setdefault("ANALYTICS_REPORT_STALE_SECONDS", env_number("ANALYTICS_REPORT_STALE_SECONDS", 600.0))
+    report_cache = analytics_snapshots.ReportCache(
+        ttl_seconds=app.config["ANALYTICS_REPORT_CACHE_SECONDS"],
+        stale_seconds=app.config["ANALYTICS_REPORT_STALE_SECONDS"],
+        max_entries=256,
+    )
+    app.extensions["analytics_report_cache"] = report_cache
+
+    # Raw-event exports each hold a worker thread for as long as the download
+    # runs, so only this many run at once per worker; others are turned away.
+    app.config.setdefault("ANALYTICS_EXPORT_CONCURRENCY", env_number("ANALYTICS_EXPORT_CONCURRENCY", 2))
+    analytics_export_slots = threading.BoundedSemaphore(max(1, int(app.config["ANALYTICS_EXPORT_CONCURRENCY"])))
+
     def slugify(value: str) -> str:
         value = re.sub(r"[^A-Za-z0-9]+", "-", value.strip().lower())
         value = re.sub(r"-+", "-", value).strip("-")
@@ -1502,73 +1676,46 @@ def create_app() -> Flask:
     app.jinja_env.filters["hero_highlight"] = apply_hero_highlights
     app.jinja_env.filters["richtext"] = render_rich_text
 
-    def is_probably_bot(user_agent: str) -> bool:
-        if not user_agent:
-            return False
-        lowered = user_agent.lower()
-        bot_tokens = (
-            "bot",
-            "spider",
-            "crawl",
-            "slurp",
-            "phantom",
-            "headless",
-            "pingdom",
-        )
-        return any(token in lowered for token in bot_tokens)
-
-    def detect_device_details(user_agent: str) -> tuple[str, str]:
-        ua = (user_agent or "").lower()
-        device_type = "Desktop"
-        if "ipad" in ua or "tablet" in ua:
-            device_type = "Tablet"
-        elif "mobile" in ua or "iphone" in ua or "android" in ua:
-            device_type = "Mobile"
-
-        device_os = "Other"
-        if "windows" in ua:
-            device_os = "Windows"
-        elif "mac os" in ua or "macintosh" in ua:
-            device_os = "macOS"
-        elif "iphone" in ua or "ipad" in ua or "ios" in ua:
-            device_os = "iOS"
-        elif "android" in ua:
-            device_os = "Android"
-        elif "linux" in ua:
-            device_os = "Linux"
-
-        return device_type, device_os
-
-    def extract_country_from_headers(req, language: str | None) -> str:
+    app.config.setdefault("ANALYTICS_UA_CACHE_SIZE", env_number("ANALYTICS_UA_CACHE_SIZE", 4096))
+    ua_classifier = UserAgentClassifier(cache_size=app.config["ANALYTICS_UA_CACHE_SIZE"])
+    app.extensions["analytics_user_agents"] = ua_classifier
+
+    app.config.setdefault(
+        "ANALYTICS_REFERRER_REFRESH_SECONDS", env_number("ANALYTICS_REFERRER_REFRESH_SECONDS", 30.0)
+    )
+    referrer_classifier = analytics_referrers.ReferrerClassifier(
+        connect_analytics_db,
+        refresh_seconds=app.config["ANALYTICS_REFERRER_REFRESH_SECONDS"],
+    )
+    app.extensions["analytics_referrers"] = referrer_classifier
+
+    app.config.setdefault(
+        "ANALYTICS_GEOIP_DATABASE",
+        os.environ.get("ANALYTICS_GEOIP_DATABASE", str(instance_path / "geoip.bin")),
+    )
+    geoip_resolver = analytics_geoip.GeoIPResolver(app.config["ANALYTICS_GEOIP_DATABASE"])
+    app.extensions["analytics_geoip"] = geoip_resolver
+
+    def extract_country_from_headers(headers, client_ip: str | None, language: str | None) -> str:
         header_keys = (
             "CF-IPCountry",
             "X-Appengine-Country",
             "X-Country-Code",
         )
         for key in header_keys:
-            value = req.headers.get(key)
+            value = headers.get(key)
             if value and value not in {"", "XX"}:
                 return value.upper()
 
+        country = geoip_resolver.country_for(client_ip)
+        if country:
+            return country
+
         if language and "-" in language:
             return language.split("-")[-1].upper()
 
         return "Unknown"
 
-    def extract_slug_from_path(path: str | None) -> str | None:
-        if not path:
-            return None
-        clean_path = path.split("?")[0].split("#")[0]
-        if clean_path == "/":
-            return "home"
-        stripped = clean_path.strip("/")
-        if not stripped:
-            return "home"
-        parts = stripped.split("/")
-        if parts[0] == "pages" and len(parts) > 1:
-            return parts[1]
-        return parts[-1]
-
     def classify_traffic_source(
         url: str | None,
         referrer: str | None,
@@ -1616,12 +1763,8 @@ def create_app() -> Flask:
         elif referrer_domain:
             if host and referrer_domain.endswith(host):
                 traffic_source = "Internal"
-            elif any(token in referrer_domain for token in SOCIAL_DOMAINS):
-                traffic_source = "Social"
-            elif any(token in referrer_domain for token in SEARCH_DOMAINS):
-                traffic_source = "Organic Search"
             else:
-                traffic_source = "Referral"
+                traffic_source = referrer_classifier.channel_for(referrer_domain) or "Referral"
         else:
             traffic_source = "Direct"
 
@@ -1680,17 +1823,38 @@ def create_app() -> Flask:
         db.execute("CREATE INDEX IF NOT EXISTS idx_courses_order ON courses(display_order, title)")
         db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_courses_slug ON courses(slug)")
 
+    def ensure_attribution_schema(db: sqlite3.Connection) -> None:
+        for table in ("leads", "consultations"):
+            existing_columns = {
+                row["name"] for row in db.execute(f"PRAGMA table_info({table})").fetchall()
+            }
+            for column, definition in ATTRIBUTION_COLUMNS.items():
+                if column not in existing_columns:
+                    db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})")
+
     def get_db() -> sqlite3.Connection:
         if "db" not in g:
             g.db = sqlite3.connect(app.config["DATABASE"])
             g.db.row_factory = sqlite3.Row
         return g.db
 
+    def get_analytics_db() -> sqlite3.Connection:
+        """Analytics database for the request, with the CMS database attached as ``cms``."""
+
+        if "analytics_db" not in g:
+            g.analytics_db = connect_analytics_db()
+            g.analytics_db.execute("ATTACH DATABASE ? AS cms", (app.config["DATABASE"],))
+        return g.analytics_db
+
     @app.teardown_appcontext
     def close_db(exception: Exception | None = None) -> None:
         db = g.pop("db", None)
         if db is not None:
             db.close()
+        analytics_db = g.pop("analytics_db", None)
+        if analytics_db is not None:
+            analytics_db.close()
 
     def current_timestamp() -> str:
         return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
@@ -1713,6 +1877,7 @@ def create_app() -> Flask:
             )
             """
         )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_leads_created_at ON leads(created_at)")
         db.execute(
             """
             CREATE TABLE IF NOT EXISTS consultations (
@@ -1742,6 +1907,7 @@ def create_app() -> Flask:
         db.execute(
             "CREATE INDEX IF NOT EXISTS idx_consultations_status ON consultations(status)"
         )
+        ensure_attribution_schema(db)
         db.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -1896,43 +2062,6 @@ def create_app() -> Flask:
         db.execute(
             "CREATE INDEX IF NOT EXISTS idx_prospectus_active ON prospectus_versions(is_active)"
         )
-        db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS analytics_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                visitor_id TEXT,
-                session_id TEXT,
-                page_slug TEXT,
-                page_title TEXT,
-                path TEXT,
-                url TEXT,
-                referrer TEXT,
-                referrer_domain TEXT,
-                traffic_source TEXT,
-                utm_source TEXT,
-                utm_medium TEXT,
-                utm_campaign TEXT,
-                device_type TEXT,
-                device_os TEXT,
-                language TEXT,
-                country TEXT,
-                timezone TEXT,
-                screen_width INTEGER,
-                screen_height INTEGER,
-                is_session_start INTEGER DEFAULT 0,
-                created_at TEXT NOT NULL
-            )
-            """
-        )
-        db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_analytics_created_at ON analytics_events(created_at)"
-        )
-        db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_analytics_session ON analytics_events(session_id)"
-        )
-        db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_analytics_slug ON analytics_events(page_slug)"
-        )
         db.commit()
 
     def ensure_default_admin() -> None:
@@ -2078,7 +2207,7 @@ def create_app() -> Flask:
     def fetch_all_leads() -> list[sqlite3.Row]:
         db = get_db()
         return db.execute(
-            "SELECT * FROM leads ORDER BY datetime(created_at) DESC"
+            "SELECT * FROM leads ORDER BY created_at DESC"
         ).fetchall()
 
     def fetch_all_pages() -> list[sqlite3.Row]:
@@ -3195,17 +3324,46 @@ def create_app() -> Flask:
         phone: str | None = None,
         message: str | None = None,
         source: str | None = None,
+        visitor_id: str | None = None,
+        session_id: str | None = None,
     ) -> None:
         db = get_db()
         timestamp = current_timestamp()
         db.execute(
             """
-            INSERT INTO leads (lead_type, full_name, email, phone, message, source, status, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, 'New', ?, ?)
+            INSERT INTO leads (
+                lead_type, full_name, email, phone, message, source, status, visitor_id, session_id, created_at, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, 'New', ?, ?, ?, ?)
             """,
-            (lead_type, full_name, email, phone, message, source, timestamp, timestamp),
+            (lead_type, full_name, email, phone, message, source, visitor_id, session_id, timestamp, timestamp),
         )
         db.commit()
+        record_conversion("lead", visitor_id, session_id, timestamp)
+
+    def form_attribution() -> dict[str, str | None]:
+        """Tracker visitor and session ids posted with a form, when well formed."""
+
+        return {
+            column: value if ATTRIBUTION_ID_PATTERN.match(value := request.form.get(column, "").strip()) else None
+            for column in ATTRIBUTION_COLUMNS
+        }
+
+    def record_conversion(kind: str, visitor_id: str | None, session_id: str | None, created_at: str) -> None:
+        try:
+            enqueue_analytics_events(
+                [
+                    {
+                        "type": "conversion",
+                        "kind": kind,
+                        "visitor_id": visitor_id,
+                        "session_id": session_id,
+                        "created_at": created_at,
+                    }
+                ]
+            )
+        except Exception:  # attribution must never fail a form submission
+            app.logger.exception("Could not queue %s conversion for attribution", kind)
 
     def update_lead_status_db(lead_id: int, status: str) -> None:
         db = get_db()
@@ -3283,10 +3441,12 @@ def create_app() -> Flask:
                 notes,
                 status,
                 source,
+                visitor_id,
+                session_id,
                 created_at,
                 updated_at
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 data.get("full_name"),
@@ -3303,11 +3463,14 @@ def create_app() -> Flask:
                 data.get("notes"),
                 data.get("status", "Pending"),
                 data.get("source"),
+                data.get("visitor_id"),
+                data.get("session_id"),
                 now,
                 now,
             ),
         )
         db.commit()
+        record_conversion("booking", data.get("visitor_id"), data.get("session_id"), now)
         return int(cursor.lastrowid)
 
     def get_consultation(consultation_id: int) -> sqlite3.Row | None:
@@ -3413,8 +3576,38 @@ def create_app() -> Flask:
             return target
         return None
 
+    def init_analytics_db() -> None:
+        db = get_db()
+        has_legacy_tables = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_events'"
+        ).fetchone()
+        if has_legacy_tables:
+            # Older installs kept analytics in the CMS database; bring those
+            # tables up to date so they can be copied across column for column.
+            analytics_storage.ensure_schema(db)
+            analytics_referrers.ensure_table(db)
+            db.commit()
+
+        conn = connect_analytics_db()
+        try:
+            analytics_storage.ensure_schema(conn)
+            analytics_referrers.ensure_table(conn)
+            analytics_retention.ensure_tables(conn)
+            analytics_spool.ensure_checkpoint_table(conn)
+            analytics_vitals.ensure_table(conn)
+            analytics_engagement.ensure_table(conn)
+            analytics_rollups.ensure_tables(conn)
+            conn.commit()
+            if has_legacy_tables:
+                moved = analytics_storage.move_tables(conn, app.config["DATABASE"])
+                app.logger.info("Moved %s into %s", ", ".join(moved), app.config["ANALYTICS_DATABASE"])
+                analytics_rollups.rebuild(conn)
+        finally:
+            conn.close()
+
     with app.app_context():
         init_db()
+        init_analytics_db()
         ensure_default_admin()
         seed_existing_pages()
         ensure_consultation_page_seed()
@@ -3636,6 +3829,7 @@ def create_app() -> Flask:
             selected_time = request.form.get("selected_time", "").strip()
             notes = request.form.get("notes", "").strip()
             source = request.form.get("source") or request.path
+            attribution = form_attribution()
 
             errors: list[str] = []
             if not full_name:
@@ -3683,6 +3877,7 @@ def create_app() -> Flask:
                 "notes": notes or None,
                 "status": "Pending",
                 "source": source,
+                **attribution,
             }
 
             booking_id = create_consultation_booking(booking_payload)
@@ -3693,6 +3888,7 @@ def create_app() -> Flask:
                 phone=phone or None,
                 message=f"Consultation booked for {selected_date} at {selected_time}" if selected_date and selected_time else notes,
                 source=source,
+                **attribution,
             )
 
             booking_row = get_consultation(booking_id)
@@ -3833,6 +4029,7 @@ def create_app() -> Flask:
                     phone=phone,
                     message=message,
                     source=source,
+                    **form_attribution(),
                 )
                 flash("Thanks for reaching out — our admissions team will respond soon.", "success")
                 return redirect(url_for("contact"))
@@ -3860,118 +4057,52 @@ def create_app() -> Flask:
             flash("Please enter an email address to subscribe.", "error")
             return redirect(request.referrer or url_for("index"))
 
-        create_lead("subscription", email=email, source=source)
+        create_lead("subscription", email=email, source=source, **form_attribution())
         flash("Thanks for subscribing — we will keep you updated.", "success")
         return redirect(request.referrer or url_for("index"))
 
+    app.config.setdefault("ANALYTICS_RAW_INGEST", os.environ.get("ANALYTICS_RAW_INGEST", "1") == "1")
+
+    beacon_ingest = BeaconIngest(
+        user_agents=ua_classifier,
+        classify_source=classify_traffic_source,
+        country_for=extract_country_from_headers,
+        canonicalizer=Canonicalizer(app.url_map),
+        guard=ingest_guard,
+        enqueue=enqueue_analytics_events,
+        max_batch_events=app.config["ANALYTICS_MAX_BATCH_EVENTS"],
+    )
+    app.extensions["analytics_ingest"] = beacon_ingest
+
+    if app.config["ANALYTICS_RAW_INGEST"]:
+        # Beacons bypass ProxyFix, the HTTPS redirect, sessions and compression;
+        # the Flask route below still serves them when this is switched off.
+        app.wsgi_app = BeaconDispatcher(  # type: ignore[assignment]
+            app.wsgi_app,
+            IngestApp(beacon_ingest, logger=app.logger),
+            path="/analytics/track",
+        )
+
     @app.post("/analytics/track")
     def analytics_track():
         if not request.is_json:
             return ("", 204)
 
-        origin = request.headers.get("Origin")
-        if origin and not origin.startswith(request.host_url.rstrip("/")):
-            return ("", 204)
-
-        payload = request.get_json(silent=True) or {}
-        path = str(payload.get("path") or "")
-        if path.startswith("/admin"):
-            return ("", 204)
-
-        user_agent = request.headers.get("User-Agent", "")
-        if is_probably_bot(user_agent):
-            return ("", 204)
-
-        url_value = payload.get("url")
-        if not path and url_value:
-            try:
-                path = urlparse(url_value).path or ""
-            except ValueError:
-                path = ""
-
-        referrer_value = payload.get("referrer") or request.referrer
-
-        language = payload.get("language")
-        visitor_id = payload.get("visitor_id")
-        if not visitor_id:
-            fallback_key = f"{request.headers.get('X-Forwarded-For', request.remote_addr)}|{user_agent}"
-            visitor_id = hashlib.sha256(fallback_key.encode("utf-8", "ignore")).hexdigest()[:32]
-
-        session_id = payload.get("session_id")
-        if not session_id:
-            session_hash_source = f"{visitor_id}|{payload.get('is_session_start')}|{current_timestamp()}"
-            session_id = hashlib.sha256(session_hash_source.encode("utf-8", "ignore")).hexdigest()[:32]
-
-        page_slug = payload.get("page_slug") or extract_slug_from_path(path)
-        page_title = payload.get("page_title")
-
-        traffic_source, utm_source, utm_medium, utm_campaign, referrer_domain = classify_traffic_source(
-            url_value,
-            referrer_value,
-            request.host or "",
+        beacon = BeaconRequest(
+            user_agent=request.headers.get("User-Agent", ""),
+            client_ip=request.remote_addr,
+            host=request.host,
+            host_url=request.host_url,
+            referrer=request.referrer,
+            headers=request.headers,
         )
+        if not beacon_ingest.accepts_origin(request.headers.get("Origin"), beacon):
+            return ("", 204)
 
-        country = extract_country_from_headers(request, language)
-        timezone = payload.get("timezone")
-        screen_width = safe_int(payload.get("screen_width"))
-        screen_height = safe_int(payload.get("screen_height"))
-        is_session_start = 1 if payload.get("is_session_start") else 0
-
-        device_type, device_os = detect_device_details(user_agent)
-
-        db = get_db()
-        db.execute(
-            """
-            INSERT INTO analytics_events (
-                visitor_id,
-                session_id,
-                page_slug,
-                page_title,
-                path,
-                url,
-                referrer,
-                referrer_domain,
-                traffic_source,
-                utm_source,
-                utm_medium,
-                utm_campaign,
-                device_type,
-                device_os,
-                language,
-                country,
-                timezone,
-                screen_width,
-                screen_height,
-                is_session_start,
-                created_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                visitor_id,
-                session_id,
-                page_slug,
-                page_title,
-                path or None,
-                url_value,
-                referrer_value,
-                referrer_domain,
-                traffic_source,
-                utm_source,
-                utm_medium,
-                utm_campaign,
-                device_type,
-                device_os,
-                language,
-                country,
-                timezone,
-                screen_width,
-                screen_height,
-                is_session_start,
-                current_timestamp(),
-            ),
-        )
-        db.commit()
+        try:
+            beacon_ingest.handle(request.get_json(silent=True), beacon)
+        except Exception:  # a beacon must never surface a server error, as in IngestApp
+            app.logger.exception("Analytics beacon failed")
         return ("", 204)
 
     @app.route("/admin/login", methods=["GET", "POST"])
@@ -4015,8 +4146,10 @@ def create_app() -> Flask:
         leads = fetch_all_leads()
 
         total_leads = db.execute("SELECT COUNT(*) AS total FROM leads").fetchone()["total"]
+        now_utc = datetime.utcnow()
         weekly_leads = db.execute(
-            "SELECT COUNT(*) AS total FROM leads WHERE datetime(created_at) >= datetime('now', '-7 day')"
+            "SELECT COUNT(*) AS total FROM leads WHERE created_at >= ?",
+            ((now_utc - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S"),),
         ).fetchone()["total"]
         status_rows = db.execute(
             "SELECT status, COUNT(*) AS total FROM leads GROUP BY status"
@@ -4034,17 +4167,18 @@ def create_app() -> Flask:
         conversion_rate = round((converted_count / total_leads) * 100, 1) if total_leads else 0.0
 
         last_seven_days = [
-            (datetime.utcnow() - timedelta(days=offset)).strftime("%Y-%m-%d")
+            (now_utc - timedelta(days=offset)).strftime("%Y-%m-%d")
             for offset in range(6, -1, -1)
         ]
         trend_rows = db.execute(
             """
-            SELECT DATE(created_at) AS day, COUNT(*) AS total
+            SELECT substr(created_at, 1, 10) AS day, COUNT(*) AS total
             FROM leads
-            WHERE datetime(created_at) >= datetime('now', '-6 day')
-            GROUP BY DATE(created_at)
-            ORDER BY DATE(created_at)
-            """
+            WHERE created_at >= ?
+            GROUP BY day
+            ORDER BY day
+            """,
+            ((now_utc - timedelta(days=6)).strftime("%Y-%m-%d %H:%M:%S"),),
         ).fetchall()
         trend_map = {row["day"]: row["total"] for row in trend_rows}
 
@@ -4275,98 +4409,110 @@ def create_app() -> Flask:
             flash("Consultation status updated.", "success")
         return redirect(request.referrer or url_for("admin_consultations"))
 
-    @app.route("/admin/analytics")
-    @login_required
-    def admin_analytics() -> str:
-        db = get_db()
-        allowed_ranges = [7, 30, 60, 90, 180]
+    analytics_ranges = [7, 30, 60, 90, 180]
+    # Panels whose figures include unique visitors, which ?exact=1 counts exactly.
+    analytics_exact_panels = {"kpis", "countries"}
+
+    def analytics_report_args() -> tuple[int, bool]:
         try:
             range_days = int(request.args.get("range", "30"))
         except ValueError:
             range_days = 30
-        if range_days not in allowed_ranges:
+        if range_days not in analytics_ranges:
             range_days = 30
+        # Unique visitors come from HyperLogLog sketches unless asked for exactly.
+        return range_days, request.args.get("exact") == "1"
+
+    def analytics_scope(range_days: int, exact: bool) -> dict[str, Any]:
+        today = int(time.time()) // analytics_storage.SECONDS_PER_DAY
+        start_day = today - range_days + 1
+        return {
+            "range_days": range_days,
+            "exact": exact,
+            "today": today,
+            "start_day": start_day,
+            "previous_start_day": start_day - range_days,
+            "range_label": f"Last {range_days} days",
+            "comparison_label": f"vs previous {range_days} days",
+        }
 
-        current_range_label = f"-{range_days} day"
-        previous_range_label = f"-{2 * range_days} day"
-        comparison_label = f"vs previous {range_days} days"
-        range_label = f"Last {range_days} days"
+    def cached_analytics_report(key: Any, build: Any) -> tuple[Any, float]:
+        return report_cache.get(
+            key,
+            analytics_rollups.version(get_analytics_db()),
+            build,
+            background=copy_current_request_context(build),
+        )
 
-        totals = db.execute(
-            """
-            SELECT
-                COUNT(*) AS page_views,
-                COUNT(DISTINCT visitor_id) AS unique_visitors,
-                COUNT(DISTINCT session_id) AS sessions
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            """,
-            (current_range_label,),
-        ).fetchone()
+    def analytics_share(part: int, whole: int) -> float:
+        return round((part / whole) * 100, 1) if whole else 0.0
 
-        previous_totals = db.execute(
-            """
-            SELECT
-                COUNT(*) AS page_views,
-                COUNT(DISTINCT visitor_id) AS unique_visitors,
-                COUNT(DISTINCT session_id) AS sessions
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-              AND datetime(created_at) < datetime('now', ?)
-            """,
-            (previous_range_label, current_range_label),
-        ).fetchone()
+    def analytics_page_url(slug: str | None, path_value: str | None) -> str:
+        if slug:
+            endpoint = PAGE_ENDPOINT_OVERRIDES.get(slug)
+            if endpoint:
+                try:
+                    return url_for(endpoint)
+                except Exception:
+                    pass
+            try:
+                return url_for("render_dynamic_page", slug=slug)
+            except Exception:
+                pass
+        if path_value:
+            return path_value
+        return "#"
 
-        page_views = totals["page_views"] or 0
-        unique_visitors = totals["unique_visitors"] or 0
-        sessions = totals["sessions"] or 0
+    def analytics_events(scope: dict[str, Any]) -> dict[str, Any] | None:
+        """The columnar engine's event report for the range, shared by the panels built from it."""
 
-        prev_page_views = previous_totals["page_views"] or 0
-        prev_unique_visitors = previous_totals["unique_visitors"] or 0
-        prev_sessions = previous_totals["sessions"] or 0
+        if columnar_engine is None:
+            return None
 
-        session_summary = db.execute(
-            """
-            SELECT
-                SUM(CASE WHEN views = 1 THEN 1 ELSE 0 END) AS single_page_sessions,
-                COUNT(*) AS total_sessions
-            FROM (
-                SELECT session_id, COUNT(*) AS views
-                FROM analytics_events
-                WHERE datetime(created_at) >= datetime('now', ?)
-                GROUP BY session_id
-            )
-            """,
-            (current_range_label,),
-        ).fetchone()
+        def build() -> dict[str, Any]:
+            return columnar_engine.event_report(get_analytics_db(), scope["start_day"], scope["today"])
 
-        previous_session_summary = db.execute(
-            """
-            SELECT
-                SUM(CASE WHEN views = 1 THEN 1 ELSE 0 END) AS single_page_sessions,
-                COUNT(*) AS total_sessions
-            FROM (
-                SELECT session_id, COUNT(*) AS views
-                FROM analytics_events
-                WHERE datetime(created_at) >= datetime('now', ?)
-                  AND datetime(created_at) < datetime('now', ?)
-                GROUP BY session_id
+        return cached_analytics_report(("events", scope["range_days"]), build)[0]
+
+    def analytics_breakdown(db: sqlite3.Connection, scope: dict[str, Any], dimension: str, fallback: str) -> list[dict[str, Any]]:
+        events = analytics_events(scope)
+        if events is not None:
+            rows = events["breakdowns"][dimension]
+        else:
+            rows = analytics_report.breakdown(
+                db,
+                dimension,
+                scope["start_day"],
+                scope["today"],
+                limit=analytics_report.BREAKDOWN_LIMITS[dimension],
             )
-            """,
-            (previous_range_label, current_range_label),
-        ).fetchone()
+        return [{"value": row["value"] or fallback, "visits": row["page_views"]} for row in rows]
+
+    def analytics_kpis_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        range_days = scope["range_days"]
+        current_start_day = scope["start_day"]
+        previous_start_day = scope["previous_start_day"]
+        day_seconds = analytics_storage.SECONDS_PER_DAY
+        current_start_at = datetime.utcfromtimestamp(current_start_day * day_seconds).strftime("%Y-%m-%d %H:%M:%S")
+        previous_start_at = datetime.utcfromtimestamp(previous_start_day * day_seconds).strftime("%Y-%m-%d %H:%M:%S")
+        comparison_label = scope["comparison_label"]
+
+        # Sessions are attributed to the day they started on.
+        totals = analytics_report.period_totals(db, current_start_day, scope["today"], exact=scope["exact"])
+        previous_totals = analytics_report.period_totals(
+            db, previous_start_day, current_start_day - 1, exact=scope["exact"]
+        )
 
-        single_page_sessions = session_summary["single_page_sessions"] or 0
-        total_sessions = session_summary["total_sessions"] or 0
-        bounce_rate = round((single_page_sessions / total_sessions) * 100, 1) if total_sessions else 0.0
+        page_views = totals["page_views"]
+        unique_visitors = totals["unique_visitors"]
+        sessions = totals["sessions"]
 
-        prev_single_page_sessions = previous_session_summary["single_page_sessions"] or 0
-        prev_total_sessions = previous_session_summary["total_sessions"] or 0
-        prev_bounce_rate = (
-            round((prev_single_page_sessions / prev_total_sessions) * 100, 1)
-            if prev_total_sessions
-            else 0.0
-        )
+        prev_page_views = previous_totals["page_views"]
+        prev_unique_visitors = previous_totals["unique_visitors"]
+        prev_sessions = previous_totals["sessions"]
+
+        bounce_rate = analytics_share(totals["single_page_sessions"], sessions)
+        prev_bounce_rate = analytics_share(previous_totals["single_page_sessions"], prev_sessions)
 
         avg_pages_per_session = round(page_views / sessions, 2) if sessions else 0.0
         prev_avg_pages_per_session = round(prev_page_views / prev_sessions, 2) if prev_sessions else 0.0
@@ -4374,65 +4520,30 @@ def create_app() -> Flask:
         lead_row = db.execute(
             """
             SELECT COUNT(*) AS total
-            FROM leads
-            WHERE datetime(created_at) >= datetime('now', ?)
+            FROM cms.leads
+            WHERE created_at >= ?
             """,
-            (current_range_label,),
+            (current_start_at,),
         ).fetchone()
         lead_count = lead_row["total"] or 0
-        conversion_rate = round((lead_count / sessions) * 100, 1) if sessions else 0.0
+        conversion_rate = analytics_share(lead_count, sessions)
 
         prev_lead_row = db.execute(
             """
             SELECT COUNT(*) AS total
-            FROM leads
-            WHERE datetime(created_at) >= datetime('now', ?)
-              AND datetime(created_at) < datetime('now', ?)
+            FROM cms.leads
+            WHERE created_at >= ?
+              AND created_at < ?
             """,
-            (previous_range_label, current_range_label),
+            (previous_start_at, current_start_at),
         ).fetchone()
         prev_lead_count = prev_lead_row["total"] or 0
-        prev_conversion_rate = (
-            round((prev_lead_count / prev_sessions) * 100, 1)
-            if prev_sessions
-            else 0.0
-        )
+        prev_conversion_rate = analytics_share(prev_lead_count, prev_sessions)
 
-        new_visitors_row = db.execute(
-            """
-            SELECT COUNT(*) AS total
-            FROM (
-                SELECT visitor_id, MIN(datetime(created_at)) AS first_seen
-                FROM analytics_events
-                GROUP BY visitor_id
-                HAVING datetime(first_seen) >= datetime('now', ?)
-            )
-            """,
-            (current_range_label,),
-        ).fetchone()
-        new_visitors = new_visitors_row["total"] or 0
+        new_visitors = totals["new_visitors"]
         returning_visitors = max(unique_visitors - new_visitors, 0)
-        new_visitor_rate = round((new_visitors / unique_visitors) * 100, 1) if unique_visitors else 0.0
-
-        prev_new_visitors_row = db.execute(
-            """
-            SELECT COUNT(*) AS total
-            FROM (
-                SELECT visitor_id, MIN(datetime(created_at)) AS first_seen
-                FROM analytics_events
-                GROUP BY visitor_id
-                HAVING datetime(first_seen) >= datetime('now', ?)
-                  AND datetime(first_seen) < datetime('now', ?)
-            )
-            """,
-            (previous_range_label, current_range_label),
-        ).fetchone()
-        prev_new_visitors = prev_new_visitors_row["total"] or 0
-        prev_new_visitor_rate = (
-            round((prev_new_visitors / prev_unique_visitors) * 100, 1)
-            if prev_unique_visitors
-            else 0.0
-        )
+        new_visitor_rate = analytics_share(new_visitors, unique_visitors)
+        prev_new_visitor_rate = analytics_share(previous_totals["new_visitors"], prev_unique_visitors)
 
         avg_daily_views = round(page_views / range_days, 1) if range_days else page_views
         prev_avg_daily_views = round(prev_page_views / range_days, 1) if range_days else prev_page_views
@@ -4483,295 +4594,481 @@ def create_app() -> Flask:
             ),
             build_card("Avg Daily Views", avg_daily_views, prev_avg_daily_views, "decimal"),
         ]
+        return {
+            "kpi_cards": kpi_cards,
+            "lead_count": lead_count,
+            "returning_visitors": returning_visitors,
+            "new_visitors": new_visitors,
+            "new_visitor_rate": new_visitor_rate,
+            "conversion_rate": conversion_rate,
+            "page_views": page_views,
+            "sessions_total": sessions,
+            "unique_visitors": unique_visitors,
+            "bounce_rate": bounce_rate,
+            "avg_pages_per_session": avg_pages_per_session,
+        }
 
-        daily_rows = db.execute(
-            """
-            SELECT DATE(created_at) AS day,
-                   COUNT(*) AS page_views,
-                   COUNT(DISTINCT session_id) AS sessions,
-                   COUNT(DISTINCT visitor_id) AS unique_visitors
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY day
-            ORDER BY day
-            """,
-            (current_range_label,),
-        ).fetchall()
-
-        day_map = {row["day"]: row for row in daily_rows}
+    def analytics_daily_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        series = analytics_report.daily_series(db, scope["start_day"], scope["today"])
         day_labels: list[str] = []
         page_views_series: list[int] = []
         sessions_series: list[int] = []
         unique_series: list[int] = []
-        now_utc = datetime.utcnow()
-        for offset in range(range_days - 1, -1, -1):
-            day_point = now_utc - timedelta(days=offset)
-            day_key = day_point.strftime("%Y-%m-%d")
-            day_labels.append(day_point.strftime("%d %b"))
-            row = day_map.get(day_key)
-            if row:
-                page_views_series.append(row["page_views"] or 0)
-                sessions_series.append(row["sessions"] or 0)
-                unique_series.append(row["unique_visitors"] or 0)
-            else:
-                page_views_series.append(0)
-                sessions_series.append(0)
-                unique_series.append(0)
-
-        daily_chart = {
+        for day in range(scope["start_day"], scope["today"] + 1):
+            row = series.get(day, {})
+            day_labels.append(datetime.utcfromtimestamp(day * analytics_storage.SECONDS_PER_DAY).strftime("%d %b"))
+            page_views_series.append(row.get("page_views", 0))
+            sessions_series.append(row.get("sessions", 0))
+            unique_series.append(row.get("visitors", 0))
+        return {
             "labels": day_labels,
             "page_views": page_views_series,
             "sessions": sessions_series,
             "unique": unique_series,
         }
 
-        hourly_rows = db.execute(
-            """
-            SELECT STRFTIME('%H', created_at) AS hour,
-                   COUNT(*) AS visits
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY hour
-            ORDER BY hour
-            """,
-            (current_range_label,),
-        ).fetchall()
-        hour_map = {row["hour"]: row["visits"] for row in hourly_rows}
-        hourly_labels = [f"{hour:02d}:00" for hour in range(24)]
-        hourly_values = [hour_map.get(f"{hour:02d}", 0) for hour in range(24)]
-        hourly_chart = {"labels": hourly_labels, "values": hourly_values}
-
-        device_rows = db.execute(
-            """
-            SELECT COALESCE(NULLIF(device_type, ''), 'Unknown') AS device_type,
-                   COUNT(*) AS visits
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY device_type
-            ORDER BY visits DESC
-            """,
-            (current_range_label,),
-        ).fetchall()
-        device_chart = {
-            "labels": [row["device_type"] for row in device_rows],
-            "values": [row["visits"] for row in device_rows],
+    def analytics_hourly_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        events = analytics_events(scope)
+        values = events["hourly"] if events is not None else analytics_report.hourly(db, scope["start_day"], scope["today"])
+        return {"labels": [f"{hour:02d}:00" for hour in range(24)], "values": values}
+
+    def analytics_devices_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        device_rows = analytics_breakdown(db, scope, "device_type", "Unknown")
+        # Device types are not truncated, so they add up to the range's page views.
+        page_views = sum(row["visits"] for row in device_rows)
+        tables = {
+            key: [
+                {key: row["value"], "visits": row["visits"], "share": analytics_share(row["visits"], page_views)}
+                for row in rows
+            ]
+            for key, rows in (
+                ("device_type", device_rows),
+                ("device_os", analytics_breakdown(db, scope, "device_os", "Other")),
+                ("browser", analytics_breakdown(db, scope, "browser", "Other")),
+            )
+        }
+        return {
+            "chart": {
+                "labels": [row["value"] for row in device_rows],
+                "values": [row["visits"] for row in device_rows],
+            },
+            "device_table": tables["device_type"],
+            "os_table": tables["device_os"],
+            "browser_table": tables["browser"],
         }
 
-        os_rows = db.execute(
-            """
-            SELECT COALESCE(NULLIF(device_os, ''), 'Other') AS device_os,
-                   COUNT(*) AS visits
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY device_os
-            ORDER BY visits DESC
-            """,
-            (current_range_label,),
-        ).fetchall()
-
-        traffic_rows = db.execute(
-            """
-            SELECT COALESCE(NULLIF(traffic_source, ''), 'Direct') AS traffic_source,
-                   COUNT(*) AS visits
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY traffic_source
-            ORDER BY visits DESC
-            """,
-            (current_range_label,),
-        ).fetchall()
-        traffic_chart = {
-            "labels": [row["traffic_source"] for row in traffic_rows],
-            "values": [row["visits"] for row in traffic_rows],
+    def analytics_traffic_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        traffic_rows = analytics_breakdown(db, scope, "traffic_source", "Direct")
+        page_views = sum(row["visits"] for row in traffic_rows)
+        return {
+            "chart": {
+                "labels": [row["value"] for row in traffic_rows],
+                "values": [row["visits"] for row in traffic_rows],
+            },
+            "rows": [
+                {"source": row["value"], "visits": row["visits"], "share": analytics_share(row["visits"], page_views)}
+                for row in traffic_rows
+            ],
         }
 
-        country_rows = db.execute(
-            """
-            SELECT COALESCE(NULLIF(country, ''), 'Unknown') AS country,
-                   COUNT(*) AS visits,
-                   COUNT(DISTINCT visitor_id) AS unique_visitors
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY country
-            ORDER BY visits DESC
-            LIMIT 10
-            """,
-            (current_range_label,),
-        ).fetchall()
-        country_chart = {
-            "labels": [row["country"] for row in country_rows[:6]],
-            "values": [row["visits"] for row in country_rows[:6]],
+    def analytics_countries_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        events = analytics_events(scope)
+        if events is not None:
+            country_rows = events["countries"]
+        else:
+            country_rows = analytics_report.countries(
+                db, scope["start_day"], scope["today"], limit=analytics_report.TOP_LIMIT, exact=scope["exact"]
+            )
+        page_views = analytics_report.summed_counters(db, scope["start_day"], scope["today"])["page_views"]
+        return {
+            "chart": {
+                "labels": [row["value"] or "Unknown" for row in country_rows[:6]],
+                "values": [row["page_views"] for row in country_rows[:6]],
+            },
+            "rows": [
+                {
+                    "country": row["value"] or "Unknown",
+                    "visits": row["page_views"],
+                    "unique": row["unique_visitors"],
+                    "share": analytics_share(row["page_views"], page_views),
+                }
+                for row in country_rows
+            ],
         }
 
-        referrer_rows = db.execute(
-            """
-            SELECT
-                COALESCE(NULLIF(referrer_domain, ''), traffic_source) AS domain,
-                traffic_source,
-                COUNT(*) AS visits
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY domain, traffic_source
-            ORDER BY visits DESC
-            LIMIT 10
-            """,
-            (current_range_label,),
-        ).fetchall()
+    def analytics_timezones_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "rows": [
+                {"timezone": row["value"], "visits": row["visits"]}
+                for row in analytics_breakdown(db, scope, "timezone", "Unknown")
+            ]
+        }
 
-        timezone_rows = db.execute(
-            """
-            SELECT COALESCE(NULLIF(timezone, ''), 'Unknown') AS timezone,
-                   COUNT(*) AS visits
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY timezone
-            ORDER BY visits DESC
-            LIMIT 8
-            """,
-            (current_range_label,),
-        ).fetchall()
+    def analytics_referrers_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        events = analytics_events(scope)
+        if events is not None:
+            referrer_rows = events["referrers"]
+        else:
+            referrer_rows = analytics_report.referrers(
+                db, scope["start_day"], scope["today"], limit=analytics_report.TOP_LIMIT
+            )
+        return {
+            "rows": [
+                {"domain": row["domain"], "visits": row["page_views"], "source": row["traffic_source"]}
+                for row in referrer_rows
+            ]
+        }
 
+    def analytics_top_pages_panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+        events = analytics_events(scope)
+        if events is not None:
+            top_pages_rows = events["top_pages"]
+        else:
+            top_pages_rows = analytics_report.top_pages(
+                db, scope["start_day"], scope["today"], limit=analytics_report.TOP_LIMIT
+            )
+        page_views = analytics_report.summed_counters(db, scope["start_day"], scope["today"])["page_views"]
         page_lookup = {row["slug"]: row for row in fetch_all_pages()}
-        top_pages_rows = db.execute(
-            """
-            SELECT
-                page_slug,
-                COALESCE(NULLIF(page_title, ''), NULL) AS page_title,
-                path,
-                COUNT(*) AS views,
-                COUNT(DISTINCT session_id) AS sessions
-            FROM analytics_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            GROUP BY page_slug, page_title, path
-            ORDER BY views DESC
-            LIMIT 10
-            """,
-            (current_range_label,),
-        ).fetchall()
-
-        def resolve_public_url(slug: str | None, path_value: str | None) -> str:
-            if slug:
-                endpoint = PAGE_ENDPOINT_OVERRIDES.get(slug)
-                if endpoint:
-                    try:
-                        return url_for(endpoint)
-                    except Exception:
-                        pass
-                try:
-                    return url_for("render_dynamic_page", slug=slug)
-                except Exception:
-                    pass
-            if path_value:
-                return path_value
-            return "#"
-
         top_pages: list[dict[str, object]] = []
         for row in top_pages_rows:
             slug = row["page_slug"]
-            page_title = row["page_title"]
             page_record = page_lookup.get(slug) if slug else None
             display_name = (
-                page_title
+                row["page_title"]
                 or (page_record["page_name"] if page_record else None)
                 or (slug.capitalize() if slug else (row["path"] or "Unknown"))
             )
-            share = round((row["views"] / page_views) * 100, 1) if page_views else 0.0
             top_pages.append(
                 {
                     "title": display_name,
                     "slug": slug,
-                    "views": row["views"],
+                    "views": row["page_views"],
                     "sessions": row["sessions"],
-                    "share": share,
-                    "url": resolve_public_url(slug, row["path"]),
+                    "share": analytics_share(row["page_views"], page_views),
+                    "url": analytics_page_url(slug, row["path"]),
                 }
             )
+        return {"page_views": page_views, "rows": top_pages}
+
+    def analytics_session_pages_panel(kind: str) -> Any:
+        def panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+            sessions = analytics_report.summed_counters(db, scope["start_day"], scope["today"])["sessions"]
+            page_lookup = {row["slug"]: row for row in fetch_all_pages()}
+            entries: list[dict[str, object]] = []
+            for row in analytics_report.session_pages(db, kind, scope["start_day"], scope["today"], limit=8):
+                slug = row["page_slug"]
+                page_record = page_lookup.get(slug) if slug else None
+                entries.append(
+                    {
+                        "title": (page_record["page_name"] if page_record else None)
+                        or row["path"]
+                        or (slug.capitalize() if slug else "Unknown"),
+                        "path": row["path"],
+                        "sessions": row["sessions"],
+                        "share": analytics_share(row["sessions"], sessions),
+                        "bounce_rate": analytics_share(row["single_page_sessions"], row["sessions"]),
+                        "url": analytics_page_url(slug, row["path"]),
+                    }
+                )
+            return {"sessions": sessions, "rows": entries}
+
+        return panel
+
+    def analytics_page_report_panel(page_report: Any) -> Any:
+        def panel(db: sqlite3.Connection, scope: dict[str, Any]) -> dict[str, Any]:
+            page_lookup = {row["slug"]: row for row in fetch_all_pages()}
+            rows = page_report(db, scope["start_day"], scope["today"], limit=10)
+            for entry in rows:
+                page_record = page_lookup.get(entry["page_slug"]) if entry["page_slug"] else None
+                if page_record:
+                    entry["label"] = page_record["page_name"]
+            return {"rows": rows}
+
+        return panel
+
+    # Each panel of /admin/analytics is computed, cached and served on its own.
+    analytics_panels = {
+        "kpis": analytics_kpis_panel,
+        "daily": analytics_daily_panel,
+        "hourly": analytics_hourly_panel,
+        "devices": analytics_devices_panel,
+        "traffic": analytics_traffic_panel,
+        "countries": analytics_countries_panel,
+        "timezones": analytics_timezones_panel,
+        "referrers": analytics_referrers_panel,
+        "top_pages": analytics_top_pages_panel,
+        "landing_pages": analytics_session_pages_panel("landing"),
+        "exit_pages": analytics_session_pages_panel("exit"),
+        "web_vitals": analytics_page_report_panel(analytics_vitals.page_report),
+        "engagement": analytics_page_report_panel(analytics_engagement.page_report),
+    }
 
-        top_countries = [
-            {
-                "country": row["country"],
-                "visits": row["visits"],
-                "unique": row["unique_visitors"],
-                "share": round((row["visits"] / page_views) * 100, 1) if page_views else 0.0,
-            }
-            for row in country_rows
-        ]
+    @app.route("/admin/analytics")
+    @login_required
+    def admin_analytics() -> str:
+        range_days, exact = analytics_report_args()
+        scope = analytics_scope(range_days, exact)
+        panel_args = {"range": range_days, **({"exact": 1} if exact else {})}
+        return render_template(
+            "admin/analytics.html",
+            range_days=range_days,
+            range_label=scope["range_label"],
+            comparison_label=scope["comparison_label"],
+            exact_uniques=exact,
+            unique_visitors_error=round(analytics_report.UNIQUE_VISITORS_ERROR * 100, 1),
+            vital_metrics=[(metric, analytics_vitals.METRIC_LABELS[metric]) for metric in analytics_vitals.METRICS],
+            panel_urls={name: url_for("admin_analytics_panel", panel=name, **panel_args) for name in analytics_panels},
+            range_options=analytics_ranges,
+            report_cache_stats=report_cache.stats(),
+            ingest_stats=analytics_buffer.stats(),
+            guard_stats=ingest_guard.stats(),
+            ua_cache_stats=ua_classifier.stats(),
+            spool_stats=spool_writer.stats() if spool_writer is not None else None,
+            geoip_stats=geoip_resolver.stats(),
+            columnar_stats=columnar_engine.stats() if columnar_engine is not None else None,
+        )
 
-        referrer_table = [
-            {
-                "domain": row["domain"],
-                "visits": row["visits"],
-                "source": row["traffic_source"],
-            }
-            for row in referrer_rows
-        ]
+    @app.route("/admin/analytics/api/<panel>")
+    @login_required
+    def admin_analytics_panel(panel: str) -> ResponseReturnValue:
+        builder = analytics_panels.get(panel)
+        if builder is None:
+            abort(404)
+        range_days, exact = analytics_report_args()
+        exact = exact and panel in analytics_exact_panels
+
+        def build() -> dict[str, Any]:
+            return builder(get_analytics_db(), analytics_scope(range_days, exact))
+
+        data, built_at = cached_analytics_report((panel, range_days, exact), build)
+        # The browser revalidates every fetch; an unchanged panel costs a 304.
+        response = jsonify(data)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.last_modified = datetime.utcfromtimestamp(built_at)
+        response.add_etag()
+        return response.make_conditional(request)
+
+    @app.route("/admin/analytics/campaigns")
+    @login_required
+    def admin_analytics_campaigns() -> str:
+        db = get_analytics_db()
+        range_days, _ = analytics_report_args()
+        group_by = request.args.get("group", "campaign")
+        if group_by not in analytics_attribution.GROUPINGS:
+            group_by = "campaign"
+
+        today = int(time.time()) // analytics_storage.SECONDS_PER_DAY
+        report = analytics_attribution.campaign_report(db, today - range_days + 1, today, group_by=group_by)
+        if group_by == "landing":
+            page_lookup = {row["slug"]: row for row in fetch_all_pages()}
+            for entry in report:
+                page_record = page_lookup.get(entry["value"]) if entry["value"] else None
+                if page_record:
+                    entry["label"] = page_record["page_name"]
 
-        timezone_table = [
-            {
-                "timezone": row["timezone"],
-                "visits": row["visits"],
-            }
-            for row in timezone_rows
-        ]
+        return render_template(
+            "admin/analytics_campaigns.html",
+            report=report,
+            range_days=range_days,
+            range_options=analytics_ranges,
+            range_label=f"Last {range_days} days",
+            group_by=group_by,
+            groupings=analytics_attribution.GROUPINGS,
+        )
 
-        device_table = [
-            {
-                "device_type": row["device_type"],
-                "visits": row["visits"],
-                "share": round((row["visits"] / page_views) * 100, 1) if page_views else 0.0,
-            }
-            for row in device_rows
-        ]
+    def analytics_date_range() -> tuple[int, int, dict[str, str]]:
+        """Inclusive UTC day range of the ``start``/``end`` arguments (default: the last 30 days).
 
-        os_table = [
-            {
-                "device_os": row["device_os"],
-                "visits": row["visits"],
-                "share": round((row["visits"] / page_views) * 100, 1) if page_views else 0.0,
-            }
-            for row in os_rows
-        ]
+        Returns the first and last day numbers and the range as ``start``/``end`` URL arguments.
+        """
+
+        today = int(time.time()) // analytics_storage.SECONDS_PER_DAY
 
-        traffic_table = [
+        def parse_day(name: str, default: int) -> int:
+            value = request.args.get(name, "").strip()
+            if not value:
+                return default
+            try:
+                parsed = datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                flash(f"Dates must look like 2024-01-31; ignored {name} date {value!r}.", "warning")
+                return default
+            return (parsed - datetime(1970, 1, 1)).days
+
+        end_day = parse_day("end", today)
+        start_day = parse_day("start", end_day - 29)
+        if start_day > end_day:
+            start_day, end_day = end_day, start_day
+        day_seconds = analytics_storage.SECONDS_PER_DAY
+        range_args = {
+            "start": datetime.utcfromtimestamp(start_day * day_seconds).strftime("%Y-%m-%d"),
+            "end": datetime.utcfromtimestamp(end_day * day_seconds).strftime("%Y-%m-%d"),
+        }
+        return start_day, end_day, range_args
+
+    def analytics_drilldown_filters() -> dict[str, str]:
+        return {
+            name: request.args.get(name, "").strip()
+            for name in analytics_drilldown.FILTERS
+            if request.args.get(name, "").strip()
+        }
+
+    @app.route("/admin/analytics/explore")
+    @login_required
+    def admin_analytics_explore() -> str:
+        db = get_analytics_db()
+        start_day, end_day, range_args = analytics_date_range()
+        filters = analytics_drilldown_filters()
+        breakdown = request.args.get("breakdown", "day")
+        if breakdown not in analytics_drilldown.DIMENSIONS:
+            breakdown = "day"
+
+        started = time.perf_counter()
+        result = analytics_drilldown.run(db, start_day, end_day, filters=filters, breakdown=breakdown)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        for row in result["rows"]:
+            # Values of a filterable breakdown drill into that value, by day.
+            if breakdown in analytics_drilldown.FILTERS and row["value"] is not None:
+                row["drill_url"] = url_for(
+                    "admin_analytics_explore", **range_args, **{**filters, breakdown: row["value"]}, breakdown="day"
+                )
+        filter_chips = [
             {
-                "source": row["traffic_source"],
-                "visits": row["visits"],
-                "share": round((row["visits"] / page_views) * 100, 1) if page_views else 0.0,
+                "label": analytics_drilldown.DIMENSIONS[name].label,
+                "value": value,
+                "remove_url": url_for(
+                    "admin_analytics_explore",
+                    **range_args,
+                    **{other: kept for other, kept in filters.items() if other != name},
+                    breakdown=breakdown,
+                ),
             }
-            for row in traffic_rows
+            for name, value in filters.items()
         ]
 
-        context = {
-            "range_days": range_days,
-            "range_label": range_label,
-            "comparison_label": comparison_label,
-            "range_options": allowed_ranges,
-            "kpi_cards": kpi_cards,
-            "daily_chart": daily_chart,
-            "hourly_chart": hourly_chart,
-            "device_chart": device_chart,
-            "traffic_chart": traffic_chart,
-            "country_chart": country_chart,
-            "top_pages": top_pages,
-            "top_countries": top_countries,
-            "referrer_table": referrer_table,
-            "timezone_table": timezone_table,
-            "device_table": device_table,
-            "os_table": os_table,
-            "traffic_table": traffic_table,
-            "lead_count": lead_count,
-            "returning_visitors": returning_visitors,
-            "new_visitors": new_visitors,
-            "new_visitor_rate": new_visitor_rate,
-            "conversion_rate": conversion_rate,
-            "page_views": page_views,
-            "sessions_total": sessions,
-            "unique_visitors": unique_visitors,
-            "bounce_rate": bounce_rate,
-            "avg_pages_per_session": avg_pages_per_session,
+        filter_options = {
+            name: [
+                row[0]
+                for row in db.execute(
+                    "SELECT value FROM analytics_dimension_values WHERE dimension = ? ORDER BY value LIMIT 500",
+                    (analytics_drilldown.DIMENSIONS[name].values,),
+                )
+            ]
+            for name in analytics_drilldown.FILTERS
         }
+        return render_template(
+            "admin/analytics_explore.html",
+            result=result,
+            elapsed_ms=elapsed_ms,
+            start=range_args["start"],
+            end=range_args["end"],
+            filters=filters,
+            filter_chips=filter_chips,
+            breakdown=breakdown,
+            dimensions=analytics_drilldown.DIMENSIONS,
+            filter_names=analytics_drilldown.FILTERS,
+            filter_options=filter_options,
+            export_urls={
+                fmt: url_for("admin_analytics_export", **range_args, **filters, format=fmt)
+                for fmt in analytics_export.FORMATS
+            },
+        )
+
+    @app.route("/admin/analytics/export")
+    @login_required
+    def admin_analytics_export() -> ResponseReturnValue:
+        """Stream the raw page-view events of a date range and filter set as a download.
+
+        Rows are read and encoded a chunk at a time on a connection of the
+        export's own, and the body is gzipped on the fly for clients that
+        accept it. Exports beyond ``ANALYTICS_EXPORT_CONCURRENCY`` get a 429.
+        """
+
+        fmt = request.args.get("format", "csv")
+        if fmt not in analytics_export.FORMATS:
+            abort(404)
+        start_day, end_day, range_args = analytics_date_range()
+        filters = analytics_drilldown_filters()
+        gzip = request.accept_encodings["gzip"] > 0
+
+        if not analytics_export_slots.acquire(blocking=False):
+            response = Response(
+                "Too many analytics exports are running; try again in a minute.\n",
+                status=429,
+                mimetype="text/plain",
+            )
+            response.headers["Retry-After"] = "60"
+            return response
+        try:
+            mimetype, extension = analytics_export.FORMATS[fmt]
+            response = Response(
+                analytics_export.stream(
+                    connect_analytics_db, start_day, end_day, filters=filters, fmt=fmt, gzip=gzip
+                ),
+                mimetype=mimetype,
+            )
+        except BaseException:
+            analytics_export_slots.release()
+            raise
+        # Released when the server closes the response, finished or not.
+        response.call_on_close(analytics_export_slots.release)
+        filename = f"analytics-events-{range_args['start']}-to-{range_args['end']}.{extension}"
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        if gzip:
+            response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "private, no-store"
+        # Keep a buffering reverse proxy from holding the whole download.
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    @app.route("/admin/analytics/referrers", methods=["GET", "POST"])
+    @login_required
+    def admin_analytics_referrers() -> str:
+        db = get_analytics_db()
+        if request.method == "POST":
+            domain = analytics_referrers.normalise_domain(request.form.get("domain", ""))
+            channel = request.form.get("channel", "").strip()
+            if not domain or " " in domain or not channel:
+                flash("Enter a referrer domain and the channel it belongs to.", "error")
+                return redirect(url_for("admin_analytics_referrers"))
+
+            timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            db.execute(
+                """
+                INSERT INTO analytics_referrer_domains (domain, channel, created_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(domain) DO UPDATE SET channel = excluded.channel, updated_at = excluded.updated_at
+                """,
+                (domain, channel, timestamp, timestamp),
+            )
+            db.commit()
+            referrer_classifier.invalidate()
+            flash(f"{domain} is now classified as {channel}.", "success")
+            return redirect(url_for("admin_analytics_referrers"))
+
+        mappings = db.execute(
+            "SELECT id, domain, channel, updated_at FROM analytics_referrer_domains ORDER BY channel, domain"
+        ).fetchall()
+        channels = sorted({row["channel"] for row in mappings} | {"Social", "Organic Search", "Referral"})
+        return render_template(
+            "admin/analytics_referrers.html",
+            mappings=mappings,
+            channels=channels,
+            referrer_stats=referrer_classifier.stats(),
+        )
 
-        return render_template("admin/analytics.html", **context)
+    @app.post("/admin/analytics/referrers/<int:mapping_id>/delete")
+    @login_required
+    def admin_analytics_referrers_delete(mapping_id: int):
+        db = get_analytics_db()
+        db.execute("DELETE FROM analytics_referrer_domains WHERE id = ?", (mapping_id,))
+        db.commit()
+        referrer_classifier.invalidate()
+        flash("Referrer mapping deleted.", "info")
+        return redirect(url_for("admin_analytics_referrers"))
 
     @app.route("/admin/pages")
     @login_required
@@ -5730,6 +6027,161 @@ def create_app() -> Flask:
 
         process_images_module.main(argv)
 
+    @app.cli.command("analytics-load")
+    @click.option("--limit", default=None, type=int, help="Maximum number of segments to load")
+    def analytics_load_command(limit: int | None) -> None:
+        """Bulk-load closed analytics spool segments into ``analytics_events``."""
+
+        result = load_analytics_spool(limit=limit)
+        click.echo(
+            f"[analytics-load] Loaded {result.events} events from {result.segments} segment(s)"
+            + (f", skipped {result.skipped_lines} unreadable line(s)" if result.skipped_lines else "")
+            + (f", {len(result.already_loaded)} already loaded" if result.already_loaded else "")
+            + (
+                f", moved {len(result.failed)} unloadable segment(s) to {analytics_spool.FAILED_DIR}/"
+                if result.failed
+                else ""
+            )
+            + (
+                f", left {len(result.deferred)} segment(s) for the next run (database busy)"
+                if result.deferred
+                else ""
+            )
+            + "."
+        )
+
+    @app.cli.command("analytics-retention")
+    @click.option("--days", default=None, type=int, help="Keep this many days of raw events (default: ANALYTICS_RETENTION_DAYS)")
+    @click.option("--batch-size", default=None, type=int, help="Rows deleted per transaction")
+    @click.option("--no-vacuum", is_flag=True, help="Skip the incremental vacuum")
+    @click.option(
+        "--full-vacuum",
+        is_flag=True,
+        help="Run one full VACUUM to switch an older database to incremental vacuum (locks it while it runs)",
+    )
+    def analytics_retention_command(
+        days: int | None, batch_size: int | None, no_vacuum: bool, full_vacuum: bool
+    ) -> None:
+        """Check roll-ups for, archive and prune raw analytics events past the retention window."""
+
+        conn = connect_analytics_db()
+        try:
+            result = analytics_retention.run_retention(
+                conn,
+                app.config["ANALYTICS_ARCHIVE_DIR"],
+                retain_days=days if days is not None else app.config["ANALYTICS_RETENTION_DAYS"],
+                batch_size=batch_size or app.config["ANALYTICS_RETENTION_BATCH_SIZE"],
+                vacuum=not no_vacuum,
+                full_vacuum=full_vacuum,
+            )
+        finally:
+            conn.close()
+        if not result.days:
+            click.echo(
+                "[analytics-retention] Nothing older than the retention window"
+                + (f"; released {result.pages_released} page(s)." if full_vacuum else ".")
+            )
+            return
+        first_day = analytics_retention.day_date(result.days[0])
+        last_day = analytics_retention.day_date(result.days[-1])
+        click.echo(
+            f"[analytics-retention] Checked roll-ups for {len(result.days)} day(s) ({first_day} to {last_day}, "
+            f"{len(result.rebuilt_days)} rebuilt), "
+            f"archived {result.archived_events} events to {len(result.archive_files)} file(s), "
+            f"deleted {result.deleted_events} rows, released {result.pages_released} page(s)."
+        )
+        if result.needs_full_vacuum:
+            click.echo(
+                "[analytics-retention] This database predates incremental vacuum, so freed pages stay on its "
+                "free list; run analytics-retention --full-vacuum once (it locks the database while it runs)."
+            )
+
+    @app.cli.command("analytics-backup")
+    @click.option("--dest", default=None, help="Backup directory (default: ANALYTICS_BACKUP_DIR)")
+    @click.option("--keep", default=None, type=int, help="Number of backups to keep (default: ANALYTICS_BACKUP_KEEP)")
+    def analytics_backup_command(dest: str | None, keep: int | None) -> None:
+        """Take an online backup of the analytics database."""
+
+        target = analytics_storage.backup_database(
+            app.config["ANALYTICS_DATABASE"],
+            dest or app.config["ANALYTICS_BACKUP_DIR"],
+            keep=keep if keep is not None else app.config["ANALYTICS_BACKUP_KEEP"],
+        )
+        click.echo(f"[analytics-backup] Wrote {target} ({target.stat().st_size / 1024:,.0f} KiB).")
+
+    @app.cli.command("analytics-attribution-rebuild")
+    def analytics_attribution_rebuild_command() -> None:
+        """Recount campaign sessions, leads and bookings from sessions and CMS rows."""
+
+        conn = connect_analytics_db()
+        try:
+            conn.execute("ATTACH DATABASE ? AS cms", (app.config["DATABASE"],))
+            result = analytics_attribution.rebuild(conn)
+        finally:
+            conn.close()
+        click.echo(
+            f"[analytics-attribution] Rebuilt {result['session_rows']:,} session rows "
+            f"and attributed {result['conversions']:,} leads and bookings."
+        )
+
+    @app.cli.command("analytics-rollups")
+    @click.option("--start", "start", type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help="First day (UTC)")
+    @click.option("--end", "end", type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help="Last day (UTC)")
+    @click.option("--check", "check_only", is_flag=True, help="Compare with raw events without rewriting anything")
+    def analytics_rollups_command(start: datetime | None, end: datetime | None, check_only: bool) -> None:
+        """Rebuild (or verify) the daily report roll-ups from raw events and sessions."""
+
+        start_day = analytics_retention.day_number(start.date()) if start else None
+        end_day = analytics_retention.day_number(end.date()) if end else None
+        conn = connect_analytics_db()
+        try:
+            if check_only:
+                differences = analytics_rollups.check(conn, start_day, end_day)
+            else:
+                rebuilt = analytics_rollups.rebuild(conn, start_day, end_day)
+        finally:
+            conn.close()
+        if not check_only:
+            click.echo(f"[analytics-rollups] Rebuilt {rebuilt:,} days of roll-ups.")
+        elif not differences:
+            click.echo("[analytics-rollups] No raw events to check against.")
+        else:
+            summary = ", ".join(f"{table}: {count:,}" for table, count in differences.items())
+            status = "OK" if not any(differences.values()) else "MISMATCH"
+            click.echo(f"[analytics-rollups] {status} (differing rows: {summary}).")
+
+    @app.cli.command("analytics-geoip-build")
+    @click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--output", default=None, help="Range file to write (default: ANALYTICS_GEOIP_DATABASE)")
+    def analytics_geoip_build_command(csv_path: str, output: str | None) -> None:
+        """Compile an IP-range CSV into the memory-mapped country lookup file."""
+
+        target = output or app.config["ANALYTICS_GEOIP_DATABASE"]
+        v4_count, v6_count = analytics_geoip.build_database(csv_path, target)
+        size_kib = Path(target).stat().st_size / 1024
+        click.echo(
+            f"[analytics-geoip] Wrote {v4_count:,} IPv4 and {v6_count:,} IPv6 ranges to {target} ({size_kib:,.0f} KiB)."
+        )
+
+    @app.cli.command("analytics-restore")
+    @click.argument("day", type=click.DateTime(formats=["%Y-%m-%d"]))
+    def analytics_restore_command(day: datetime) -> None:
+        """Load an archived day of raw analytics events back into the live table."""
+
+        conn = connect_analytics_db()
+        try:
+            restored = analytics_retention.restore_day(
+                conn,
+                app.config["ANALYTICS_ARCHIVE_DIR"],
+                analytics_retention.day_number(day.date()),
+                lambda conn, events: analytics_storage.write_events(
+                    conn, events, interner=dimension_interner, update_aggregates=False
+                ),
+            )
+        finally:
+            conn.close()
+        click.echo(f"[analytics-restore] Restored {restored} events for {day:%Y-%m-%d}.")
+
     return app
 
 
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Compare beacon throughput of the Flask route and the raw WSGI ingest app.
+
+Both paths are called in-process with identical pre-built WSGI environs, so
+the numbers measure per-request handling cost on one worker, not the network
+or the web server. Dedupe and rate limits are switched off and, unless
+``--store`` is given, queued events are discarded so the database does not
+take part either. The app runs against a scratch instance directory, so the
+real CMS and analytics databases are never opened.
+
+Example usage::
+
+    python scripts/bench_beacons.py --beacons 20000 --events 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+
+def _beacon_body(index: int, events: int) -> bytes:
+    return json.dumps(
+        {
+            "visitor_id": f"bench-visitor-{index % 5000}",
+            "session_id": f"bench-session-{index % 8000}",
+            "sent_at": 1_700_000_000_000,
+            "events": [
+                {
+                    "type": "pageview",
+                    "path": f"/courses/course-{(index + offset) % 40}",
+                    "url": f"https://lmsc.example/courses/course-{(index + offset) % 40}?utm_source=bench",
+                    "referrer": "https://www.google.co.uk/",
+                    "page_title": "Course",
+                    "language": "en-GB",
+                    "screen_width": 1440,
+                    "screen_height": 900,
+                    "ts": 1_700_000_000_000,
+                }
+                for offset in range(events)
+            ],
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _environ(body: bytes) -> dict[str, Any]:
+    return {
+        "REQUEST_METHOD": "POST",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": "/analytics/track",
+        "QUERY_STRING": "",
+        "SERVER_NAME": "lmsc.example",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "10.0.0.1",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "HTTP_HOST": "lmsc.example",
+        "HTTP_USER_AGENT": USER_AGENT,
+        "HTTP_ORIGIN": "https://lmsc.example",
+        "HTTP_X_FORWARDED_FOR": "203.0.113.7",
+        "HTTP_X_FORWARDED_PROTO": "https",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.version": (1, 0),
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+
+def _run(wsgi_app: Callable[..., Any], bodies: list[bytes]) -> float:
+    statuses: list[str] = []
+
+    def start_response(status: str, headers: list[tuple[str, str]], exc_info: Any = None) -> None:
+        statuses.append(status)
+
+    environs = [_environ(body) for body in bodies]
+    started = time.perf_counter()
+    for environ in environs:
+        response = wsgi_app(environ, start_response)
+        for _ in response:
+            pass
+        close = getattr(response, "close", None)
+        if close is not None:
+            close()
+    elapsed = time.perf_counter() - started
+
+    if not statuses or not statuses[0].startswith("204"):
+        raise SystemExit(f"[bench-beacons] Unexpected response: {statuses[:1]}")
+    return elapsed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark analytics beacon ingestion")
+    parser.add_argument("--beacons", type=int, default=10_000, help="Beacons per run (default: 10000)")
+    parser.add_argument("--events", type=int, default=1, help="Events per beacon (default: 1)")
+    parser.add_argument("--rounds", type=int, default=3, help="Runs per path; the best is reported (default: 3)")
+    parser.add_argument("--store", action="store_true", help="Queue events for writing instead of discarding them")
+    args = parser.parse_args(argv)
+
+    # Everything the app opens or creates lives in a scratch instance
+    # directory: importing the app initialises (and may migrate) its
+    # databases, and --store writes synthetic events.
+    scratch = tempfile.mkdtemp(prefix="bench-beacons-")
+    os.environ["INSTANCE_PATH"] = scratch
+    os.environ["ANALYTICS_DATABASE"] = str(Path(scratch) / "analytics.sqlite3")
+    for name in ("ANALYTICS_SPOOL_DIR", "ANALYTICS_ARCHIVE_DIR", "ANALYTICS_BACKUP_DIR"):
+        os.environ.pop(name, None)
+    os.environ["ANALYTICS_INGEST_MODE"] = "buffer"
+    os.environ["ANALYTICS_RAW_INGEST"] = "1"
+    os.environ["ANALYTICS_DEDUPE_SECONDS"] = "0"
+    os.environ["ANALYTICS_IP_RATE"] = "0"
+    os.environ["ANALYTICS_VISITOR_RATE"] = "0"
+    sys.path.insert(0, str(ROOT))
+
+    from app import app  # noqa: E402 - configured through the environment above
+
+    dispatcher = app.wsgi_app
+    ingest = app.extensions["analytics_ingest"]
+    if not args.store:
+        ingest.enqueue = lambda events: None
+
+    bodies = [_beacon_body(index, args.events) for index in range(args.beacons)]
+    paths = {"flask": dispatcher.app, "raw": dispatcher.ingest_app}
+    best: dict[str, float] = {}
+    for name, wsgi_app in paths.items():
+        _run(wsgi_app, bodies[: min(500, len(bodies))])  # warm caches
+        best[name] = min(_run(wsgi_app, bodies) for _ in range(max(1, args.rounds)))
+
+    for name, elapsed in best.items():
+        rate = args.beacons / elapsed
+        print(f"[bench-beacons] {name:>5}: {rate:>10,.0f} beacons/s  ({elapsed / args.beacons * 1e6:,.1f} µs/beacon)")
+    print(f"[bench-beacons] raw is {best['flask'] / best['raw']:.1f}x the Flask route")
+
+    if args.store:
+        app.extensions["analytics_buffer"].flush()
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI entry point
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Beacons with malformed fields must not stop the rest of the batch being stored."""
+
+from __future__ import annotations
+
+import time
+
+from werkzeug.routing import Map, Rule
+from werkzeug.test import Client
+
+from analytics import rollups, storage
+from analytics.buffer import EventBuffer
+from analytics.canonical import Canonicalizer
+from analytics.guard import IngestGuard
+from analytics.ingest import BeaconIngest, IngestApp
+from analytics.user_agents import UserAgentClassifier
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+
+
+def _ingest(tmp_path):
+    database = str(tmp_path / "analytics.sqlite3")
+    conn = storage.connect(database)
+    storage.ensure_schema(conn)
+    rollups.ensure_tables(conn)
+    conn.commit()
+    conn.close()
+
+    def write(events):
+        conn = storage.connect(database)
+        try:
+            storage.insert_events(conn, events)
+        finally:
+            conn.close()
+
+    buffer = EventBuffer(write)
+    ingest = BeaconIngest(
+        user_agents=UserAgentClassifier(),
+        classify_source=lambda url, referrer, host: ("direct", None, None, None, None),
+        country_for=lambda headers, client_ip, language: "GB",
+        canonicalizer=Canonicalizer(Map()),
+        guard=IngestGuard(dedupe_seconds=0, ip_rate=0, visitor_rate=0),
+        enqueue=buffer.extend,
+    )
+    return ingest, buffer, database
+
+
+def test_malformed_fields_do_not_block_other_events(tmp_path):
+    ingest, buffer, database = _ingest(tmp_path)
+    client = Client(IngestApp(ingest))
+    now = int(time.time() * 1000)
+    body = {
+        "sent_at": now,
+        "events": [
+            {"visitor_id": "visitor-1", "session_id": ["x"], "path": "/fees", "ts": now},
+            {"visitor_id": "visitor-2", "session_id": "session-2", "url": 5, "path": {}, "ts": now},
+            {"visitor_id": {"id": 1}, "path": "/contact", "page_title": 7, "ts": now},
+            {"visitor_id": "visitor-4", "session_id": "session-4", "path": "/about", "ts": now},
+        ],
+    }
+
+    response = client.post("/analytics/track", json=body, headers={"User-Agent": USER_AGENT})
+
+    assert response.status_code == 204
+    assert buffer.flush() == 4
+    assert buffer.stats()["dropped"] == 0
+    conn = storage.connect(database)
+    try:
+        rows = conn.execute("SELECT visitor_id, session_id, path FROM analytics_events_wide ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    assert len(rows) == 4
+    assert [row["path"] for row in rows] == ["/fees", None, "/contact", "/about"]
+    assert all(isinstance(row["session_id"], str) for row in rows)
+    assert rows[3]["visitor_id"] == "visitor-4"
+
+
+def test_parameterised_routes_without_slug_argument_have_no_slug():
+    canonicalizer = Canonicalizer(
+        Map(
+            [
+                Rule("/", endpoint="home"),
+                Rule("/fees", endpoint="fees"),
+                Rule("/courses/<slug>", endpoint="course"),
+                Rule("/admin/pages/<int:page_id>/edit", endpoint="edit_page"),
+            ]
+        )
+    )
+
+    assert canonicalizer.slug("/") == "home"
+    assert canonicalizer.slug("/fees") == "fees"
+    assert canonicalizer.slug("/courses/Maths") == "maths"
+    assert canonicalizer.slug("/admin/pages/12/edit") is None
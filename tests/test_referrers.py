@@ -0,0 +1,24 @@
+"""Referrer hosts must only match registered domains on label boundaries."""
+
+from __future__ import annotations
+
+from analytics.referrers import DEFAULT_REFERRER_CHANNELS, ORGANIC_SEARCH, SOCIAL, ReferrerIndex
+
+INDEX = ReferrerIndex(DEFAULT_REFERRER_CHANNELS.items())
+
+
+def test_exact_and_subdomain_matches():
+    assert INDEX.lookup("t.co") == SOCIAL
+    assert INDEX.lookup("www.t.co") == SOCIAL
+    assert INDEX.lookup("m.facebook.com") == SOCIAL
+    assert INDEX.lookup("reddit.com.example") is None
+
+
+def test_wildcard_matches_public_suffixes_only():
+    assert INDEX.lookup("google.com") == ORGANIC_SEARCH
+    assert INDEX.lookup("www.google.de") == ORGANIC_SEARCH
+    assert INDEX.lookup("google.co.uk") == ORGANIC_SEARCH
+    assert INDEX.lookup("yandex.com.tr") == ORGANIC_SEARCH
+    assert INDEX.lookup("google.evil.com") is None
+    assert INDEX.lookup("google.anything.example") is None
+    assert INDEX.lookup("google.example") is None
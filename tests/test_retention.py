@@ -0,0 +1,146 @@
+"""Archived days must come back from restore exactly as they were pruned."""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import date
+
+from analytics import retention, rollups, storage
+
+DAY = retention.day_number(date(2024, 3, 1))
+
+
+def _events():
+    start = DAY * storage.SECONDS_PER_DAY + 9 * 3600
+    events = []
+    for index in range(12):
+        events.append(
+            {
+                "visitor_id": f"visitor-{index % 4}",
+                "session_id": f"session-{index % 5}",
+                "path": f"/courses/{index % 3}",
+                "page_slug": f"course-{index % 3}",
+                "traffic_source": "organic" if index % 2 else "direct",
+                "country": "GB",
+                "created_ts": start + index * 60,
+            }
+        )
+    # A later day that stays inside the retention window.
+    events.append(
+        {"visitor_id": "visitor-9", "session_id": "session-9", "path": "/", "created_ts": start + 30 * 86_400}
+    )
+    return events
+
+
+def _labels(conn):
+    return sorted(
+        tuple(row)
+        for row in conn.execute(
+            "SELECT visitor_id, session_id, path, page_slug, traffic_source, country, created_ts "
+            "FROM analytics_events_wide WHERE created_day = ?",
+            (DAY,),
+        ).fetchall()
+    )
+
+
+def _report_row(conn):
+    row = conn.execute("SELECT page_views, sessions FROM analytics_rollup_daily WHERE day = ?", (DAY,)).fetchone()
+    return tuple(row)
+
+
+def _connect(tmp_path):
+    conn = storage.connect(str(tmp_path / "analytics.sqlite3"))
+    storage.ensure_schema(conn)
+    rollups.ensure_tables(conn)
+    retention.ensure_tables(conn)
+    conn.commit()
+    return conn
+
+
+def test_archive_prune_restore_round_trip(tmp_path):
+    conn = _connect(tmp_path)
+    archive_dir = tmp_path / "archive"
+    interner = storage.DimensionInterner()
+    try:
+        storage.insert_events(conn, _events(), interner=interner)
+        before = _labels(conn)
+        report_before = _report_row(conn)
+
+        result = retention.run_retention(conn, archive_dir, retain_days=10, today=date(2024, 3, 20), vacuum=False)
+
+        assert result.days == [DAY]
+        assert result.rebuilt_days == []
+        assert result.archived_events == 12
+        assert result.deleted_events == 12
+        assert [path.exists() for path in result.archive_files] == [True]
+        assert conn.execute("SELECT COUNT(*) FROM analytics_events WHERE created_day = ?", (DAY,)).fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM analytics_events").fetchone()[0] == 1
+        # The report keeps the day through its roll-ups.
+        assert _report_row(conn) == report_before
+
+        restored = retention.restore_day(
+            conn,
+            archive_dir,
+            DAY,
+            lambda conn, events: storage.write_events(conn, events, interner=interner, update_aggregates=False),
+        )
+
+        assert restored == 12
+        assert _labels(conn) == before
+        assert conn.execute("SELECT COUNT(*) FROM analytics_archives").fetchone()[0] == 0
+        assert not result.archive_files[0].exists()
+    finally:
+        conn.close()
+
+
+def test_retention_rebuilds_stale_rollups_before_pruning(tmp_path):
+    conn = _connect(tmp_path)
+    try:
+        storage.insert_events(conn, _events())
+        with conn:
+            conn.execute("DELETE FROM analytics_rollup_daily WHERE day = ?", (DAY,))
+
+        result = retention.run_retention(
+            conn, tmp_path / "archive", retain_days=10, today=date(2024, 3, 20), vacuum=False
+        )
+
+        assert result.rebuilt_days == [DAY]
+        assert conn.execute("SELECT page_views FROM analytics_rollup_daily WHERE day = ?", (DAY,)).fetchone()[0] == 12
+    finally:
+        conn.close()
+
+
+def test_new_database_vacuums_incrementally(tmp_path):
+    conn = _connect(tmp_path)
+    try:
+        storage.insert_events(conn, _events())
+
+        result = retention.run_retention(conn, tmp_path / "archive", retain_days=10, today=date(2024, 3, 20))
+
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert result.needs_full_vacuum is False
+    finally:
+        conn.close()
+
+
+def test_legacy_database_is_only_converted_on_request(tmp_path):
+    legacy = sqlite3.connect(tmp_path / "analytics.sqlite3")
+    legacy.execute("CREATE TABLE placeholder (id INTEGER)")
+    legacy.close()
+    conn = _connect(tmp_path)
+    try:
+        storage.insert_events(conn, _events())
+
+        result = retention.run_retention(conn, tmp_path / "archive", retain_days=10, today=date(2024, 3, 20))
+
+        assert result.needs_full_vacuum is True
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+
+        result = retention.run_retention(
+            conn, tmp_path / "archive", retain_days=10, today=date(2024, 3, 20), full_vacuum=True
+        )
+
+        assert result.needs_full_vacuum is False
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        conn.close()
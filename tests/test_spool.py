@@ -0,0 +1,158 @@
+"""Spool segments must load exactly once, survive torn lines and outlive their writer."""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import shutil
+import sqlite3
+import threading
+import time
+
+from analytics import rollups, spool, storage
+
+NOW = int(time.time())
+
+
+def _database(tmp_path):
+    database = str(tmp_path / "analytics.sqlite3")
+    conn = storage.connect(database)
+    storage.ensure_schema(conn)
+    rollups.ensure_tables(conn)
+    spool.ensure_checkpoint_table(conn)
+    conn.commit()
+    return conn
+
+
+def _write(conn, events):
+    return storage.write_events(conn, events)
+
+
+def _segment(directory, name, events, tail=""):
+    directory.mkdir(exist_ok=True)
+    path = directory / f"{name}{spool.READY_SUFFIX}"
+    lines = [json.dumps(event) for event in events]
+    path.write_text("\n".join(lines) + "\n" + tail, encoding="utf-8")
+    return path
+
+
+def _event(index):
+    return {"visitor_id": f"visitor-{index}", "session_id": f"session-{index}", "path": "/", "created_ts": NOW}
+
+
+def test_segment_is_loaded_once(tmp_path):
+    conn = _database(tmp_path)
+    spool_dir = tmp_path / "spool"
+    path = _segment(spool_dir, "20250101000000-1-000001", [_event(1), _event(2)])
+    copy = tmp_path / "copy"
+    shutil.copy(path, copy)
+    try:
+        first = spool.load_segments(conn, spool_dir, _write)
+        # A crash between commit and delete leaves the segment behind.
+        shutil.copy(copy, path)
+        second = spool.load_segments(conn, spool_dir, _write)
+
+        assert (first.segments, first.events) == (1, 2)
+        assert (second.segments, second.already_loaded) == (0, [path.name])
+        assert not path.exists()
+        assert conn.execute("SELECT COUNT(*) FROM analytics_events").fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+def test_torn_final_line_is_skipped(tmp_path):
+    conn = _database(tmp_path)
+    spool_dir = tmp_path / "spool"
+    _segment(spool_dir, "20250101000000-1-000001", [_event(1), _event(2)], tail='{"visitor_id": "visi')
+    try:
+        result = spool.load_segments(conn, spool_dir, _write)
+
+        assert (result.events, result.skipped_lines, result.failed) == (2, 1, [])
+        assert conn.execute("SELECT COUNT(*) FROM analytics_events").fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+def test_busy_database_defers_remaining_segments(tmp_path):
+    conn = _database(tmp_path)
+    conn.close()
+    spool_dir = tmp_path / "spool"
+    first = _segment(spool_dir, "20250101000000-1-000001", [_event(1)])
+    second = _segment(spool_dir, "20250101000000-1-000002", [_event(2)])
+    database = str(tmp_path / "analytics.sqlite3")
+    holder = storage.connect(database)
+    conn = storage.connect(database, timeout=0.05)
+    try:
+        holder.execute("BEGIN IMMEDIATE")
+        result = spool.load_segments(conn, spool_dir, _write)
+
+        assert result.segments == 0
+        assert result.deferred == [first.name, second.name]
+        assert result.failed == []
+        assert first.exists() and second.exists()
+    finally:
+        holder.rollback()
+        holder.close()
+        conn.close()
+
+
+def test_orphaned_open_segment_is_sealed(tmp_path):
+    spool_dir = tmp_path / "spool"
+    writer = spool.SpoolWriter(spool_dir)
+    writer.append([_event(1)])
+    orphan = spool_dir / f"20250101000000-999999-000001{spool.OPEN_SUFFIX}"
+    orphan.write_text(json.dumps(_event(2)) + "\n", encoding="utf-8")
+    try:
+        sealed = spool.seal_orphaned_segments(spool_dir)
+
+        assert sealed == 1
+        assert not orphan.exists()
+        assert orphan.with_suffix(spool.READY_SUFFIX).exists()
+        # The live writer still holds its lock, so its segment stays open.
+        assert len(list(spool_dir.glob(f"*{spool.OPEN_SUFFIX}"))) == 1
+    finally:
+        writer.close()
+
+
+def test_segment_being_opened_is_not_sealed(tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    # A writer between creating its segment and locking it, holding the seal lock shared.
+    seal_lock = open(spool_dir / spool.SEAL_LOCK, "ab")
+    fcntl.flock(seal_lock.fileno(), fcntl.LOCK_SH)
+    segment = spool_dir / f"20250101000000-1-000001{spool.OPEN_SUFFIX}"
+    handle = open(segment, "a", encoding="utf-8")
+    sealed = []
+    loader = threading.Thread(target=lambda: sealed.append(spool.seal_orphaned_segments(spool_dir)))
+    try:
+        loader.start()
+        loader.join(0.2)
+        assert loader.is_alive()
+
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(seal_lock.fileno(), fcntl.LOCK_UN)
+        loader.join(5)
+
+        assert sealed == [0]
+        assert segment.exists()
+    finally:
+        handle.close()
+        seal_lock.close()
+
+
+def test_unwritable_segment_moves_to_failed(tmp_path):
+    conn = _database(tmp_path)
+    spool_dir = tmp_path / "spool"
+    path = _segment(spool_dir, "20250101000000-1-000001", [_event(1)])
+
+    def broken(conn, events):
+        raise sqlite3.OperationalError("no such table: analytics_nowhere")
+
+    try:
+        result = spool.load_segments(conn, spool_dir, broken)
+
+        assert result.failed == [path.name]
+        assert (spool_dir / spool.FAILED_DIR / path.name).exists()
+        assert conn.execute("SELECT COUNT(*) FROM analytics_spool_checkpoints").fetchone()[0] == 0
+    finally:
+        conn.close()
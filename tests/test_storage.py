@@ -0,0 +1,105 @@
+"""Legacy text-column tables must migrate in resumable chunks without losing rows."""
+
+from __future__ import annotations
+
+from functools import partial
+
+import pytest
+
+from analytics import storage
+
+LEGACY_SCHEMA = """
+    CREATE TABLE analytics_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        visitor_id TEXT,
+        session_id TEXT,
+        page_slug TEXT,
+        path TEXT,
+        url TEXT,
+        traffic_source TEXT,
+        country TEXT,
+        is_session_start INTEGER DEFAULT 0,
+        created_at TEXT NOT NULL
+    )
+"""
+
+
+def _legacy_database(tmp_path, rows=7):
+    conn = storage.connect(str(tmp_path / "analytics.sqlite3"))
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany(
+        """
+        INSERT INTO analytics_events (visitor_id, session_id, page_slug, path, url, traffic_source, country, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                f"visitor-{index % 3}",
+                f"session-{index}",
+                f"page-{index % 2}",
+                f"/page-{index % 2}",
+                f"https://example.com/page-{index % 2}",
+                "direct",
+                "GB" if index % 2 else None,
+                f"2025-01-0{index % 5 + 1} 10:00:00",
+            )
+            for index in range(rows)
+        ],
+    )
+    conn.commit()
+    expected = [
+        tuple(row)
+        for row in conn.execute(
+            "SELECT id, visitor_id, session_id, page_slug, path, url, traffic_source, country, created_at "
+            "FROM analytics_events ORDER BY id"
+        ).fetchall()
+    ]
+    return conn, expected
+
+
+def _migrated(conn):
+    storage.ensure_schema(conn)
+    conn.commit()
+    return [
+        tuple(row)
+        for row in conn.execute(
+            "SELECT id, visitor_id, session_id, page_slug, path, url, traffic_source, country, created_at "
+            "FROM analytics_events_wide ORDER BY id"
+        ).fetchall()
+    ]
+
+
+def test_migration_copies_every_row_in_chunks(tmp_path, monkeypatch):
+    conn, expected = _legacy_database(tmp_path)
+    try:
+        monkeypatch.setattr(storage, "migrate_text_columns", partial(storage.migrate_text_columns, chunk_size=2))
+
+        assert _migrated(conn) == expected
+        assert "url" not in storage._event_columns(conn)
+    finally:
+        conn.close()
+
+
+def test_interrupted_migration_resumes(tmp_path, monkeypatch):
+    conn, expected = _legacy_database(tmp_path)
+    copy_rows = storage._copy_text_rows
+    calls = []
+
+    def failing_copy(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("worker killed")
+        return copy_rows(*args)
+
+    monkeypatch.setattr(storage, "_copy_text_rows", failing_copy)
+    monkeypatch.setattr(storage, "migrate_text_columns", partial(storage.migrate_text_columns, chunk_size=3))
+    try:
+        with pytest.raises(RuntimeError):
+            storage.ensure_schema(conn)
+        assert conn.execute("SELECT COUNT(*) FROM analytics_events_migrated").fetchone()[0] == 3
+
+        monkeypatch.setattr(storage, "_copy_text_rows", copy_rows)
+        assert storage.migrate_text_columns(conn) == 4
+        assert _migrated(conn) == expected
+    finally:
+        conn.close()
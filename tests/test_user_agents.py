@@ -0,0 +1,88 @@
+"""User-agent classification, including tokens that only count at a word boundary."""
+
+from __future__ import annotations
+
+import pytest
+
+from analytics.user_agents import UserAgentClassifier
+
+CASES = [
+    # (user agent, is_bot, device type, operating system, browser)
+    (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+        False,
+        "Desktop",
+        "Windows",
+        "Edge",
+    ),
+    (
+        "Mozilla/5.0 (X11; CrOS x86_64 14541.0.0) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36",
+        False,
+        "Desktop",
+        "ChromeOS",
+        "Chrome",
+    ),
+    (
+        "Microsoft Office/16.0 (Microsoft Outlook 16.0.17126; Pro)",
+        False,
+        "Desktop",
+        "Other",
+        "Other",
+    ),
+    (
+        "Mozilla/5.0 (Linux; Android 10; CUBOT X30) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Mobile Safari/537.36",
+        False,
+        "Mobile",
+        "Android",
+        "Chrome",
+    ),
+    (
+        "Mozilla/5.0 (Linux; Android 11; CUBOT_KINGKONG_5_PRO) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/119.0.0.0 Mobile Safari/537.36",
+        False,
+        "Mobile",
+        "Android",
+        "Chrome",
+    ),
+    (
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+        "Version/17.0 Mobile/15E148 Safari/604.1",
+        False,
+        "Mobile",
+        "iOS",
+        "Safari",
+    ),
+]
+
+BOTS = [
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "DuckDuckBot-Https/1.1; (+https://duckduckgo.com/duckduckbot)",
+    "Mozilla/5.0 (compatible; PetalBot;+https://webmaster.petalsearch.com/site/petalbot)",
+    "Mozilla/5.0 (Linux; Android 6.0.1; Nexus 5X Build/MMB29P) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Mobile Safari/537.36 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Pinterest/0.2 (+https://www.pinterest.com/bot.html)",
+    "Mozilla/5.0 (compatible; YandexImages/3.0; +http://yandex.com/bots)",
+    "curl/8.4.0",
+    "",
+]
+
+
+@pytest.mark.parametrize(("user_agent", "is_bot", "device_type", "device_os", "browser"), CASES)
+def test_classify(user_agent, is_bot, device_type, device_os, browser):
+    info = UserAgentClassifier().classify(user_agent)
+
+    assert (info.is_bot, info.device_type, info.device_os, info.browser) == (
+        is_bot,
+        device_type,
+        device_os,
+        browser,
+    )
+
+
+@pytest.mark.parametrize("user_agent", BOTS)
+def test_bots(user_agent):
+    assert UserAgentClassifier().classify(user_agent).is_bot